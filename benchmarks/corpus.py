@@ -0,0 +1,179 @@
+'''
+Deterministic generator of synthetic CSS/HTML/source corpora for benchmarking.
+
+Usage:
+
+    python -m benchmarks.corpus [--scale SCALE] [--seed SEED] DIR
+'''
+
+import os
+import random
+import optparse
+
+
+# Corpus size presets: number of (distinct) CSS selectors, CSS files,
+# HTML pages, HTML elements per page, source files and lines per source file.
+SCALES = {
+    'tiny': dict(selectors=500, css_files=2, html_files=10, elements=200, src_files=20, src_lines=100),
+    'small': dict(selectors=5000, css_files=5, html_files=100, elements=500, src_files=200, src_lines=200),
+    'medium': dict(selectors=20000, css_files=20, html_files=1000, elements=1000, src_files=2000, src_lines=300),
+    'large': dict(selectors=50000, css_files=60, html_files=5000, elements=2000, src_files=20000, src_lines=300),
+}
+
+TAGS = ['div', 'p', 'a', 'span', 'ul', 'li', 'table', 'td', 'em', 'section', 'button', 'input']
+PSEUDOS = ['', '', '', ':hover', ':focus', '::before', ':first-child', ':not(.disabled)']
+SYLLABLES = ['nav', 'btn', 'item', 'list', 'col', 'row', 'card', 'menu', 'modal', 'form', 'img', 'text', 'alert', 'badge', 'panel', 'tab']
+MODIFIERS = ['', 'primary', 'secondary', 'sm', 'lg', 'active', 'header', 'body', 'footer', 'inline', 'group', 'toggle']
+SRC_WORDS = ['def', 'return', 'if', 'else', 'for', 'function', 'var', 'self', 'this', 'class', 'import', 'render', 'value', 'name', 'data']
+
+
+def generate_names(rnd, count, prefix=''):
+    '''Generate given number of distinct, "framework-like" class or id names.'''
+    names = []
+    seen = set()
+    i = 0
+    while len(names) < count:
+        name = '%s%s-%s' % (prefix, rnd.choice(SYLLABLES), rnd.choice(MODIFIERS) or rnd.choice(SYLLABLES))
+        if name in seen:
+            name = '%s%d' % (name, i)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+        i += 1
+    return names
+
+
+class Vocabulary(object):
+    '''
+    Class and id names used in a corpus, with a subset that is actually
+    used in HTML and source files (the rest is "dead wood").
+    '''
+
+    def __init__(self, rnd, selector_count, used_fraction=0.6):
+        self.classes = generate_names(rnd, max(10, selector_count // 2))
+        self.ids = generate_names(rnd, max(10, selector_count // 20), prefix='id-')
+        self.used_classes = rnd.sample(self.classes, int(len(self.classes) * used_fraction))
+        self.used_ids = rnd.sample(self.ids, int(len(self.ids) * used_fraction))
+
+
+def generate_compound(rnd, vocabulary):
+    r = rnd.random()
+    if r < 0.1:
+        compound = rnd.choice(TAGS)
+    elif r < 0.2:
+        compound = '#' + rnd.choice(vocabulary.ids)
+    else:
+        compound = rnd.choice(['', '', rnd.choice(TAGS)]) + '.' + rnd.choice(vocabulary.classes)
+        if rnd.random() < 0.2:
+            compound += '.' + rnd.choice(vocabulary.classes)
+    return compound
+
+
+def generate_selector(rnd, vocabulary):
+    selector = generate_compound(rnd, vocabulary)
+    for _ in range(rnd.choice([0, 0, 1, 1, 2])):
+        selector = generate_compound(rnd, vocabulary) + rnd.choice([' ', ' ', ' > ', ' + ']) + selector
+    return selector + rnd.choice(PSEUDOS)
+
+
+def generate_selectors(rnd, vocabulary, count):
+    '''Generate a list of given number of distinct selectors.'''
+    selectors = set()
+    while len(selectors) < count:
+        selectors.add(generate_selector(rnd, vocabulary))
+    return sorted(selectors)
+
+
+def write_css(f, rnd, selectors):
+    '''Write CSS rules for the given selectors to a file object.'''
+    i = 0
+    while i < len(selectors):
+        n = rnd.randint(1, 4)
+        group = ',\n'.join(selectors[i:i + n])
+        i += n
+        rule = '/* rule %d */\n%s {\n  color: #%06x;\n  margin: 0 auto;\n  font-family: "Helvetica Neue", Arial;\n}\n' % (i, group, rnd.randint(0, 0xffffff))
+        if rnd.random() < 0.05:
+            rule = '@media (min-width: %dpx) {\n%s}\n' % (rnd.randint(300, 1200), rule)
+        f.write(rule)
+
+
+def write_html(f, rnd, vocabulary, element_count):
+    '''Write a HTML page with given number of elements to a file object.'''
+    f.write('<!DOCTYPE html>\n<html>\n<head><title>Page</title></head>\n<body>\n')
+    stack = []
+    for i in range(element_count):
+        if stack and (len(stack) > 10 or rnd.random() < 0.4):
+            f.write('</%s>\n' % stack.pop())
+        tag = rnd.choice(TAGS[:-1])
+        attributes = ''
+        if rnd.random() < 0.7:
+            attributes += ' class="%s"' % ' '.join(rnd.sample(vocabulary.used_classes, rnd.randint(1, 3)))
+        if rnd.random() < 0.03:
+            attributes += ' id="%s"' % rnd.choice(vocabulary.used_ids)
+        f.write('<%s%s>Lorem ipsum %d' % (tag, attributes, i))
+        stack.append(tag)
+    f.write(''.join('</%s>' % tag for tag in reversed(stack)))
+    f.write('\n</body>\n</html>\n')
+
+
+def write_source(f, rnd, vocabulary, line_count):
+    '''Write a "source code" file with given number of lines to a file object.'''
+    for i in range(line_count):
+        words = [rnd.choice(SRC_WORDS) for _ in range(rnd.randint(2, 8))]
+        if rnd.random() < 0.05:
+            words.append('"%s"' % rnd.choice(vocabulary.used_classes + vocabulary.used_ids))
+        f.write('    ' * rnd.randint(0, 3) + ' '.join(words) + '\n')
+
+
+def generate_corpus(path, scale='small', seed=42):
+    '''
+    Generate a corpus in given folder.
+
+    @param path target folder (will be created if necessary)
+    @param scale corpus size: one of the SCALES keys
+    @param seed random seed: same seed and scale gives same corpus
+
+    @return dictionary with lists of 'css', 'html' and 'src' file paths
+    '''
+    params = SCALES[scale]
+    rnd = random.Random(seed)
+    vocabulary = Vocabulary(rnd, params['selectors'])
+    selectors = generate_selectors(rnd, vocabulary, params['selectors'])
+    rnd.shuffle(selectors)
+    files = {'css': [], 'html': [], 'src': []}
+    for folder in ['css', 'html', 'src']:
+        if not os.path.isdir(os.path.join(path, folder)):
+            os.makedirs(os.path.join(path, folder))
+
+    per_file = -(-len(selectors) // params['css_files'])
+    for i in range(params['css_files']):
+        file_name = os.path.join(path, 'css', 'style%03d.css' % i)
+        with open(file_name, 'w') as f:
+            write_css(f, rnd, selectors[i * per_file:(i + 1) * per_file])
+        files['css'].append(file_name)
+    for i in range(params['html_files']):
+        file_name = os.path.join(path, 'html', 'page%05d.html' % i)
+        with open(file_name, 'w') as f:
+            write_html(f, rnd, vocabulary, params['elements'])
+        files['html'].append(file_name)
+    for i in range(params['src_files']):
+        file_name = os.path.join(path, 'src', 'module%05d%s' % (i, rnd.choice(['.py', '.js', '.php', '.rb'])))
+        with open(file_name, 'w') as f:
+            write_source(f, rnd, vocabulary, params['src_lines'])
+        files['src'].append(file_name)
+    return files
+
+
+def main():
+    option_parser = optparse.OptionParser(usage='%prog [options] DIR')
+    option_parser.add_option("--scale", type="choice", choices=sorted(SCALES), default='small', help="Corpus size. Default: 'small'.")
+    option_parser.add_option("--seed", type="int", default=42, help="Random seed. Default: 42.")
+    options, args = option_parser.parse_args()
+    if len(args) != 1:
+        option_parser.error('Target folder required.')
+    files = generate_corpus(args[0], scale=options.scale, seed=options.seed)
+    print('Generated %d CSS files, %d HTML files and %d source files in %s' % (len(files['css']), len(files['html']), len(files['src']), args[0]))
+
+
+if __name__ == '__main__':
+    main()
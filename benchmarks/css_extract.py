@@ -0,0 +1,65 @@
+'''
+Benchmark of css_extract.extract_css_selectors (incremental tokenizer)
+against the original "whole file regex" extraction approach.
+
+Usage:
+
+    python -m benchmarks.css_extract [--size MB]
+'''
+
+import os
+import random
+import re
+import tempfile
+import optparse
+
+
+from cssdeadwood.css_extract import extract_css_selectors
+from cssdeadwood.utils import file_get_contents
+from benchmarks import corpus
+from benchmarks.measure import measure
+
+
+def extract_css_selectors_regex(css_file):
+    '''Reference implementation: regex based extraction on the whole file.'''
+    selectors = set()
+    css = file_get_contents(css_file)
+    whitespace_regex = re.compile(r'\s+', flags=re.DOTALL)
+    css = re.compile(r'/\*.*?\*/', flags=re.DOTALL).sub('', css)
+    for match in re.compile(r'\s*([^{}]*)\s*{', flags=re.DOTALL).finditer(css):
+        selector_part = match.group(1).strip()
+        if selector_part.startswith('@'):
+            continue
+        for selector_candidate in selector_part.split(','):
+            selector_candidate = whitespace_regex.sub(' ', selector_candidate.strip())
+            selectors.add(selector_candidate)
+    return selectors
+
+
+def generate_css(f, size, rnd):
+    '''Write (roughly) `size` bytes of "framework-like" CSS to given file object.'''
+    vocabulary = corpus.Vocabulary(rnd, 50000)
+    while f.tell() < size:
+        corpus.write_css(f, rnd, corpus.generate_selectors(rnd, vocabulary, 1000))
+
+
+def main():
+    option_parser = optparse.OptionParser(usage='%prog [options]')
+    option_parser.add_option("--size", metavar='MB', type="float", default=8, help="Size of the generated CSS file in MB. Default: 8.")
+    options, args = option_parser.parse_args()
+    if args:
+        option_parser.error('Unexpected arguments: %s (use --size)' % ' '.join(args))
+    size = options.size
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.css', delete=False) as f:
+        generate_css(f, int(size * 1024 * 1024), random.Random(42))
+    try:
+        print('CSS file size: %.1f MB' % (os.path.getsize(f.name) / 1024.0 / 1024))
+        for name, function in [('regex', extract_css_selectors_regex), ('tokenizer', extract_css_selectors)]:
+            selectors, duration, peak = measure(function, f.name)
+            print('%-10s %6d selectors %8.3f s %8.1f MB peak memory' % (name, len(selectors), duration, peak / 1024.0 / 1024))
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == '__main__':
+    main()
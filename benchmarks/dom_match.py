@@ -0,0 +1,84 @@
+'''
+Benchmark of the DOM matching engines in cssdeadwood.dom_match
+("xpath": one XPath evaluation per selector, "bulk": single DOM tree walk),
+for increasing page sizes and selector counts.
+
+Usage:
+
+    python -m benchmarks.dom_match
+'''
+
+import random
+import time
+
+import lxml.etree
+
+
+from cssdeadwood.dom_match import match_selectors_against_html_root_element, compile_selector, ENGINES
+
+
+TAGS = ['div', 'p', 'a', 'span', 'ul', 'li', 'table', 'td', 'em']
+
+
+def generate_html(rnd, element_count, class_count):
+    '''Generate a random HTML page with (roughly) given number of elements.'''
+    parts = []
+    stack = []
+    for i in range(element_count):
+        if stack and (len(stack) > 8 or rnd.random() < 0.4):
+            parts.append('</%s>' % stack.pop())
+        tag = rnd.choice(TAGS)
+        attributes = ''
+        if rnd.random() < 0.6:
+            attributes += ' class="c%d c%d"' % (rnd.randrange(class_count), rnd.randrange(class_count))
+        if rnd.random() < 0.05:
+            attributes += ' id="i%d"' % i
+        parts.append('<%s%s>text' % (tag, attributes))
+        stack.append(tag)
+    parts.extend('</%s>' % tag for tag in reversed(stack))
+    return '<html><body>%s</body></html>' % ''.join(parts)
+
+
+def generate_selectors(rnd, selector_count, class_count, element_count):
+    '''Generate a set of random "framework-like" selectors.'''
+    selectors = set()
+    while len(selectors) < selector_count:
+        compound = rnd.choice(['', rnd.choice(TAGS)]) + '.c%d' % rnd.randrange(2 * class_count)
+        r = rnd.random()
+        if r < 0.3:
+            selector = compound
+        elif r < 0.6:
+            selector = '.c%d %s' % (rnd.randrange(2 * class_count), compound)
+        elif r < 0.8:
+            selector = '%s > %s:hover' % (rnd.choice(TAGS), compound)
+        elif r < 0.9:
+            selector = '#i%d %s' % (rnd.randrange(2 * element_count), rnd.choice(TAGS))
+        else:
+            selector = '%s:first-child + %s' % (rnd.choice(TAGS), compound)
+        selectors.add(selector)
+    return selectors
+
+
+def main():
+    rnd = random.Random(42)
+    print('%9s %10s %8s %12s %12s' % ('elements', 'selectors', 'matched', 'xpath (s)', 'bulk (s)'))
+    for element_count, selector_count in [(1000, 1000), (10000, 1000), (1000, 10000), (10000, 10000)]:
+        class_count = max(100, selector_count // 4)
+        html = generate_html(rnd, element_count, class_count)
+        root = lxml.etree.fromstring(html, parser=lxml.etree.HTMLParser())
+        selectors = generate_selectors(rnd, selector_count, class_count, element_count)
+        # Exclude selector compilation (cached) from timing.
+        for selector in selectors:
+            compile_selector(selector)
+        durations = {}
+        results = {}
+        for engine in ENGINES:
+            start = time.time()
+            results[engine] = match_selectors_against_html_root_element(selectors, root, engine=engine)
+            durations[engine] = time.time() - start
+        assert results['xpath'] == results['bulk']
+        print('%9d %10d %8d %12.3f %12.3f' % (element_count, selector_count, len(results['xpath']), durations['xpath'], durations['bulk']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+'''
+Measurement helpers for benchmarks.
+'''
+
+import time
+import tracemalloc
+
+
+def measure(function, *args, **kwargs):
+    '''
+    Measure wall time and peak (Python) memory allocation of a function call.
+
+    Timing and memory tracing are done in separate runs,
+    because tracing has a lot of overhead.
+    Note that memory allocated outside of Python (e.g. by libxml2 in lxml)
+    is not included.
+
+    @param memory (keyword argument) whether to measure memory (default True)
+
+    @return (result, wall time in seconds, peak memory in bytes or None)
+    '''
+    memory = kwargs.pop('memory', True)
+    start = time.time()
+    result = function(*args, **kwargs)
+    duration = time.time() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, duration, peak
@@ -0,0 +1,48 @@
+'''
+Benchmark of utils.get_occuring_words against the original
+"one regex search per word" approach, for increasing word counts.
+
+Usage:
+
+    python -m benchmarks.occuring_words
+'''
+
+import random
+import re
+import string
+import timeit
+
+
+from cssdeadwood.utils import get_occuring_words
+
+
+def get_occuring_words_per_word_regex(words, content):
+    '''Reference implementation: one regex search per word.'''
+    found = set()
+    for word in words:
+        if re.search(r'\b%s\b' % word, content):
+            found.add(word)
+    return found
+
+
+def random_word(rnd, length=8):
+    return ''.join(rnd.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def main():
+    rnd = random.Random(42)
+    vocabulary = [random_word(rnd) for _ in range(5000)]
+    content = ' '.join(rnd.choice(vocabulary) + rnd.choice(' .-="\n') for _ in range(10000))
+    print('Content size: %d characters' % len(content))
+    print('%8s %14s %14s %8s' % ('words', 'per-word (s)', 'one pass (s)', 'speedup'))
+    for word_count in [10, 100, 1000, 5000]:
+        words = set(rnd.choice(vocabulary) if i % 2 else random_word(rnd) for i in range(word_count))
+        assert get_occuring_words(words, content) == get_occuring_words_per_word_regex(words, content)
+        repeat = max(1, 1000 // word_count)
+        t_regex = timeit.timeit(lambda: get_occuring_words_per_word_regex(words, content), number=repeat) / repeat
+        t_pass = timeit.timeit(lambda: get_occuring_words(words, content), number=repeat) / repeat
+        print('%8d %14.5f %14.5f %7.1fx' % (len(words), t_regex, t_pass, t_regex / t_pass))
+
+
+if __name__ == '__main__':
+    main()
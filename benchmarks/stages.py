@@ -0,0 +1,107 @@
+'''
+Benchmark of the analysis stages (CSS selector extraction, DOM matching,
+source file grepping) on a generated synthetic corpus,
+reporting wall time, throughput and peak memory per stage.
+
+Usage:
+
+    python -m benchmarks.stages [--scale SCALE] [--corpus DIR]
+'''
+
+import os
+import shutil
+import tempfile
+import optparse
+
+
+from cssdeadwood.css_extract import extract_css_selectors, extract_ids_and_classes_from_selectors
+from cssdeadwood.dom_match import match_selectors_against_html_resource, compile_selector, ENGINES, ENGINE_BULK
+from cssdeadwood.utils import file_get_contents, open_source_file, get_occuring_words
+from benchmarks import corpus
+from benchmarks.measure import measure
+
+
+def stage_css_extract(css_files):
+    selectors = set()
+    for css_file in css_files:
+        selectors.update(extract_css_selectors(css_file))
+    return selectors
+
+
+def stage_dom_match(selectors, html_files, engine, streaming=False):
+    '''DOM matching of (shrinking) set of unmatched selectors against all HTML files.'''
+    unused_selectors = set(selectors)
+    for html_file in html_files:
+        unused_selectors.difference_update(match_selectors_against_html_resource(unused_selectors, html_file, engine=engine, streaming=streaming))
+    return unused_selectors
+
+
+def stage_grep(words, src_files, mode='bytes'):
+    '''
+    Search all source files for all words, in decoded ('str'),
+    undecoded ('bytes') or memory-mapped ('mmap') file contents.
+    '''
+    found = set()
+    for src_file in src_files:
+        if mode == 'str':
+            found.update(get_occuring_words(words, file_get_contents(src_file)))
+        else:
+            with open_source_file(src_file, mmap_threshold=0 if mode == 'mmap' else None) as content:
+                found.update(get_occuring_words(words, content))
+    return found
+
+
+def total_size(files):
+    return sum(os.path.getsize(f) for f in files)
+
+
+def report(stage, item_count, item_label, size, duration, peak):
+    print('%-18s %8d %-10s %9.3f s %10.1f %s/s %13s %10s' % (
+        stage, item_count, item_label, duration, item_count / duration, item_label,
+        '%.2f MB/s' % (size / 1024.0 / 1024 / duration) if size else '-',
+        '%.1f MB' % (peak / 1024.0 / 1024) if peak is not None else '-',
+    ))
+
+
+def main():
+    option_parser = optparse.OptionParser(usage='%prog [options]')
+    option_parser.add_option("--scale", type="choice", choices=sorted(corpus.SCALES), default='small', help="Corpus size. Default: 'small'.")
+    option_parser.add_option("--seed", type="int", default=42, help="Random seed. Default: 42.")
+    option_parser.add_option("--corpus", metavar='DIR', default=None, help="Folder to generate the corpus in (and keep). Default: temporary folder.")
+    option_parser.add_option("--no-memory", action="store_false", dest="memory", default=True, help="Skip peak memory measurement.")
+    options, args = option_parser.parse_args()
+
+    path = options.corpus or tempfile.mkdtemp(prefix='cssdeadwood-benchmark-')
+    try:
+        files = corpus.generate_corpus(path, scale=options.scale, seed=options.seed)
+        print('Corpus (scale %r, seed %d) in %s: %d CSS files, %d HTML files, %d source files' % (
+            options.scale, options.seed, path, len(files['css']), len(files['html']), len(files['src'])
+        ))
+
+        selectors, duration, peak = measure(stage_css_extract, files['css'], memory=options.memory)
+        report('css_extract', len(selectors), 'selectors', total_size(files['css']), duration, peak)
+
+        # Selector compilation is cached across HTML files, so measure it separately.
+        compile_selector.cache_clear()
+        _, duration, peak = measure(lambda: [compile_selector(s) for s in selectors], memory=False)
+        report('compile_selector', len(selectors), 'selectors', 0, duration, peak)
+
+        html_size = total_size(files['html'])
+        for engine in ENGINES:
+            _, duration, peak = measure(stage_dom_match, selectors, files['html'], engine, memory=options.memory)
+            report('dom_match[%s]' % engine, len(files['html']), 'pages', html_size, duration, peak)
+        _, duration, peak = measure(stage_dom_match, selectors, files['html'], ENGINE_BULK, True, memory=options.memory)
+        report('dom_match[stream]', len(files['html']), 'pages', html_size, duration, peak)
+
+        ids, classes, _ = extract_ids_and_classes_from_selectors(selectors)
+        words = ids | classes
+        for mode in ['str', 'bytes', 'mmap']:
+            _, duration, peak = measure(stage_grep, words, files['src'], mode, memory=options.memory)
+            report('grep[%s]' % mode, len(files['src']), 'files', total_size(files['src']), duration, peak)
+    finally:
+        if not options.corpus:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
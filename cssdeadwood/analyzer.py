@@ -0,0 +1,478 @@
+
+import io
+import os
+import time
+import logging
+import collections
+
+import lxml.etree
+
+from cssdeadwood.utils import collect_files, open_source_file, get_occuring_words, DEFAULT_EXCLUDES, IGNORE_FILE_NAME, MMAP_THRESHOLD
+from cssdeadwood.css_extract import extract_css_selector_lines, selector_ids_and_classes
+from cssdeadwood.dom_match import DocumentIndex, match_selectors_against_html_root_element, ENGINE_XPATH
+from cssdeadwood.cache import AnalysisCache, content_hash
+from cssdeadwood.profiling import Instrumentation
+from cssdeadwood.tokenizers import TokenIndex, tokenize, tokenizer_for
+
+
+_log = logging.getLogger('cssdeadwood.analyzer')
+
+
+DEFAULT_SRC_EXTENSIONS = ['.php', '.py', '.rb', '.js']
+
+# File kinds.
+KIND_CSS = 'css'
+KIND_HTML = 'html'
+KIND_SRC = 'src'
+
+# Errors of files that can not be read or parsed (e.g. while being written or removed).
+_FILE_ERRORS = (OSError, lxml.etree.LxmlError)
+
+
+class _Witnesses(object):
+    '''
+    Bookkeeping of which file "witnesses" each found candidate (selector or id/class word),
+    i.e. proves that it is used.
+
+    Only one witness file per candidate is tracked, so that, like in the batch analysis,
+    files only have to be matched against the candidates that have no witness yet.
+    When a witness file changes or disappears, its candidates are orphaned
+    and have to be matched again against the other files.
+    '''
+
+    def __init__(self):
+        # Mapping of candidate to witness file.
+        self.witness = {}
+        # Mapping of file to set of candidates it is the witness of.
+        self.witnessed = {}
+
+    def __contains__(self, candidate):
+        return candidate in self.witness
+
+    def add(self, path, candidates):
+        if candidates:
+            for candidate in candidates:
+                self.witness[candidate] = path
+            self.witnessed.setdefault(path, set()).update(candidates)
+
+    def remove_file(self, path):
+        '''
+        Drop a witness file.
+
+        @return set of orphaned candidates
+        '''
+        orphans = self.witnessed.pop(path, set())
+        for candidate in orphans:
+            del self.witness[candidate]
+        return orphans
+
+    def remove_candidate(self, candidate):
+        path = self.witness.pop(candidate, None)
+        if path is not None:
+            self.witnessed[path].discard(candidate)
+            if not self.witnessed[path]:
+                del self.witnessed[path]
+
+
+class Analyzer(object):
+    '''
+    Long-lived, incremental analyzer of CSS, HTML and other source files,
+    for embedding CSS Deadwood (e.g. in a build server or a watch loop)
+    without rerunning the whole analysis for each change.
+
+    Files are added, updated and removed with file events, after which
+    only the affected selectors, HTML files and source files are (re)matched.
+    Parsed HTML documents (and their document indexes) are kept in memory
+    (unless disabled), so that new selectors can be matched against them
+    without parsing the HTML files again.
+
+    Source files with a tokenizer (see cssdeadwood.tokenizers) are tokenized
+    once when loaded, into an inverted index, so that ids and classes can be
+    looked up without searching these files again.
+
+    A selector is unused if it does not match with the DOM of any HTML file
+    and none of its ids and classes occur in any source file.
+
+    Files that can not be read or parsed are left out of the analysis (as if removed)
+    and reported by failed_files(), e.g. to retry them later.
+    '''
+
+    def __init__(self, engine=ENGINE_XPATH, src_extensions=DEFAULT_SRC_EXTENSIONS, keep_documents=True, cache_dir=None, mmap_threshold=MMAP_THRESHOLD, tokenizers=None, instrumentation=None):
+        '''
+        @param engine DOM matching engine: ENGINE_XPATH or ENGINE_BULK
+        @param src_extensions list of file extensions (lowercase) of source files to scan for ids and classes
+        @param keep_documents whether to keep parsed HTML documents in memory
+        @param cache_dir optional folder of a persistent analysis cache (see AnalysisCache)
+        @param mmap_threshold size (in bytes) from which source files are memory-mapped instead of read
+        @param tokenizers optional mapping of source file extension to tokenizer name
+            (see cssdeadwood.tokenizers.parse_tokenizers())
+        @param instrumentation optional Instrumentation to send timing events to
+        '''
+        self.engine = engine
+        self.src_extensions = set(src_extensions)
+        self.keep_documents = keep_documents
+        self.cache_dir = cache_dir
+        self.mmap_threshold = mmap_threshold
+        self.tokenizers = tokenizers or {}
+        self.instrumentation = instrumentation or Instrumentation()
+        # Mapping of CSS file to its selector lines.
+        self._selector_lines = {}
+        # Number of CSS files defining each selector.
+        self._selector_refs = collections.Counter()
+        # Mapping of selector to its ids and classes (as words to search in source files).
+        self._selector_words = {}
+        # Mapping of id/class word to the set of selectors using it.
+        self._word_selectors = {}
+        self._html_files = set()
+        self._src_files = set()
+        # Mapping of HTML file to (content hash, root element, DocumentIndex).
+        self._documents = {}
+        self._dom = _Witnesses()
+        self._words = _Witnesses()
+        # Inverted index of the tokens of the tokenized source files.
+        self._tokens = TokenIndex()
+        self._used = set()
+        self._unused = set()
+        # Files that could not be read or parsed, since the previous failed_files() call.
+        self._failed = set()
+
+    def kind(self, path):
+        '''
+        @return kind of file (KIND_CSS, KIND_HTML or KIND_SRC), or None for other files
+        '''
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.css':
+            return KIND_CSS
+        elif extension == '.html':
+            return KIND_HTML
+        elif extension in self.src_extensions:
+            return KIND_SRC
+        return None
+
+    @property
+    def files(self):
+        '''Set of all files being analysed.'''
+        return set(self._selector_lines) | self._html_files | self._src_files
+
+    def add_files(self, paths):
+        '''
+        Add (or update) multiple files, e.g. for the initial analysis.
+
+        @return (set of selectors that became used, set of selectors that became unused)
+        '''
+        touched = set()
+        # CSS files first, so that HTML and source files are only matched once.
+        order = {KIND_CSS: 0, KIND_HTML: 1, KIND_SRC: 2}
+        paths = sorted((p for p in paths if self.kind(p)), key=lambda p: (order[self.kind(p)], p))
+        for path in paths:
+            self._load(path, touched)
+        return self._refresh(touched)
+
+    def add_file(self, path):
+        '''
+        Add (or update) a file.
+
+        @return (set of selectors that became used, set of selectors that became unused)
+        '''
+        return self.add_files([path])
+
+    update_file = add_file
+
+    def remove_file(self, path):
+        '''
+        Remove a file from the analysis.
+
+        @return (set of selectors that became used, set of selectors that became unused)
+        '''
+        touched = set()
+        self._unload(path, touched)
+        return self._refresh(touched)
+
+    def failed_files(self):
+        '''
+        @return set of files that could not be read or parsed (and were left out of the analysis)
+            since the previous call
+        '''
+        failed, self._failed = self._failed, set()
+        return failed
+
+    def unused_selectors(self):
+        '''@return set of unused selectors'''
+        return set(self._unused)
+
+    def results(self):
+        '''
+        @return mapping of CSS file to results struct with
+            'selectors', 'selector_lines' and 'unused_selectors'
+        '''
+        results = collections.OrderedDict()
+        for css_file in sorted(self._selector_lines):
+            selector_lines = self._selector_lines[css_file]
+            results[css_file] = {
+                'selectors': set(selector_lines),
+                'selector_lines': selector_lines,
+                'unused_selectors': sorted(self._unused.intersection(selector_lines)),
+            }
+        return results
+
+    def _load(self, path, touched):
+        kind = self.kind(path)
+        # Files that fail to load are unloaded, like removed ones
+        # (e.g. re-matching the selectors they were the witness of against the other files).
+        self._failed.discard(path)
+        try:
+            if kind == KIND_CSS:
+                self._load_css(path, touched)
+            elif kind == KIND_HTML:
+                self._load_html(path, touched)
+            elif kind == KIND_SRC:
+                self._load_src(path, touched)
+        except _FILE_ERRORS as e:
+            self._fail(path, e)
+        if path in self._failed:
+            self._unload(path, touched)
+
+    def _fail(self, path, error):
+        _log.warning('Failed to analyse %r: %s' % (path, error))
+        self._failed.add(path)
+
+    def _unload(self, path, touched):
+        kind = self.kind(path)
+        if kind == KIND_CSS:
+            for selector in self._selector_lines.pop(path, {}):
+                self._release_selector(selector, touched)
+        elif kind == KIND_HTML:
+            self._html_files.discard(path)
+            self._documents.pop(path, None)
+            orphans = self._dom.remove_file(path)
+            touched.update(orphans)
+            self._match_dom(orphans, self._html_files)
+        elif kind == KIND_SRC:
+            self._src_files.discard(path)
+            self._tokens.remove(path)
+            orphans = self._words.remove_file(path)
+            touched.update(self._selectors_using(orphans))
+            self._match_words(orphans, self._src_files)
+
+    def _load_css(self, css_file, touched):
+        start = time.perf_counter()
+        if self.cache_dir:
+            selector_lines = AnalysisCache.get(self.cache_dir).css_selector_lines(css_file, extract_css_selector_lines)
+        else:
+            selector_lines = extract_css_selector_lines(css_file)
+        old_selector_lines = self._selector_lines.get(css_file, {})
+        self._selector_lines[css_file] = selector_lines
+        self.instrumentation.file('css_extract', css_file, time.perf_counter() - start, {'selectors': len(selector_lines)})
+        for selector in old_selector_lines:
+            if selector not in selector_lines:
+                self._release_selector(selector, touched)
+        new_selectors = set()
+        new_words = set()
+        for selector in selector_lines:
+            if selector in old_selector_lines:
+                continue
+            self._selector_refs[selector] += 1
+            if self._selector_refs[selector] == 1:
+                new_selectors.add(selector)
+                ids, classes = selector_ids_and_classes(selector)
+                words = self._selector_words[selector] = frozenset(ids + classes)
+                for word in words:
+                    if word not in self._word_selectors:
+                        self._word_selectors[word] = set()
+                        new_words.add(word)
+                    self._word_selectors[word].add(selector)
+        _log.info('Loaded %d CSS selectors (%d new) from %r' % (len(selector_lines), len(new_selectors), css_file))
+        touched.update(new_selectors)
+        self._match_dom(new_selectors, self._html_files)
+        self._match_words(new_words, self._src_files)
+
+    def _release_selector(self, selector, touched):
+        self._selector_refs[selector] -= 1
+        if self._selector_refs[selector] > 0:
+            return
+        del self._selector_refs[selector]
+        touched.add(selector)
+        self._dom.remove_candidate(selector)
+        for word in self._selector_words.pop(selector):
+            self._word_selectors[word].discard(selector)
+            if not self._word_selectors[word]:
+                del self._word_selectors[word]
+                self._words.remove_candidate(word)
+
+    def _load_html(self, html_file, touched):
+        self._html_files.add(html_file)
+        self._documents.pop(html_file, None)
+        orphans = self._dom.remove_file(html_file)
+        touched.update(orphans)
+        # Match the (new version of the) file against all selectors without witness,
+        # and the orphaned selectors that it does not match against the other files.
+        candidates = set(s for s in self._selector_refs if s not in self._dom)
+        found = self._match_dom(candidates, [html_file])
+        touched.update(found)
+        self._match_dom(orphans.difference(found), self._html_files.difference([html_file]))
+
+    def _load_src(self, src_file, touched):
+        self._src_files.add(src_file)
+        tokenizer = tokenizer_for(src_file, self.tokenizers)
+        if tokenizer:
+            start = time.perf_counter()
+            with open_source_file(src_file, mmap_threshold=self.mmap_threshold) as content:
+                tokens = tokenize(content, tokenizer)
+            self._tokens.add(src_file, tokens)
+            self.instrumentation.file('idclass_tokenizing', src_file, time.perf_counter() - start, {'tokens': len(tokens)})
+        orphans = self._words.remove_file(src_file)
+        candidates = set(w for w in self._word_selectors if w not in self._words)
+        found = self._match_words(candidates, [src_file])
+        self._match_words(orphans.difference(found), self._src_files.difference([src_file]))
+        touched.update(self._selectors_using(orphans | found))
+
+    def _selectors_using(self, words):
+        '''@return set of selectors using any of given words'''
+        return set().union(*(self._word_selectors.get(w, ()) for w in words))
+
+    def _document(self, html_file):
+        '''@return (content hash, root element, DocumentIndex) of given HTML file'''
+        document = self._documents.get(html_file)
+        if document is None:
+            with open(html_file, 'rb') as f:
+                data = f.read()
+            html_element = lxml.etree.parse(io.BytesIO(data), parser=lxml.etree.HTMLParser()).getroot()
+            if html_element is None:
+                # Empty document.
+                html_element = lxml.etree.Element('html')
+            document = (content_hash(data), html_element, DocumentIndex(html_element))
+            if self.keep_documents:
+                self._documents[html_file] = document
+        return document
+
+    def _match_dom(self, selectors, html_files):
+        '''
+        Match selectors against HTML files (dropping matched selectors as we go)
+        and register the found witnesses.
+
+        @return set of found selectors
+        '''
+        remaining = set(selectors)
+        for html_file in sorted(html_files):
+            if not remaining:
+                break
+            start = time.perf_counter()
+            stats = {}
+            try:
+                key, html_element, index = self._document(html_file)
+            except _FILE_ERRORS as e:
+                self._fail(html_file, e)
+                continue
+            match = lambda s: match_selectors_against_html_root_element(s, html_element, engine=self.engine, stats=stats, index=index)
+            if self.cache_dir:
+                found = AnalysisCache.get(self.cache_dir).match('dom', key, remaining, match)
+            else:
+                found = match(remaining)
+            self._dom.add(html_file, found)
+            remaining.difference_update(found)
+            self.instrumentation.file('dom_matching', html_file, time.perf_counter() - start, stats)
+            _log.debug('DOM matching CSS selectors: %d matches, %d unmatched with DOM from %r' % (len(found), len(remaining), html_file))
+        return set(selectors).difference(remaining)
+
+    def _match_words(self, words, src_files):
+        '''
+        Search ids/classes in source files (dropping found words as we go)
+        and register the found witnesses.
+
+        @return set of found words
+        '''
+        remaining = set(words)
+        tokenized = set(f for f in src_files if f in self._tokens)
+        if tokenized and remaining:
+            for src_file, found in self._tokens.find(remaining, tokenized).items():
+                self._words.add(src_file, found)
+                remaining.difference_update(found)
+        for src_file in sorted(set(src_files).difference(tokenized)):
+            if not remaining:
+                break
+            start = time.perf_counter()
+            try:
+                with open_source_file(src_file, mmap_threshold=self.mmap_threshold) as content:
+                    match = lambda w: get_occuring_words(w, content)
+                    if self.cache_dir:
+                        found = AnalysisCache.get(self.cache_dir).match('words', content_hash(content), remaining, match)
+                    else:
+                        found = match(remaining)
+            except _FILE_ERRORS as e:
+                self._fail(src_file, e)
+                continue
+            self._words.add(src_file, found)
+            remaining.difference_update(found)
+            self.instrumentation.file('idclass_grepping', src_file, time.perf_counter() - start, {'words': len(words), 'found': len(found)})
+        return set(words).difference(remaining)
+
+    def _refresh(self, touched):
+        '''
+        Update the used/unused state of the touched selectors.
+
+        @return (set of selectors that became used, set of selectors that became unused)
+        '''
+        became_used = set()
+        became_unused = set()
+        for selector in touched:
+            was_used = selector in self._used
+            was_unused = selector in self._unused
+            self._used.discard(selector)
+            self._unused.discard(selector)
+            if selector not in self._selector_refs:
+                continue
+            if selector in self._dom or any(w in self._words for w in self._selector_words[selector]):
+                self._used.add(selector)
+                if not was_used:
+                    became_used.add(selector)
+            else:
+                self._unused.add(selector)
+                if not was_unused:
+                    became_unused.add(selector)
+        return became_used, became_unused
+
+
+class FileWatcher(object):
+    '''
+    Polling based watcher of the files in given seeds (files or folders to scan recursively),
+    detecting added, modified and removed files from their modification time and size.
+    '''
+
+    def __init__(self, seeds, extensions=None, excludes=DEFAULT_EXCLUDES, ignore_file_name=IGNORE_FILE_NAME):
+        '''
+        @param seeds list of root folders or files
+        @param extensions optional list of file extensions (lowercase) to filter files
+        @param excludes, ignore_file_name: see discover_files()
+        '''
+        self.seeds = seeds
+        self.extensions = extensions
+        self.excludes = excludes
+        self.ignore_file_name = ignore_file_name
+        self._snapshot = {}
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for path in collect_files(self.seeds, extensions=self.extensions, excludes=self.excludes, ignore_file_name=self.ignore_file_name):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        '''
+        @return (set of added files, set of modified files, set of removed files)
+            since the previous poll (all files are "added" in the first poll)
+        '''
+        snapshot = self._take_snapshot()
+        added = set(snapshot).difference(self._snapshot)
+        removed = set(self._snapshot).difference(snapshot)
+        modified = set(p for p in snapshot if p in self._snapshot and snapshot[p] != self._snapshot[p])
+        self._snapshot = snapshot
+        return added, modified, removed
+
+    def forget(self, paths):
+        '''Forget given files, so that they are reported as added again in the next poll.'''
+        for path in paths:
+            self._snapshot.pop(path, None)
@@ -2,20 +2,36 @@
 
 import os
 import sys
+import atexit
+import shutil
+import tempfile
 import logging
 import optparse
 import json
+import time
+import array
+import collections
+import contextlib
+import concurrent.futures
 
+import lxml.etree
 
-from cssdeadwood.utils import collect_files, file_get_contents, get_occuring_words
-from cssdeadwood.css_extract import extract_css_selectors, extract_ids_and_classes_from_selectors
-from cssdeadwood.dom_match import match_selectors_against_html_resource
+
+from cssdeadwood.utils import discover_files, read_source_file, open_source_file, get_occuring_words, count_occuring_words, DEFAULT_EXCLUDES, IGNORE_FILE_NAME, MMAP_THRESHOLD
+from cssdeadwood.css_extract import extract_css_selector_lines
+from cssdeadwood.dom_match import match_selectors_against_html_resource, match_selectors_against_html_root_element, count_selector_matches_against_html_resource, parse_html_bytes, SelectorGroups, ENGINES, ENGINE_XPATH
+from cssdeadwood.parallel import shrinking_map, share, shared, unshare, Pipeline, PIPELINE_QUEUE_SIZE, PIPELINE_PARSED_QUEUE_SIZE, PIPELINE_READ_AHEAD_MAX_SIZE
+from cssdeadwood import bitset
+from cssdeadwood.cache import AnalysisCache, content_hash, file_hash
+from cssdeadwood.profiling import Profiler, Instrumentation
+from cssdeadwood.crawl import crawl
+from cssdeadwood.discover import StylesheetRegistry
+from cssdeadwood.histogram import Histogram
+from cssdeadwood.selector_table import SelectorTable
+from cssdeadwood.analyzer import Analyzer, FileWatcher
+from cssdeadwood.tokenizers import TokenIndex, tokenize, tokenizer_for, parse_tokenizers
 
 
-# TODO: instead of used vs not used, provide histogram analysis to have better view on hot vs not hot
-# TODO: source id/class based elimination: only do search on strings, not logic
-# TODO: operation mode to only provide HTML file(s) (and analyse referenced CSS files)
-# TODO: operation mode to only provide url(s) (and analyse referenced CSS files)
 # TODO: HTML format reporting?
 # TODO: TAP format reporting?
 # TODO: Junit format reporting?
@@ -27,74 +43,421 @@ _log = logging.getLogger('cssdeadwood')
 
 
 
+def _match_selectors_against_html_file(html_file, selector_mask, groups, cache_dir=None, engine=ENGINE_XPATH, selector_timing=False, streaming=False):
+    '''
+    (Process pool worker for) DOM matching of a HTML file,
+    using an analysis cache if a cache folder is given.
+
+    @param selector_mask bitset (see cssdeadwood.bitset) of the selectors to match
+    @param groups SelectorGroups of all selectors (or a reference to it, see cssdeadwood.parallel.share())
+
+    @return (number of selectors tried, bitset of found selectors, stats dictionary)
+    '''
+    start = time.perf_counter()
+    groups = shared(groups)
+    stats = {'selector_times': {}} if selector_timing else {}
+    representatives = groups.representatives(selector_mask, stats)
+    match = lambda s: match_selectors_against_html_resource(s, html_file, engine=engine, stats=stats, streaming=streaming, grouped=True)
+    if cache_dir:
+        found = AnalysisCache.get(cache_dir).match('dom', file_hash(html_file), set(representatives), match)
+    else:
+        found = match(representatives)
+    stats['duration'] = time.perf_counter() - start
+    return bitset.count(selector_mask), groups.found_mask(found), stats
+
+
+def _found_mask(ids, found):
+    '''
+    @param ids mapping of item (e.g. id/class name) to its id
+    @param found iterable of the found items
+
+    @return bitset of the found items
+    '''
+    return bitset.from_indices(ids[item] for item in found)
+
+
+def _with_source_content(src_file_and_content, func, mmap_threshold=MMAP_THRESHOLD):
+    '''
+    Call func with the (undecoded) contents of a source file: the given contents
+    or, if these are None (e.g. for large files), the file opened with open_source_file().
+    '''
+    src_file, content = src_file_and_content
+    if content is not None:
+        return func(content)
+    with open_source_file(src_file, mmap_threshold=mmap_threshold) as content:
+        return func(content)
+
+
+def _find_words_in_content(words, content, tokenizer=None):
+    '''
+    @param tokenizer optional name of the tokenizer to extract id/class tokens with
+        (see cssdeadwood.tokenizers), instead of searching for plain words
+
+    @return set of the given ids and classes that occur in content
+    '''
+    if tokenizer is None:
+        return get_occuring_words(words, content)
+    index = TokenIndex()
+    index.add(None, tokenize(content, tokenizer))
+    return index.find(words).get(None, set())
+
+
+def _grep_ids_and_classes(src_file_and_content, word_mask, word_index, cache_dir=None, mmap_threshold=MMAP_THRESHOLD, tokenizers=None):
+    '''
+    (Process pool worker for) id/class grepping in a source file,
+    using an analysis cache if a cache folder is given.
+
+    @param src_file_and_content tuple of source file path and its contents as bytes
+        (or None to let the worker read or memory-map the file itself)
+    @param word_mask bitset of the ids and classes to search for
+    @param word_index tuple of the list of all ids and classes (indexed by word id)
+        and the mapping of these to their word id (or a reference to it, see cssdeadwood.parallel.share())
+    @param tokenizers optional mapping of file extension to tokenizer name (see cssdeadwood.tokenizers)
+
+    @return (bitset of found ids and classes, stats dictionary)
+    '''
+    start = time.perf_counter()
+    word_list, word_ids = shared(word_index)
+    words = set(bitset.select(word_list, word_mask))
+    tokenizer = tokenizer_for(src_file_and_content[0], tokenizers)
+
+    def grep(content):
+        match = lambda words: _find_words_in_content(words, content, tokenizer)
+        if cache_dir:
+            kind = 'words' if tokenizer is None else 'tokens:%s' % tokenizer
+            return AnalysisCache.get(cache_dir).match(kind, content_hash(content), words, match)
+        return match(words)
+
+    found = _with_source_content(src_file_and_content, grep, mmap_threshold)
+    stats = {'duration': time.perf_counter() - start, 'words': len(words), 'found': len(found)}
+    return _found_mask(word_ids, found), stats
+
+
+def _count_selectors_in_html_file(html_file, selectors, engine=ENGINE_XPATH):
+    '''
+    (Process pool worker for) DOM match counting of a HTML file (histogram mode).
+
+    @param selectors list of selectors (histogram keys),
+        or a reference to it (see cssdeadwood.parallel.share())
+
+    @return (array of the number of matching elements per selector, stats dictionary)
+    '''
+    start = time.perf_counter()
+    selectors = shared(selectors)
+    stats = {}
+    counts = count_selector_matches_against_html_resource(selectors, html_file, engine=engine, stats=stats)
+    stats['duration'] = time.perf_counter() - start
+    stats['found'] = len(counts)
+    return array.array('Q', [counts.get(s, 0) for s in selectors]), stats
+
+
+def _count_words_in_file(src_file_and_content, words, mmap_threshold=MMAP_THRESHOLD, tokenizers=None):
+    '''
+    (Process pool worker for) id/class occurrence counting in a source file (histogram mode).
+
+    @param src_file_and_content, tokenizers: see _grep_ids_and_classes()
+    @param words list of ids and classes (histogram keys),
+        or a reference to it (see cssdeadwood.parallel.share())
+
+    @return (array of the number of occurrences per word, stats dictionary)
+    '''
+    start = time.perf_counter()
+    words = shared(words)
+    tokenizer = tokenizer_for(src_file_and_content[0], tokenizers)
+
+    def count(content):
+        if tokenizer is None:
+            return count_occuring_words(words, content)
+        index = TokenIndex()
+        index.add(None, tokenize(content, tokenizer))
+        counts = {}
+        for word in words:
+            count = index.counts(word).get(None)
+            if count:
+                counts[word] = count
+        return counts
+
+    counts = _with_source_content(src_file_and_content, count, mmap_threshold)
+    stats = {'duration': time.perf_counter() - start, 'words': len(words), 'found': len(counts)}
+    return array.array('Q', [counts.get(w, 0) for w in words]), stats
+
+
 class CssDeadwoodApp(object):
     '''
     CSS Deadwood main() function,
     written OOP-style and chopped up in small methods, for better testability.
     '''
 
+    def __init__(self, collectors=None):
+        '''
+        @param collectors optional list of additional instrumentation collectors
+            (cssdeadwood.profiling.Collector instances) to receive timing and counter events.
+        '''
+        self.profiler = Profiler()
+        self.instrumentation = Instrumentation([self.profiler] + list(collectors or []))
+        # Whether to measure evaluation time per selector (has some overhead).
+        self.selector_timing = False
+        # Whether to parse HTML files incrementally (see match_selectors_against_html_resource()).
+        self.streaming = False
+        # Source files of at least this size (in bytes) are memory-mapped instead of read.
+        self.mmap_threshold = MMAP_THRESHOLD
+        # Maximum number of files read ahead (and parsed) in background threads
+        # when not using worker processes (0: no pipelining).
+        self.queue_size = PIPELINE_QUEUE_SIZE
+        # Mapping of source file extension to tokenizer name (see cssdeadwood.tokenizers),
+        # for source files to tokenize instead of searching for plain words.
+        self.tokenizers = {}
+
+    def _record_dom_matching_stats(self, html_file, stats):
+        selector_times = stats.pop('selector_times', None)
+        if selector_times:
+            self.instrumentation.selectors('dom_matching', selector_times)
+        self.instrumentation.count('dom_evaluations', stats.get('evaluations', 0))
+        self.instrumentation.count('dom_rejections', stats.get('rejections', 0))
+        self.instrumentation.count('dom_inferences', stats.get('inferences', 0))
+        self.instrumentation.count('dom_equivalent_selectors', stats.get('equivalent_selectors', 0))
+        self.instrumentation.count('dom_prefilter_skips', stats.get('prefilter_skips', 0))
+        self.instrumentation.file('dom_matching', html_file, stats.pop('duration'), stats)
 
-    def _eliminate_selectors_from_dom_matching(self, selectors, html_files):
+    def _eliminate_selectors_from_dom_matching(self, selectors, html_files, jobs=1, cache_dir=None, engine=ENGINE_XPATH, table=None):
+        '''
+        Eliminate selectors that match with the DOM trees of the given HTML files.
+
+        @param table optional SelectorTable containing the selectors
+        '''
         # The results struct for tracking intermediate data
         results = {}
 
-        # Start with flagging all selectors as "unused"
-        unused_selectors = selectors.copy()
-        for html_file in html_files:
-            original_total = len(unused_selectors)
-            _log.debug('DOM matching %d CSS selectors with DOM from %r' % (original_total, html_file))
-            found_selectors = match_selectors_against_html_resource(unused_selectors, html_file)
-            unused_selectors.difference_update(found_selectors)
-            _log.info('DOM matching %d CSS selectors: %d matches, %d unmatched with DOM from %r' % (original_total, len(found_selectors), len(unused_selectors), html_file))
+        # Start with flagging all selectors as "unused".
+        # The bookkeeping is done with bitsets over the selector ids of the table.
+        # Equivalent selectors are grouped once (see SelectorGroups): per file, only the
+        # representatives of the unmatched classes are matched and the found classes
+        # are turned into a bitset directly.
+        table = self._selector_table(selectors, table)
+        unused_mask = table.mask(selectors)
+        groups = SelectorGroups(table.selector_list(), unused_mask)
+        if jobs > 1:
+            # Fan out the HTML files to a process pool, each file being matched against
+            # the selectors that were still unmatched at the time of submission.
+            # Only the bitset of these selectors is passed per file, the selector groups are shared.
+            shared_groups = share(groups)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                    matches = shrinking_map(
+                        executor, _match_selectors_against_html_file, html_files,
+                        get_args=lambda: (unused_mask, shared_groups, cache_dir, engine, self.selector_timing, self.streaming) if unused_mask else None,
+                        max_pending=2 * jobs,
+                    )
+                    for html_file, (original_total, found_mask, stats) in matches:
+                        self._record_dom_matching_stats(html_file, stats)
+                        unused_mask &= ~found_mask
+                        _log.info('DOM matching %d CSS selectors: %d matches, %d unmatched with DOM from %r' % (original_total, bitset.count(found_mask), bitset.count(unused_mask), html_file))
+            finally:
+                unshare(shared_groups)
+        elif self.queue_size and not cache_dir and not self.streaming:
+            # Read and parse the next HTML files in background threads while matching
+            # the current one. The parser pre-filters (see parse_html_bytes())
+            # with the selectors that are unmatched at that time.
+            # To bound memory usage, large files are not read ahead (but read by the parse stage)
+            # and at most PIPELINE_PARSED_QUEUE_SIZE trees are parsed ahead of the matching stage.
+            def read(html_file):
+                start = time.perf_counter()
+                html_bytes = None
+                if os.path.getsize(html_file) < PIPELINE_READ_AHEAD_MAX_SIZE:
+                    with open(html_file, 'rb') as f:
+                        html_bytes = f.read()
+                return html_file, html_bytes, {'duration': time.perf_counter() - start}
+
+            def parse(item):
+                start = time.perf_counter()
+                html_file, html_bytes, stats = item
+                if html_bytes is None:
+                    with open(html_file, 'rb') as f:
+                        html_bytes = f.read()
+                html_element = parse_html_bytes(html_bytes, base_url=html_file, selectors=groups.representatives(unused_mask), stats=stats)
+                stats['duration'] += time.perf_counter() - start
+                return html_file, html_element, stats
+
+            pipeline = Pipeline([('read', read), ('parse', parse, PIPELINE_PARSED_QUEUE_SIZE)], queue_size=self.queue_size, name='DOM matching')
+            with contextlib.closing(pipeline.run(html_files)) as documents:
+                for html_file, html_element, stats in documents:
+                    if not unused_mask:
+                        break
+                    start = time.perf_counter()
+                    original_total = bitset.count(unused_mask)
+                    found_mask = 0
+                    if html_element is not None:
+                        if self.selector_timing:
+                            stats['selector_times'] = {}
+                        representatives = groups.representatives(unused_mask, stats)
+                        found_selectors = match_selectors_against_html_root_element(representatives, html_element, engine=engine, stats=stats, grouped=True)
+                        found_mask = groups.found_mask(found_selectors)
+                    stats['duration'] += time.perf_counter() - start
+                    self._record_dom_matching_stats(html_file, stats)
+                    unused_mask &= ~found_mask
+                    _log.info('DOM matching %d CSS selectors: %d matches, %d unmatched with DOM from %r' % (original_total, bitset.count(found_mask), bitset.count(unused_mask), html_file))
+        else:
+            for html_file in html_files:
+                original_total = bitset.count(unused_mask)
+                _log.debug('DOM matching %d CSS selectors with DOM from %r' % (original_total, html_file))
+                _, found_mask, stats = _match_selectors_against_html_file(html_file, unused_mask, groups, cache_dir, engine, self.selector_timing, self.streaming)
+                self._record_dom_matching_stats(html_file, stats)
+                unused_mask &= ~found_mask
+                _log.info('DOM matching %d CSS selectors: %d matches, %d unmatched with DOM from %r' % (original_total, bitset.count(found_mask), bitset.count(unused_mask), html_file))
 
         # Return result
+        unused_selectors = set(table.selectors(unused_mask))
         results['unused_selectors'] = sorted(unused_selectors)
 
         return unused_selectors, results
 
-    def _eliminate_selectors_from_idclass_grepping(self, selectors, src_files):
+    def _match_html_files_against_own_stylesheets(self, html_files, site_root=None, cache_dir=None, engine=ENGINE_XPATH):
+        '''
+        HTML-only mode: parse each HTML file once, discover the style sheets it uses
+        (linked, inline and imported ones) and match its DOM only against
+        the (still unmatched) selectors of these style sheets.
+
+        @return mapping of style sheet (file path or inline style sheet label) to results struct
+            with 'selectors', 'selector_lines', 'pages' (the HTML files using it)
+            and 'unused_selectors' (the selectors that did not match with these pages)
+        '''
+        if cache_dir:
+            extract = lambda css_file: AnalysisCache.get(cache_dir).css_selector_lines(css_file, extract_css_selector_lines)
+        else:
+            extract = extract_css_selector_lines
+        registry = StylesheetRegistry(site_root=site_root, extract=extract)
+        # Per style sheet: unmatched selectors and using pages.
+        unused = {}
+        pages = collections.defaultdict(list)
+        for html_file in sorted(html_files):
+            start = time.perf_counter()
+            stats = {}
+            html_element = lxml.etree.parse(html_file, parser=lxml.etree.HTMLParser()).getroot()
+            keys = registry.page_stylesheets(html_element, html_file)
+            for key in keys:
+                if key not in unused:
+                    unused[key] = set(registry.selector_lines[key])
+                pages[key].append(html_file)
+            selectors = set().union(*(unused[key] for key in keys))
+            match = lambda s: match_selectors_against_html_root_element(s, html_element, engine=engine, stats=stats)
+            if cache_dir:
+                found_selectors = AnalysisCache.get(cache_dir).match('dom', file_hash(html_file), selectors, match)
+            else:
+                found_selectors = match(selectors)
+            for key in keys:
+                unused[key].difference_update(found_selectors)
+            stats['duration'] = time.perf_counter() - start
+            self._record_dom_matching_stats(html_file, stats)
+            _log.info('DOM matching %d CSS selectors from %d style sheets: %d matches with DOM from %r' % (len(selectors), len(keys), len(found_selectors), html_file))
+
+        results = collections.OrderedDict()
+        for key, selector_lines in registry.selector_lines.items():
+            results[key] = {
+                'selectors': set(selector_lines),
+                'selector_lines': selector_lines,
+                'pages': pages[key],
+                'unused_selectors': unused[key],
+            }
+        return results
+
+    def _eliminate_selectors_from_idclass_grepping(self, selectors, src_files, jobs=1, cache_dir=None, table=None):
         '''
         Eliminate selectors by searching for mentioned ids and classes in the given source files.
+
+        @param table optional SelectorTable containing the selectors (with their parsed ids and classes)
         '''
         # The results struct for tracking intermediate data
         results = {}
 
-        # Extract ids and classes.
-        ids, classes, origins = extract_ids_and_classes_from_selectors(selectors)
+        # Get the ids and classes of the selectors.
+        table = self._selector_table(selectors, table)
+        selectors_mask = table.mask(selectors)
+        ids, classes = table.ids_and_classes(selectors_mask)
         results['ids'] = ids
         results['classes'] = classes
         _log.info('Id/class extraction from %d CSS selectors for source code matching: extracted %d ids, %d classes.' % (len(selectors), len(ids), len(classes)))
         _log.debug('Extracted ids: %r' % ids)
         _log.debug('Extracted classes: %r' % classes)
 
-        # Determine unfindable ids and classes.
-        findable_ids = set()
-        findable_classes = set()
-        unfindable_ids = ids.copy()
-        unfindable_classes = classes.copy()
+        # Determine unfindable ids and classes, as bitsets over the word ids of the table
+        # (worker results are merged with bitwise or).
+        word_index = (table.words, table.word_ids())
+        findable_mask = 0
+        unfindable_mask = table.word_mask(ids | classes)
         # Scan through the source files for the remaining ids and classes.
-        for src_file in src_files:
-            content = file_get_contents(src_file)
-            _log.debug('Searching for %d remaining unfindable ids in %s' % (len(unfindable_ids), src_file))
-            findable_ids.update(get_occuring_words(unfindable_ids, content))
-            unfindable_ids.difference_update(findable_ids)
-            _log.debug('Searching for %d remaining unfindable classes in %s' % (len(unfindable_classes), src_file))
-            findable_classes.update(get_occuring_words(unfindable_classes, content))
-            unfindable_classes.difference_update(findable_classes)
-        results['unfindable_ids'] = unfindable_ids
-        results['unfindable_classes'] = unfindable_classes
+        if jobs > 1:
+            # Read files with a thread pool and scan their contents with a process pool,
+            # each file being scanned for the ids and classes that were still unfindable
+            # at the time of submission. Stop as soon as everything has been found.
+            # Large files are not read by the thread pool, but memory-mapped by the workers.
+            shared_word_index = share(word_index)
+
+            def get_args():
+                if unfindable_mask:
+                    return (unfindable_mask, shared_word_index, cache_dir, self.mmap_threshold, self.tokenizers)
+            try:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as io_executor, \
+                        concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                    contents = shrinking_map(
+                        io_executor, read_source_file, src_files,
+                        get_args=lambda: (self.mmap_threshold,) if get_args() else None,
+                        max_pending=2 * jobs,
+                    )
+                    scans = shrinking_map(executor, _grep_ids_and_classes, contents, get_args=get_args, max_pending=2 * jobs)
+                    for (src_file, content), (found_mask, stats) in scans:
+                        self.instrumentation.file('idclass_grepping', src_file, stats.pop('duration'), stats)
+                        _log.debug('Found %d ids and classes in %s' % (bitset.count(found_mask), src_file))
+                        findable_mask |= found_mask
+                        unfindable_mask &= ~found_mask
+            finally:
+                unshare(shared_word_index)
+        else:
+            with contextlib.closing(self._read_source_files(src_files)) as contents:
+                for src_file, content in contents:
+                    if not unfindable_mask:
+                        break
+                    _log.debug('Searching for %d remaining unfindable ids and classes in %s' % (bitset.count(unfindable_mask), src_file))
+                    found_mask, stats = _grep_ids_and_classes((src_file, content), unfindable_mask, word_index, cache_dir, self.mmap_threshold, self.tokenizers)
+                    self.instrumentation.file('idclass_grepping', src_file, stats.pop('duration'), stats)
+                    findable_mask |= found_mask
+                    unfindable_mask &= ~found_mask
+        return self._eliminate_selectors_with_findable_words(selectors_mask, findable_mask, results, len(src_files), table)
+
+    def _eliminate_selectors_from_idclass_histogram(self, selectors, src_files, histogram, table=None):
+        '''
+        Eliminate selectors based on the id/class counts of histogram mode
+        (see _count_ids_and_classes()), instead of scanning the source files again.
+
+        @param histogram Histogram of files and occurrences per id/class name in the given source files,
+            covering (at least) the ids and classes of the given selectors
+        '''
+        table = self._selector_table(selectors, table)
+        selectors_mask = table.mask(selectors)
+        ids, classes = table.ids_and_classes(selectors_mask)
+        results = {'ids': ids, 'classes': classes}
+        findable_mask = table.word_mask(w for w in ids | classes if histogram.get(w)[0])
+        return self._eliminate_selectors_with_findable_words(selectors_mask, findable_mask, results, len(src_files), table)
+
+    def _eliminate_selectors_with_findable_words(self, selectors_mask, findable_mask, results, src_count, table):
+        '''
+        Eliminate the selectors (in given mask) with findable ids/classes.
+
+        @param findable_mask bitset (over the word ids of the table) of the found ids and classes
+        @param results results struct with the 'ids' and 'classes' of the selectors, to complete
+
+        @return (set of unused selectors, results struct)
+        '''
+        findable = set(bitset.select(table.words, findable_mask))
+        results['unfindable_ids'] = results['ids'] - findable
+        results['unfindable_classes'] = results['classes'] - findable
 
         # Eliminate selectors with findable ids/classes
-        used_idclass_selectors = set()
-        for id in findable_ids:
-            used_idclass_selectors.update(origins['#' + id])
-        for classs in findable_classes:
-            used_idclass_selectors.update(origins['.' + classs])
-        unused_selectors = selectors.difference(used_idclass_selectors)
+        used_mask = table.word_selector_mask(findable_mask) & selectors_mask
+        unused_selectors = set(table.selectors(selectors_mask & ~used_mask))
         _log.info('Id/class based elimination from {total:d} CSS selectors with {src:d} source files: {used:d} possibly used, {unused:d} unused.'.format(
-            total=len(selectors),
-            src=len(src_files),
-            used=len(used_idclass_selectors),
+            total=bitset.count(selectors_mask),
+            src=src_count,
+            used=bitset.count(used_mask),
             unused=len(unused_selectors)
         ))
 
@@ -104,6 +467,131 @@ class CssDeadwoodApp(object):
         return unused_selectors, results
 
 
+    def _count_selectors_in_dom(self, selectors, html_files, jobs=1, engine=ENGINE_XPATH):
+        '''
+        Histogram mode DOM matching: count for each selector the number of HTML files
+        and elements it matches with, instead of dropping it after its first match.
+
+        @return (set of unused selectors, results struct, Histogram of pages and elements per selector)
+        '''
+        histogram = Histogram(selectors)
+        keys = histogram.keys
+        if jobs > 1:
+            # Share the keys with forked workers instead of pickling them for each task.
+            shared_keys = share(keys)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                    counts = shrinking_map(executor, _count_selectors_in_html_file, html_files, get_args=lambda: (shared_keys, engine), max_pending=2 * jobs)
+                    for html_file, (counters, stats) in counts:
+                        histogram.add(counters)
+                        self.instrumentation.file('dom_matching', html_file, stats.pop('duration'), stats)
+            finally:
+                unshare(shared_keys)
+        else:
+            for html_file in html_files:
+                counters, stats = _count_selectors_in_html_file(html_file, keys, engine)
+                histogram.add(counters)
+                self.instrumentation.file('dom_matching', html_file, stats.pop('duration'), stats)
+        unused_selectors = set(key for key in keys if histogram.get(key)[0] == 0)
+        _log.info('DOM match counting of %d CSS selectors with %d HTML files: %d unmatched.' % (len(keys), len(html_files), len(unused_selectors)))
+        return unused_selectors, {'unused_selectors': sorted(unused_selectors)}, histogram
+
+    def _count_ids_and_classes(self, selectors, src_files, jobs=1, table=None):
+        '''
+        Histogram mode id/class grepping: count for each id and class (of the given selectors)
+        the number of source files it occurs in and its total number of occurrences.
+
+        @param table optional SelectorTable containing the selectors
+
+        @return Histogram of files and occurrences per id/class name
+        '''
+        table = self._selector_table(selectors, table)
+        ids, classes = table.ids_and_classes(table.mask(selectors))
+        histogram = Histogram(ids | classes)
+        keys = histogram.keys
+        if jobs > 1:
+            shared_keys = share(keys)
+            try:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as io_executor, \
+                        concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                    contents = shrinking_map(io_executor, read_source_file, src_files, get_args=lambda: (self.mmap_threshold,), max_pending=2 * jobs)
+                    counts = shrinking_map(executor, _count_words_in_file, contents, get_args=lambda: (shared_keys, self.mmap_threshold, self.tokenizers), max_pending=2 * jobs)
+                    for (src_file, content), (counters, stats) in counts:
+                        histogram.add(counters)
+                        self.instrumentation.file('idclass_grepping', src_file, stats.pop('duration'), stats)
+            finally:
+                unshare(shared_keys)
+        else:
+            with contextlib.closing(self._read_source_files(src_files)) as contents:
+                for src_file_and_content in contents:
+                    counters, stats = _count_words_in_file(src_file_and_content, keys, self.mmap_threshold, self.tokenizers)
+                    histogram.add(counters)
+                    self.instrumentation.file('idclass_grepping', src_file_and_content[0], stats.pop('duration'), stats)
+        return histogram
+
+    def _read_source_files(self, src_files):
+        '''
+        Read source files ahead in a background thread (unless pipelining is disabled)
+        while the current one is scanned.
+
+        @return generator of (source file, contents) tuples, where contents are None
+            for large files (to memory-map) or when not reading ahead
+        '''
+        if not self.queue_size:
+            return ((src_file, None) for src_file in src_files)
+        pipeline = Pipeline(
+            [('read', lambda src_file: (src_file, read_source_file(src_file, self.mmap_threshold)))],
+            queue_size=self.queue_size, name='Id/class scanning'
+        )
+        return pipeline.run(src_files)
+
+    @staticmethod
+    def _selector_table(selectors, table=None):
+        '''
+        @return given SelectorTable, or a new one with the given selectors
+        '''
+        if table is None:
+            table = SelectorTable()
+            for selector in sorted(selectors):
+                table.add(selector)
+        return table
+
+    def _project_results(self, selectors, unused_selectors, dom_data=None, idclass_data=None, table=None):
+        '''
+        Project the results of an analysis on a (larger) set of selectors
+        to the given subset of selectors.
+
+        Note that usage of a selector does not depend on the other selectors
+        being analysed, so the projected results are the same as if the analysis
+        was done on the subset only.
+
+        @param selectors subset of the analysed selectors
+        @param unused_selectors set of unused selectors from the analysis
+        @param dom_data results data from DOM matching (if done)
+        @param idclass_data results data from id/class grepping (if done)
+        @param table optional SelectorTable containing the selectors
+
+        @return results struct for the given selectors
+        '''
+        results = {}
+        if dom_data is not None:
+            selectors = selectors.intersection(dom_data['unused_selectors'])
+            results['dom_matching'] = {'unused_selectors': sorted(selectors)}
+        if idclass_data is not None:
+            table = self._selector_table(selectors, table)
+            ids, classes = table.ids_and_classes(table.mask(selectors))
+            selectors = selectors.intersection(idclass_data['unused_selectors'])
+            results['idclass_elimination'] = {
+                'ids': ids,
+                'classes': classes,
+                'unfindable_ids': ids.intersection(idclass_data['unfindable_ids']),
+                'unfindable_classes': classes.intersection(idclass_data['unfindable_classes']),
+                'unused_selectors': sorted(selectors),
+            }
+        results['unused_selectors'] = sorted(selectors.intersection(unused_selectors))
+        return results
+
+
     def main(self, argv=sys.argv):
 
         # Parse command line
@@ -116,6 +604,28 @@ class CssDeadwoodApp(object):
             help="Define the source file extensions (comma separated) to filter on when recursively scanning source folders. Default: '%s'." % default_src_extensions
         )
 
+        option_parser.add_option(
+            "--tokenizers", metavar='SPEC',
+            action="store", dest="tokenizers", default='',
+            help="Only extract id/class candidates from string literals and template attributes of source files, "
+                 "instead of searching for them as plain words: 'auto' for the default tokenizer per extension "
+                 "and/or comma separated '.ext=NAME' items with NAME 'markup', 'script', 'strings' or 'words' "
+                 "(plain words), e.g. 'auto,.inc=markup'. Default: plain words for all source files."
+        )
+
+        option_parser.add_option(
+            "--exclude", metavar='PATTERN',
+            action="append", dest="excludes", default=[],
+            help="Exclude files and folders matching given (gitignore-style) pattern when scanning folders, "
+                 "e.g. 'node_modules/' or '*.min.css' (can be used multiple times). "
+                 "Patterns from .gitignore files and version control folders are excluded by default."
+        )
+        option_parser.add_option(
+            "--no-gitignore",
+            action="store_false", dest="use_gitignore", default=True,
+            help="Do not take .gitignore files into account when scanning folders."
+        )
+
         # option_parser.add_option(
         #     "--htmlexport", metavar='FILE',
         #     action="store", dest="html_export", default=None,
@@ -127,6 +637,102 @@ class CssDeadwoodApp(object):
             help="Export analysis results in JSON format."
         )
 
+        option_parser.add_option(
+            "-j", "--jobs", metavar='N', type="int",
+            action="store", dest="jobs", default=1,
+            help="Number of workers to use for DOM matching and source file scanning. Default: 1 (no worker processes)."
+        )
+
+        option_parser.add_option(
+            "--engine", metavar='ENGINE', type="choice", choices=ENGINES,
+            action="store", dest="engine", default=ENGINE_XPATH,
+            help="DOM matching engine: 'xpath' (XPath evaluation per selector) or 'bulk' (single DOM tree walk for all selectors). Default: '%s'." % ENGINE_XPATH
+        )
+
+        option_parser.add_option(
+            "--streaming",
+            action="store_true", dest="streaming", default=False,
+            help="Parse HTML files incrementally, freeing processed elements and stopping as soon as all selectors are matched, to limit memory usage on large HTML files."
+        )
+
+        option_parser.add_option(
+            "--mmap-threshold", metavar='BYTES', type="int",
+            action="store", dest="mmap_threshold", default=MMAP_THRESHOLD,
+            help="Memory-map source files of at least this size for id/class scanning, instead of reading them. Default: %d." % MMAP_THRESHOLD
+        )
+
+        option_parser.add_option(
+            "--queue-size", metavar='N', type="int",
+            action="store", dest="queue_size", default=PIPELINE_QUEUE_SIZE,
+            help="Without worker processes: number of files to read ahead in background threads, "
+                 "overlapping I/O with parsing and matching (0 to disable). "
+                 "This takes more memory: besides the files read ahead (only those smaller than %d bytes), "
+                 "up to %d parsed HTML file(s) are prepared (parsed or waiting) while the current one is being matched. "
+                 "Use 0 (or --streaming) to limit memory usage on very large HTML files. Default: %d." % (
+                     PIPELINE_READ_AHEAD_MAX_SIZE, PIPELINE_PARSED_QUEUE_SIZE, PIPELINE_QUEUE_SIZE)
+        )
+
+        option_parser.add_option(
+            "--histogram",
+            action="store_true", dest="histogram", default=False,
+            help="Count for each selector the number of HTML files and elements it matches with "
+                 "and for each id/class the number of source files and occurrences, instead of just checking usage. "
+                 "The counts are included in the JSON export."
+        )
+
+        option_parser.add_option(
+            "--html-only",
+            action="store_true", dest="html_only", default=False,
+            help="Only work with HTML files: analyse the style sheets they use (linked, inline and imported ones) "
+                 "and match each HTML file only against its own style sheets. DOM matching is done without worker processes."
+        )
+        option_parser.add_option(
+            "--site-root", metavar='DIR',
+            action="store", dest="site_root", default=None,
+            help="Folder to resolve root-relative style sheet references (e.g. '/css/style.css') against in HTML-only mode."
+        )
+
+        option_parser.add_option(
+            "--crawl", metavar='URL',
+            action="append", dest="crawl", default=[],
+            help="Crawl the site from given start URL (can be used multiple times) for HTML pages and (linked and inline) style sheets to analyse. "
+                 "Inline style sheets are only matched with the pages including them."
+        )
+        option_parser.add_option(
+            "--max-pages", metavar='N', type="int",
+            action="store", dest="max_pages", default=100,
+            help="Maximum number of HTML pages to fetch when crawling. Default: 100."
+        )
+        option_parser.add_option(
+            "--crawl-concurrency", metavar='N', type="int",
+            action="store", dest="crawl_concurrency", default=8,
+            help="Maximum number of concurrent requests when crawling. Default: 8."
+        )
+
+        option_parser.add_option(
+            "--watch",
+            action="store_true", dest="watch", default=False,
+            help="Keep running after the analysis: watch the given files and folders for changes "
+                 "and only reanalyse what changed. The analysis is done without worker processes."
+        )
+        option_parser.add_option(
+            "--watch-interval", metavar='SECONDS', type="float",
+            action="store", dest="watch_interval", default=1.0,
+            help="Interval between checks for changed files in watch mode. Default: 1 second."
+        )
+
+        option_parser.add_option(
+            "--cache-dir", metavar='DIR',
+            action="store", dest="cache_dir", default=None,
+            help="Folder to store a persistent analysis cache in, so that reruns only have to process new or changed files."
+        )
+
+        option_parser.add_option(
+            "--profile",
+            action="store_true", dest="profile", default=False,
+            help="Print a profile report (stage timings, slowest files and selectors, peak memory) and include it in the JSON export."
+        )
+
         option_parser.add_option(
             "-v", "--verbose",
             action="store_const", dest="loglevel", const=logging.DEBUG, default=logging.INFO,
@@ -145,6 +751,10 @@ class CssDeadwoodApp(object):
         )
 
         options, args = option_parser.parse_args(args=argv[1:])
+        if options.histogram and options.html_only:
+            option_parser.error('Histogram mode is not supported in HTML-only mode.')
+        if options.watch and (options.histogram or options.html_only or options.crawl):
+            option_parser.error('Watch mode is not supported in histogram, HTML-only or crawl mode.')
 
         # Handle example mode
         if options.example_mode:
@@ -164,14 +774,58 @@ class CssDeadwoodApp(object):
         logging.basicConfig(level=options.loglevel)
         logging.getLogger('CssDeadwood.bs4').setLevel(logging.ERROR)
 
-        # Get CSS, HTML and other source files form given arguments.
-        css_files = collect_files(args, extensions=['.css'])
-        html_files = collect_files(args, extensions=['.html'])
+        self.selector_timing = options.profile
+        self.streaming = options.streaming
+        self.mmap_threshold = options.mmap_threshold
+        self.queue_size = options.queue_size
+        try:
+            self.tokenizers = parse_tokenizers(options.tokenizers)
+        except ValueError as e:
+            option_parser.error(str(e))
+        instrumentation = self.instrumentation
+
         if len(options.src_extensions.strip()) > 0:
             src_extensions = options.src_extensions.split(',')
         else:
             src_extensions = []
-        src_files = collect_files(args, extensions=src_extensions)
+
+        excludes = DEFAULT_EXCLUDES + options.excludes
+        ignore_file_name = IGNORE_FILE_NAME if options.use_gitignore else None
+
+        if options.watch:
+            analyzer = Analyzer(engine=options.engine, src_extensions=src_extensions, cache_dir=options.cache_dir, mmap_threshold=options.mmap_threshold, tokenizers=self.tokenizers, instrumentation=instrumentation)
+            watcher = FileWatcher(args, extensions=['.css', '.html'] + src_extensions, excludes=excludes, ignore_file_name=ignore_file_name)
+            return self._watch(analyzer, watcher, options.watch_interval, options.json_export)
+
+        # Get CSS, HTML and other source files form given arguments, in a single scan.
+        with instrumentation.timed_stage('collect_files'):
+            files = discover_files(args, {'css': ['.css'], 'html': ['.html'], 'src': src_extensions}, excludes=excludes, ignore_file_name=ignore_file_name)
+            css_files = files['css']
+            html_files = files['html']
+            src_files = files['src']
+
+        # Labels (e.g. URLs) to report files with, instead of their path.
+        labels = {}
+        # Mapping of (crawled) inline style sheet file to list of HTML files including it.
+        inline_pages = collections.OrderedDict()
+        if options.crawl:
+            with instrumentation.timed_stage('crawl'):
+                crawl_result = crawl(options.crawl, max_pages=options.max_pages, concurrency=options.crawl_concurrency)
+                # Store the crawled resources as files for the rest of the pipeline.
+                crawl_dir = tempfile.mkdtemp(prefix='cssdeadwood-crawl-')
+                atexit.register(shutil.rmtree, crawl_dir, True)
+                crawled_html_files, crawled_css_files = crawl_result.save(crawl_dir)
+            _log.info('Crawled %d HTML pages and %d style sheets.' % (len(crawled_html_files), len(crawled_css_files)))
+            html_files.update(crawled_html_files)
+            css_files.update(crawled_css_files)
+            labels.update(crawled_html_files)
+            labels.update(crawled_css_files)
+            page_files = dict((url, path) for (path, url) in crawled_html_files.items())
+            for css_file, label in crawled_css_files.items():
+                if label in crawl_result.inline_style_pages:
+                    inline_pages[css_file] = [page_files[url] for url in crawl_result.inline_style_pages[label]]
+            instrumentation.count('crawled_pages', len(crawled_html_files))
+            instrumentation.count('crawl_errors', len(crawl_result.errors))
         # TODO: use the right plural forms here
         _log.info('Working with %d CSS files.' % len(css_files))
         _log.debug('CSS files: %r.' % css_files)
@@ -179,36 +833,120 @@ class CssDeadwoodApp(object):
         _log.debug('HTML files: %r.' % html_files)
         _log.info('Working with %d source files.' % len(src_files))
         _log.debug('Source files: %r.' % src_files)
+        instrumentation.count('css_files', len(css_files))
+        instrumentation.count('html_files', len(html_files))
+        instrumentation.count('src_files', len(src_files))
 
         # Result object where we will store all analysis data, to be used in reporting/exporting.
         results = {}
+        # DOM matching results per CSS file (HTML-only mode) or for all CSS files.
+        css_dom_data = {}
+        dom_data = idclass_data = None
+        # Table of all distinct selectors, shared by the analysis stages.
+        table = SelectorTable()
 
-        for css_file in css_files:
-            _log.info('Analysing CSS selectors from %r' % css_file)
-            results[css_file] = {}
-
-            # Extract selectore from CSS source
-            selectors = extract_css_selectors(css_file)
-            results[css_file]['selectors'] = selectors
-            _log.info('Extracted %d CSS selectors from %r.' % (len(selectors), css_file))
-            _log.debug('Extracted selectors: %r' % selectors)
+        if options.html_only:
+            if css_files:
+                _log.warning('Ignoring %d CSS files in HTML-only mode.' % len(css_files))
+            # Discover the style sheets and do the DOM matching per HTML file.
+            with instrumentation.timed_stage('html_only_dom_matching'):
+                stylesheets = self._match_html_files_against_own_stylesheets(html_files, site_root=options.site_root, cache_dir=options.cache_dir, engine=options.engine)
+            for css_file, data in stylesheets.items():
+                table.add_selector_lines(css_file, data['selector_lines'])
+                results[css_file] = {'selectors': data['selectors'], 'selector_lines': data['selector_lines'], 'pages': data['pages']}
+                css_dom_data[css_file] = {'unused_selectors': sorted(data['unused_selectors'])}
+            unused_selectors = set().union(*(data['unused_selectors'] for data in stylesheets.values()))
+            _log.info('Found %d style sheets, with %d distinct CSS selectors unmatched.' % (len(stylesheets), len(unused_selectors)))
+            instrumentation.count('selectors', len(table))
+        else:
+            # Extract selectors from the CSS sources.
+            with instrumentation.timed_stage('css_extract'):
+                for css_file in css_files:
+                    label = labels.get(css_file, css_file)
+                    _log.info('Analysing CSS selectors from %r' % label)
+                    start = time.perf_counter()
+                    results[label] = {}
+                    if options.cache_dir:
+                        selector_lines = AnalysisCache.get(options.cache_dir).css_selector_lines(css_file, extract_css_selector_lines)
+                    else:
+                        selector_lines = extract_css_selector_lines(css_file)
+                    table.add_selector_lines(label, selector_lines)
+                    selectors = set(selector_lines)
+                    results[label]['selectors'] = selectors
+                    results[label]['selector_lines'] = selector_lines
+                    instrumentation.file('css_extract', label, time.perf_counter() - start, {'selectors': len(selectors)})
+                    _log.info('Extracted %d CSS selectors from %r.' % (len(selectors), label))
+                    _log.debug('Extracted selectors: %r' % selectors)
 
+            # Do the analysis in one pass on the union of all selectors,
+            # so that each HTML file and source file is only processed once.
             # Start with flagging all selectors as "unused"
-            unused_selectors = selectors.copy()
+            unused_selectors = set(table.selectors(table.full_mask()))
+            _log.info('Analysing %d distinct CSS selectors from %d CSS files.' % (len(unused_selectors), len(css_files)))
+            instrumentation.count('selectors', len(unused_selectors))
+
+            # The selectors of the inline style sheets of crawled pages are only matched
+            # with the DOM trees of the pages including them, the others with all HTML files.
+            site_selectors = unused_selectors
+            inline_unused_selectors = set()
+            if inline_pages:
+                with instrumentation.timed_stage('inline_dom_matching'):
+                    for css_file, pages in inline_pages.items():
+                        label = labels[css_file]
+                        unused, _ = self._eliminate_selectors_from_dom_matching(results[label]['selectors'], pages, jobs=options.jobs, cache_dir=options.cache_dir, engine=options.engine, table=table)
+                        results[label]['pages'] = [labels[page] for page in pages]
+                        css_dom_data[label] = {'unused_selectors': sorted(unused)}
+                        inline_unused_selectors.update(unused)
+                site_selectors = set().union(*(results[labels.get(f, f)]['selectors'] for f in css_files if f not in inline_pages))
 
             # Eliminate selectors that match with the DOM trees from the HTML files.
-            if html_files:
-                unused_selectors, data = self._eliminate_selectors_from_dom_matching(unused_selectors, html_files)
-                results[css_file]['dom_matching'] = data
+            if html_files and options.histogram:
+                with instrumentation.timed_stage('dom_matching'):
+                    unused_selectors, dom_data, dom_histogram = self._count_selectors_in_dom(unused_selectors, html_files, jobs=options.jobs, engine=options.engine)
+            elif html_files:
+                with instrumentation.timed_stage('dom_matching'):
+                    unused_selectors, dom_data = self._eliminate_selectors_from_dom_matching(site_selectors, html_files, jobs=options.jobs, cache_dir=options.cache_dir, engine=options.engine, table=table)
+            if inline_pages:
+                unused_selectors = unused_selectors.intersection(site_selectors).union(inline_unused_selectors)
 
-            # Extract ids and classes and scan other source files for these.
-            if src_files:
-                unused_selectors, data = self._eliminate_selectors_from_idclass_grepping(unused_selectors, src_files)
-                results[css_file]['idclass_elimination'] = data
+        # Extract ids and classes and scan other source files for these.
+        # In histogram mode, the source files are scanned once, for the counts of all ids and classes,
+        # and the selectors are eliminated based on these counts.
+        if src_files and options.histogram:
+            with instrumentation.timed_stage('idclass_histogram'):
+                idclass_histogram = self._count_ids_and_classes(table.selectors(table.full_mask()), src_files, jobs=options.jobs, table=table)
+            unused_selectors, idclass_data = self._eliminate_selectors_from_idclass_histogram(unused_selectors, src_files, idclass_histogram, table=table)
+        elif src_files:
+            with instrumentation.timed_stage('idclass_grepping'):
+                unused_selectors, idclass_data = self._eliminate_selectors_from_idclass_grepping(unused_selectors, src_files, jobs=options.jobs, cache_dir=options.cache_dir, table=table)
+        instrumentation.count('unused_selectors', len(unused_selectors))
 
-            results[css_file]['unused_selectors'] = sorted(unused_selectors)
+        # Project the combined results back on the separate CSS files.
+        for css_file, data in results.items():
+            data.update(self._project_results(data['selectors'], unused_selectors, css_dom_data.get(css_file, dom_data), idclass_data, table=table))
+            if options.histogram and html_files:
+                data['histogram'] = dom_histogram.export('pages', 'elements', keys=data['selectors'])
+            if options.histogram and src_files:
+                ids, classes = table.ids_and_classes(table.mask(table.file_selectors(css_file)))
+                data['idclass_histogram'] = {
+                    'ids': idclass_histogram.export('files', 'occurrences', keys=ids),
+                    'classes': idclass_histogram.export('files', 'occurrences', keys=classes),
+                }
 
         # Report
+        self._print_report(results)
+
+        # Profile report
+        if options.profile:
+            self.profiler.print_report()
+
+        # TODO: HTML report
+
+        # JSON report
+        if options.json_export:
+            self._export_json(results, options.json_export, profile=options.profile)
+
+    def _print_report(self, results):
         for css_file, data in results.items():
             print((css_file + ' ').ljust(80, '-'))
             total_count = len(data['selectors'])
@@ -220,13 +958,72 @@ class CssDeadwoodApp(object):
             print('Could not determine usage of the following %d CSS selectors (from %d in total: %.1f%%):' % (unused_count, total_count, perc))
             print('\n'.join(data['unused_selectors']))
 
-        # TODO: HTML report
+    def _export_json(self, results, json_export, profile=False):
+        logging.info('Writing JSON report: %s' % json_export)
+        export = dict(results)
+        if profile:
+            export['_profile'] = self.profiler.report()
+        with open(json_export, 'w') as f:
+            json.dump(export, f, indent=1, default=list)
 
-        # JSON report
-        if options.json_export:
-            logging.info('Writing JSON report: %s' % options.json_export)
-            with open(options.json_export, 'w') as f:
-                json.dump(results, f, indent=1, default=list)
+    def _watch_round(self, analyzer, watcher):
+        '''
+        Feed the file changes since the previous round to the analyzer.
+
+        @return (set of changed files, set of selectors that became used, set of selectors that became unused)
+        '''
+        added, modified, removed = watcher.poll()
+        used = set()
+        unused = set()
+        for path in removed:
+            _log.info('Removed: %r' % path)
+            u, n = analyzer.remove_file(path)
+            used.update(u)
+            unused.update(n)
+        if added or modified:
+            for path in sorted(modified):
+                _log.info('Modified: %r' % path)
+            u, n = analyzer.add_files(added | modified)
+            used.update(u)
+            unused.update(n)
+        # Files that could not be read or parsed (e.g. being written), retry next round.
+        watcher.forget(analyzer.failed_files())
+        # A selector can not have become both used and unused in the same round.
+        both = used & unused
+        return added | modified | removed, used - both, unused - both
+
+    def _watch(self, analyzer, watcher, interval=1.0, json_export=None, max_rounds=None):
+        '''
+        Watch mode: do the analysis with a (long-lived) Analyzer and keep
+        feeding it the changed files, reporting the CSS files with changed results.
+
+        @param max_rounds optional maximum number of rounds (for testing), otherwise run until interrupted
+        '''
+        rounds = 0
+        try:
+            while max_rounds is None or rounds < max_rounds:
+                if rounds > 0:
+                    time.sleep(interval)
+                changed_files, used, unused = self._watch_round(analyzer, watcher)
+                rounds += 1
+                if rounds > 1 and not changed_files:
+                    continue
+                results = analyzer.results()
+                if rounds > 1:
+                    for selector in sorted(used):
+                        _log.info('Selector became used: %r' % selector)
+                    for selector in sorted(unused):
+                        _log.info('Selector became unused: %r' % selector)
+                    changed = used | unused
+                    results = collections.OrderedDict(
+                        (css_file, data) for (css_file, data) in results.items()
+                        if css_file in changed_files or not changed.isdisjoint(data['selectors'])
+                    )
+                self._print_report(results)
+                if json_export:
+                    self._export_json(analyzer.results(), json_export)
+        except KeyboardInterrupt:
+            _log.info('Stopped watching.')
 
 
 
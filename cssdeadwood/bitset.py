@@ -0,0 +1,45 @@
+'''
+Helpers for bitsets: sets of small non-negative integers (e.g. selector ids)
+represented as Python integers, so that union, intersection and difference
+are single integer operations, and bitsets are compact to pass between processes.
+'''
+
+
+def from_indices(indices, size=0):
+    '''
+    @param indices iterable of non-negative integers
+    @param size optional number of bits (to preallocate)
+
+    @return bitset with given bits set
+    '''
+    bits = bytearray((size + 7) // 8)
+    for i in indices:
+        byte = i >> 3
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        bits[byte] |= 1 << (i & 7)
+    return int.from_bytes(bytes(bits), 'little')
+
+
+def full(size):
+    '''@return bitset with the first size bits set'''
+    return (1 << size) - 1
+
+
+def iter_indices(bitset):
+    '''@return generator of the indices of the set bits (in increasing order)'''
+    bits = bin(bitset)[:1:-1]
+    i = bits.find('1')
+    while i >= 0:
+        yield i
+        i = bits.find('1', i + 1)
+
+
+def count(bitset):
+    '''@return number of set bits'''
+    return bin(bitset).count('1')
+
+
+def select(items, bitset):
+    '''@return list of the items (sequence) at the indices of the set bits'''
+    return [items[i] for i in iter_indices(bitset)]
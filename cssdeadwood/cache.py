@@ -0,0 +1,146 @@
+
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+
+
+_log = logging.getLogger('cssdeadwood.cache')
+
+
+# Name of the SQLite database file in the cache folder.
+CACHE_FILE_NAME = 'cssdeadwood-cache.sqlite3'
+
+# Version of the database schema and the semantics of the cached results (stored as SQLite "user_version").
+# Bump this whenever the schema changes or CSS selector extraction or DOM/word matching
+# changes its results, so that the data of other versions is discarded.
+CACHE_VERSION = 3
+
+
+def content_hash(data):
+    '''
+    Content hash of given data (string or bytes-like object, e.g. a memory map), for use as cache key.
+    '''
+    if isinstance(data, str):
+        data = data.encode('utf-8', 'surrogatepass')
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_hash(file_name):
+    '''
+    Content hash of given file, for use as cache key.
+    '''
+    with open(file_name, 'rb') as f:
+        return content_hash(f.read())
+
+
+class AnalysisCache(object):
+    '''
+    Persistent, on-disk cache of per-file analysis results,
+    keyed on file content hashes, so that reruns only have
+    to process new or changed files.
+
+    Match results (e.g. which selectors match with the DOM of an HTML file,
+    or which words occur in a source file) are stored per content hash as
+    one row per tested candidate, with whether it was found.
+    This knowledge is merged across runs: later lookups with a different
+    candidate set only have to test (and store) the candidates that were not tested before.
+    '''
+
+    # Per-process instances (SQLite connections can not be shared with forked processes).
+    _instances = {}
+
+    def __init__(self, cache_dir):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+            if version != CACHE_VERSION:
+                _log.info('Clearing cache %r: version %d instead of %d' % (self.path, version, CACHE_VERSION))
+                tables = [row[0] for row in self._connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+                for table in tables:
+                    self._connection.execute('DROP TABLE "%s"' % table)
+                self._connection.execute('PRAGMA user_version = %d' % CACHE_VERSION)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS css_selector_lines (hash TEXT PRIMARY KEY, selector_lines TEXT)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS matches (kind TEXT, hash TEXT, candidate TEXT, found INTEGER, PRIMARY KEY (kind, hash, candidate)) WITHOUT ROWID'
+            )
+
+    @classmethod
+    def get(cls, cache_dir):
+        '''
+        Get the (per-process) cache instance for given cache folder.
+        '''
+        key = (os.getpid(), cache_dir)
+        if key not in cls._instances:
+            cls._instances[key] = cls(cache_dir)
+        return cls._instances[key]
+
+    def close(self):
+        self._connection.close()
+
+    def css_selector_lines(self, css_file, extract):
+        '''
+        Get the selectors (and their line numbers) of a CSS file from cache,
+        or extract and store them.
+
+        @param css_file CSS file path
+        @param extract function to extract selectors from a CSS file,
+            as mapping of selectors to list of line numbers
+
+        @return mapping of CSS selectors to list of line numbers
+        '''
+        key = file_hash(css_file)
+        row = self._connection.execute('SELECT selector_lines FROM css_selector_lines WHERE hash = ?', (key,)).fetchone()
+        if row is not None:
+            _log.debug('Cache hit for selectors of %r' % css_file)
+            return json.loads(row[0])
+        selector_lines = extract(css_file)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO css_selector_lines (hash, selector_lines) VALUES (?, ?)',
+            (key, json.dumps(selector_lines, sort_keys=True))
+        )
+        return selector_lines
+
+    def _lookup(self, kind, key):
+        tested = set()
+        found = set()
+        for candidate, is_found in self._connection.execute('SELECT candidate, found FROM matches WHERE kind = ? AND hash = ?', (kind, key)):
+            tested.add(candidate)
+            if is_found:
+                found.add(candidate)
+        return tested, found
+
+    def match(self, kind, key, candidates, match):
+        '''
+        Find the subset of candidates that match with a (file) content,
+        using cached results where possible.
+
+        @param kind kind of matching (e.g. 'dom' or 'words')
+        @param key content hash of the file to match against
+        @param candidates set of candidates (strings) to match
+        @param match function that finds the matching subset of given candidates
+
+        @return set of matching candidates
+        '''
+        tested, found = self._lookup(kind, key)
+        untested = candidates.difference(tested)
+        result = candidates.intersection(found)
+        _log.debug('Cache for %s %s: %d of %d candidates already tested' % (kind, key, len(candidates) - len(untested), len(candidates)))
+        if untested:
+            new_found = match(untested)
+            result.update(new_found)
+            # Only store the newly tested candidates (other processes working on the same content
+            # might have stored some of them in the meantime, with the same result).
+            with self._connection:
+                self._connection.execute('BEGIN IMMEDIATE')
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO matches (kind, hash, candidate, found) VALUES (?, ?, ?, ?)',
+                    ((kind, key, candidate, candidate in new_found) for candidate in untested)
+                )
+        return result
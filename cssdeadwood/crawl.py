@@ -0,0 +1,309 @@
+
+import os
+import asyncio
+import logging
+import threading
+import collections
+import http.client
+import urllib.parse
+import concurrent.futures
+
+import lxml.html
+import lxml.etree
+
+
+_log = logging.getLogger('cssdeadwood.crawl')
+
+
+class CrawlError(Exception):
+    pass
+
+
+# Content types of HTML pages (an empty one included, for servers that do not send one).
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', '')
+
+
+def _content_type(response):
+    return (response.getheader('Content-Type') or '').split(';')[0].strip().lower()
+
+
+class ConnectionPool(object):
+    '''
+    Thread-safe pool of persistent (keep-alive) HTTP(S) connections, per host,
+    for blocking GET requests.
+    '''
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _acquire(self, key):
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop()
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        elif scheme == 'http':
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        raise CrawlError('Unsupported URL scheme %r' % scheme)
+
+    def _release(self, key, connection):
+        with self._lock:
+            self._idle[key].append(connection)
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def _request(self, url, content_types=None):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        # An idle connection might have been closed by the server in the meantime,
+        # so retry once with a fresh connection.
+        for attempt in range(2):
+            connection = self._acquire(key)
+            try:
+                connection.request('GET', path, headers={'User-Agent': 'cssdeadwood'})
+                response = connection.getresponse()
+                if response.status == 200 and content_types is not None and _content_type(response) not in content_types:
+                    # Do not download the body, but drop the connection.
+                    connection.close()
+                    return response, None
+                body = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if attempt > 0:
+                    raise
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            return response, body
+
+    def fetch(self, url, content_types=None):
+        '''
+        Fetch an URL. Redirects are not followed, but returned as redirect URL.
+
+        @param content_types optional list of content types to accept:
+            the body of other content is not downloaded (and returned as None)
+
+        @return (redirect URL or None, content type, body as bytes)
+        '''
+        response, body = self._request(url, content_types=content_types)
+        if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+            return urllib.parse.urljoin(url, response.getheader('Location')), None, None
+        if response.status != 200:
+            raise CrawlError('HTTP status %d for %r' % (response.status, url))
+        return None, _content_type(response), body
+
+
+def _normalize_url(url):
+    '''Strip fragment from URL (for deduplication).'''
+    return urllib.parse.urldefrag(url)[0]
+
+
+def extract_resources(html, url):
+    '''
+    Extract the resources referenced from a HTML page.
+
+    @param html HTML page as bytes
+    @param url URL of the page (to resolve relative URLs against)
+
+    @return (list of link URLs, list of stylesheet URLs, list of inline style sheets)
+    '''
+    try:
+        doc = lxml.html.document_fromstring(html, base_url=url)
+    except (lxml.etree.ParserError, ValueError):
+        return [], [], []
+    doc.resolve_base_href()
+    doc.make_links_absolute(url)
+    links = [_normalize_url(a.get('href')) for a in doc.iter('a') if a.get('href')]
+    stylesheets = [
+        _normalize_url(link.get('href')) for link in doc.iter('link')
+        if link.get('href') and 'stylesheet' in (link.get('rel') or '').lower().split()
+    ]
+    styles = [style.text for style in doc.iter('style') if style.text and style.text.strip()]
+    return links, stylesheets, styles
+
+
+class CrawlResult(object):
+    '''
+    Resources found by a crawl: HTML pages, (linked) style sheets
+    and inline style sheets, as mappings of URL (or label) to content.
+
+    Identical inline style sheets are only stored once, labeled after the first page containing them.
+    '''
+
+    def __init__(self):
+        self.pages = collections.OrderedDict()
+        self.stylesheets = collections.OrderedDict()
+        self.inline_styles = collections.OrderedDict()
+        # Mapping of inline style sheet label to list of URLs of the pages containing it.
+        self.inline_style_pages = collections.OrderedDict()
+        self.errors = {}
+        # Mapping of inline style sheet content to label.
+        self._inline_labels = {}
+
+    def add_inline_style(self, css, url, index):
+        '''
+        Add an inline style sheet of a page (if not already found on another page).
+
+        @param css content of the <style> element
+        @param url URL of the page
+        @param index (1-based) index of the <style> element in the page
+
+        @return label of the inline style sheet
+        '''
+        label = self._inline_labels.get(css)
+        if label is None:
+            label = '%s <style #%d>' % (url, index)
+            self.inline_styles[label] = css
+            self.inline_style_pages[label] = []
+            self._inline_labels[css] = label
+        if url not in self.inline_style_pages[label]:
+            self.inline_style_pages[label].append(url)
+        return label
+
+    def save(self, path):
+        '''
+        Save the crawled resources as files in given folder,
+        for further processing by the analysis pipeline.
+
+        @return (mapping of HTML file paths to URLs, mapping of CSS file paths to URLs/labels)
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        html_files = collections.OrderedDict()
+        css_files = collections.OrderedDict()
+        for i, (url, content) in enumerate(self.pages.items()):
+            file_name = os.path.join(path, 'page%05d.html' % i)
+            with open(file_name, 'wb') as f:
+                f.write(content)
+            html_files[file_name] = url
+        for i, (label, content) in enumerate(list(self.stylesheets.items()) + list(self.inline_styles.items())):
+            file_name = os.path.join(path, 'style%05d.css' % i)
+            with open(file_name, 'wb') as f:
+                f.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+            css_files[file_name] = label
+        return html_files, css_files
+
+
+class Crawler(object):
+    '''
+    Concurrent crawler of a (local) site: starting from given URLs, follow links
+    to HTML pages on the same host(s) and collect linked and inline style sheets.
+    '''
+
+    def __init__(self, start_urls, max_pages=100, concurrency=8, timeout=30):
+        '''
+        @param start_urls list of URLs to start crawling from
+        @param max_pages maximum number of HTML pages to fetch (page budget)
+        @param concurrency maximum number of concurrent requests
+        @param timeout request timeout in seconds
+        '''
+        self.start_urls = [_normalize_url(u) for u in start_urls]
+        self.hosts = set(urllib.parse.urlsplit(u).netloc for u in self.start_urls)
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.pool = ConnectionPool(timeout=timeout)
+
+    def _in_scope(self, url):
+        parts = urllib.parse.urlsplit(url)
+        return parts.scheme in ('http', 'https') and parts.netloc in self.hosts
+
+    def crawl(self):
+        '''
+        Run the crawl.
+
+        @return CrawlResult
+        '''
+        loop = asyncio.new_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            return loop.run_until_complete(self._crawl(loop, executor))
+        finally:
+            executor.shutdown()
+            self.pool.close()
+            loop.close()
+
+    async def _crawl(self, loop, executor):
+        result = CrawlResult()
+        queue = asyncio.Queue()
+        # URLs that were already queued (pages and stylesheets).
+        seen = set()
+        # Number of HTML pages that can still be accepted: links (e.g. to other kinds
+        # of documents or redirects) only cost budget when they turn out to be HTML pages.
+        budget = [self.max_pages]
+
+        def enqueue(url, kind):
+            if url in seen or not self._in_scope(url):
+                return
+            if kind == 'page' and budget[0] <= 0:
+                return
+            seen.add(url)
+            queue.put_nowait((url, kind))
+
+        async def worker():
+            while True:
+                url, kind = await queue.get()
+                try:
+                    await process(url, kind)
+                except Exception as e:
+                    _log.warning('Failed to fetch %r: %s' % (url, e))
+                    result.errors[url] = str(e)
+                finally:
+                    queue.task_done()
+
+        async def process(url, kind):
+            if kind == 'page' and budget[0] <= 0:
+                return
+            content_types = HTML_CONTENT_TYPES if kind == 'page' else None
+            redirect, content_type, body = await loop.run_in_executor(executor, self.pool.fetch, url, content_types)
+            if redirect:
+                _log.debug('Redirect from %r to %r' % (url, redirect))
+                enqueue(_normalize_url(redirect), kind)
+                return
+            if kind == 'stylesheet':
+                _log.debug('Fetched stylesheet %r' % url)
+                result.stylesheets[url] = body
+                return
+            if content_type not in HTML_CONTENT_TYPES:
+                _log.debug('Skipping %r with content type %r' % (url, content_type))
+                return
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+            _log.info('Fetched page %r' % url)
+            result.pages[url] = body
+            links, stylesheets, styles = extract_resources(body, url)
+            for stylesheet in stylesheets:
+                enqueue(stylesheet, 'stylesheet')
+            for i, style in enumerate(styles):
+                result.add_inline_style(style, url, i + 1)
+            for link in links:
+                enqueue(link, 'page')
+
+        for url in self.start_urls:
+            enqueue(url, 'page')
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        await queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return result
+
+
+def crawl(start_urls, max_pages=100, concurrency=8, timeout=30):
+    '''
+    Crawl a site, starting from given URLs (see Crawler).
+
+    @return CrawlResult
+    '''
+    return Crawler(start_urls, max_pages=max_pages, concurrency=concurrency, timeout=timeout).crawl()
@@ -2,10 +2,229 @@
 import re
 import collections
 
-from cssdeadwood.utils import file_get_contents
+import cssselect
 
 
 
+# Chunk size (in characters) for reading CSS files.
+CSS_CHUNK_SIZE = 64 * 1024
+
+# At-rules that contain (nested) style rules, instead of declarations.
+NESTED_RULES_AT_RULES = set(['media', 'supports', 'document', '-moz-document', 'layer', 'container', 'scope', 'starting-style'])
+
+# Precompiled regexes for tokenizing CSS in a "rule list" context (e.g. top level or in a @media block):
+# we are collecting selectors (or at-rule preludes) in front of "{".
+_REGEX_RULES_TOKEN = re.compile(r'''
+    (?P<text>[^{}()\[\];,"'/\\]+)
+    | (?P<comment>/\*.*?\*/)
+    | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<escape>\\.)
+    | (?P<char>[{}()\[\];,/])
+''', flags=re.DOTALL | re.VERBOSE)
+# ... and in a context we just want to skip (e.g. declaration blocks): only braces matter.
+_REGEX_SKIP_TOKEN = re.compile(r'''
+    (?P<text>[^{}"'/\\]+)
+    | (?P<comment>/\*.*?\*/)
+    | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<escape>\\.)
+    | (?P<char>[{}/])
+''', flags=re.DOTALL | re.VERBOSE)
+_REGEX_WHITESPACE = re.compile(r'\s+', flags=re.DOTALL)
+_REGEX_AT_RULE_NAME = re.compile(r'@([-\w]+)')
+_REGEX_IMPORT = re.compile(r'''@import\s*(?:url\(\s*)?(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)'|([^\s'"()]+))''', flags=re.IGNORECASE)
+
+
+class CssSelectorParser(object):
+    '''
+    Incremental CSS tokenizer to extract the selectors of style rules,
+    from CSS fed in chunks (so that large CSS files can be processed with bounded memory).
+
+    Handles comments, strings, escapes, nested at-rules (e.g. @media, @supports)
+    and commas inside functional pseudo-classes (e.g. ":not(a, b)") or attribute selectors.
+    Blocks of other at-rules (e.g. @font-face, @keyframes) are skipped.
+
+    Usage: call feed() for each chunk of CSS and close() at the end.
+    Both return a list of (selector, line number) tuples of the selectors
+    that were completed. The URLs of @import rules are collected in `imports`.
+    '''
+
+    def __init__(self):
+        # URLs of the @import rules encountered so far.
+        self.imports = []
+        # Whether a rule (other than @charset or @import) was seen:
+        # later @import rules are invalid.
+        self._rules_seen = False
+        # Unprocessed CSS
+        self._buffer = ''
+        # Line number at given position in buffer.
+        self._line = 1
+        self._line_pos = 0
+        # Number of open at-rule blocks containing rules.
+        self._rules_depth = 0
+        # Brace depth in the block we are skipping (0 if not skipping).
+        self._skip_depth = 0
+        self._reset_prelude()
+
+    def _reset_prelude(self):
+        # Completed selectors (selector, line) in the current prelude
+        self._selectors = []
+        # Fragments and start line of the selector being collected
+        self._fragments = []
+        self._fragments_line = None
+        # Parenthesis/bracket nesting level
+        self._nesting = 0
+        self._is_at_rule = None
+
+    def _line_at(self, pos):
+        self._line += self._buffer.count('\n', self._line_pos, pos)
+        self._line_pos = pos
+        return self._line
+
+    def _add_fragment(self, fragment, pos):
+        if self._fragments_line is None:
+            stripped = fragment.lstrip()
+            if not stripped:
+                return
+            if self._is_at_rule is None:
+                self._is_at_rule = not self._selectors and stripped.startswith('@')
+            self._fragments_line = self._line_at(pos + len(fragment) - len(stripped))
+        self._fragments.append(fragment)
+
+    def _end_selector(self):
+        if self._fragments_line is not None:
+            selector = _REGEX_WHITESPACE.sub(' ', ''.join(self._fragments).strip())
+            self._selectors.append((selector, self._fragments_line))
+        self._fragments = []
+        self._fragments_line = None
+
+    def _start_block(self):
+        '''Handle "{" in a rule list context.'''
+        found = []
+        self._rules_seen = True
+        if self._is_at_rule:
+            match = _REGEX_AT_RULE_NAME.match(''.join(self._fragments).strip())
+            if match and match.group(1).lower() in NESTED_RULES_AT_RULES:
+                self._rules_depth += 1
+            else:
+                self._skip_depth = 1
+        else:
+            self._end_selector()
+            found = self._selectors
+            # Skip the declaration block.
+            self._skip_depth = 1
+        self._reset_prelude()
+        return found
+
+    def _process(self, final):
+        buffer = self._buffer
+        size = len(buffer)
+        pos = 0
+        found = []
+        while pos < size:
+            skipping = self._skip_depth > 0
+            match = (_REGEX_SKIP_TOKEN if skipping else _REGEX_RULES_TOKEN).match(buffer, pos)
+            if match is None or (match.group() == '/' and (buffer.startswith('*', pos + 1) or (pos + 1 == size and not final))):
+                # Incomplete token (unterminated string or comment or trailing backslash):
+                # wait for more data, or just drop it at the end.
+                if final:
+                    pos = size
+                break
+            kind = match.lastgroup
+            token = match.group()
+            if skipping:
+                if token == '{':
+                    self._skip_depth += 1
+                elif token == '}':
+                    self._skip_depth -= 1
+            elif kind == 'comment':
+                pass
+            elif kind != 'char' or token == '/':
+                self._add_fragment(token, pos)
+            elif token == '{':
+                found.extend(self._start_block())
+            elif token == '}':
+                # End of an at-rule block (or a stray "}")
+                self._rules_depth = max(0, self._rules_depth - 1)
+                self._reset_prelude()
+            elif token == ';':
+                # End of statement at-rule (e.g. @import) or invalid prelude.
+                if self._is_at_rule and not self._rules_seen:
+                    import_match = _REGEX_IMPORT.match(''.join(self._fragments).strip())
+                    if import_match:
+                        self.imports.append(next(g for g in import_match.groups() if g is not None))
+                self._reset_prelude()
+            elif token == ',' and self._nesting == 0 and not self._is_at_rule:
+                self._end_selector()
+            else:
+                if token in '([':
+                    self._nesting += 1
+                elif token in ')]':
+                    self._nesting = max(0, self._nesting - 1)
+                self._add_fragment(token, pos)
+            pos = match.end()
+        # Keep unprocessed data.
+        self._line_at(pos)
+        self._buffer = buffer[pos:]
+        self._line_pos = 0
+        return found
+
+    def feed(self, css):
+        '''
+        Feed a chunk of CSS.
+
+        @return list of (selector, line number) tuples
+        '''
+        self._buffer += css
+        return self._process(final=False)
+
+    def close(self):
+        '''
+        Finish parsing.
+
+        @return list of (selector, line number) tuples
+        '''
+        return self._process(final=True)
+
+
+def iter_css_selectors(css_file, chunk_size=CSS_CHUNK_SIZE):
+    '''
+    Extract CSS selectors from a given CSS file, reading it in chunks.
+
+    @param css_file CSS file path
+
+    @return generator of (selector, line number) tuples
+    '''
+    parser = CssSelectorParser()
+    with open(css_file) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            for item in parser.feed(chunk):
+                yield item
+    for item in parser.close():
+        yield item
+
+
+def extract_css_imports(css_file, chunk_size=CSS_CHUNK_SIZE):
+    '''
+    Extract the URLs of the @import rules of a given CSS file.
+    As @import rules must precede all other rules, reading stops at the first style rule.
+
+    @param css_file CSS file path
+
+    @return list of URLs (as written in the CSS file)
+    '''
+    parser = CssSelectorParser()
+    with open(css_file) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk or parser.feed(chunk):
+                break
+    parser.close()
+    return parser.imports
+
+
 def extract_css_selectors(css_file):
     '''
     Extract CSS selectors from a given CSS file.
@@ -14,34 +233,83 @@ def extract_css_selectors(css_file):
 
     @return set of CSS selectors
     '''
-    selectors = set()
-    css = file_get_contents(css_file)
-    # Precompiled regex to clean up/normalize whitespace
-    whitespace_regex = re.compile(r'\s+', flags=re.DOTALL)
-    # Remove comments.
-    css = re.compile(r'/\*.*?\*/', flags=re.DOTALL).sub('', css)
-    # Collect the selectors/selector groups in front of { ... } declaration blocks
-    for match in re.compile(r'\s*([^{}]*)\s*{', flags=re.DOTALL).finditer(css):
-        selector_part = match.group(1).strip()
-        # Ignore at-rules
-        if selector_part.startswith('@'):
-            continue
-        # Split on comma to get selectors.
-        for selector_candidate in selector_part.split(','):
-            # Clean up/normalize whitespace
-            selector_candidate = whitespace_regex.sub(' ', selector_candidate.strip())
-            # Store
-            selectors.add(selector_candidate)
+    return set(selector for (selector, line) in iter_css_selectors(css_file))
+
 
-    return selectors
+def extract_css_selector_lines(css_file):
+    '''
+    Extract CSS selectors, with the line numbers they appear on, from a given CSS file.
 
+    @param css_file CSS file path
 
+    @return mapping of CSS selectors to sorted list of line numbers
+    '''
+    lines = collections.defaultdict(list)
+    for selector, line in iter_css_selectors(css_file):
+        lines[selector].append(line)
+    return dict((selector, sorted(set(l))) for (selector, l) in lines.items())
 
 
 
-# Some precompiled regexes to extract ids and clasess from CSS selectors.
-REGEX_ID = re.compile(r'\#([a-zA-Z0-9]+)')
-REGEX_CLASS = re.compile(r'\.([a-zA-Z0-9]+)')
+
+
+# Some precompiled regexes to extract ids and clasess from CSS selectors
+# (fallback for selectors that cssselect can not parse).
+REGEX_ID = re.compile(r'\#((?:[-\w]|\\.)+)')
+REGEX_CLASS = re.compile(r'\.((?:[-\w]|\\.)+)')
+_REGEX_ESCAPE = re.compile(r'\\(.)')
+# Selectors without attribute selectors, functional pseudo-classes, strings or escapes,
+# for which the regexes above are exact (and much faster than parsing).
+_REGEX_COMPLEX_SELECTOR = re.compile(r'[\[(\\"\']')
+
+
+def _iter_parsed_nodes(tree):
+    '''
+    Iterate over the nodes of a cssselect parse tree,
+    including those in functional pseudo-classes like :not() and :is().
+    '''
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, cssselect.parser.Selector):
+            node = node.parsed_tree
+        yield node
+        for attribute in ('selector', 'subselector'):
+            child = getattr(node, attribute, None)
+            if child is not None and not isinstance(child, str):
+                stack.append(child)
+        stack.extend(getattr(node, 'selector_list', None) or [])
+        # Relative selectors of :has(), as (combinator, selector) tuples.
+        for argument in getattr(node, 'arguments', None) or []:
+            if isinstance(argument, tuple):
+                argument = argument[-1]
+            if isinstance(argument, cssselect.parser.Selector):
+                stack.append(argument)
+
+
+def selector_ids_and_classes(selector):
+    '''
+    Extract the ids and classes used in a CSS selector.
+
+    @return (list of ids, list of classes)
+    '''
+    if not _REGEX_COMPLEX_SELECTOR.search(selector):
+        return REGEX_ID.findall(selector), REGEX_CLASS.findall(selector)
+    ids = []
+    classes = []
+    try:
+        trees = cssselect.parse(selector)
+    except cssselect.SelectorError:
+        ids = [_REGEX_ESCAPE.sub(r'\1', id) for id in REGEX_ID.findall(selector)]
+        classes = [_REGEX_ESCAPE.sub(r'\1', classs) for classs in REGEX_CLASS.findall(selector)]
+        return ids, classes
+    for tree in trees:
+        for node in _iter_parsed_nodes(tree):
+            if isinstance(node, cssselect.parser.Hash):
+                ids.append(node.id)
+            elif isinstance(node, cssselect.parser.Class):
+                classes.append(node.class_name)
+    return ids, classes
 
 
 def extract_ids_and_classes_from_selectors(selectors):
@@ -58,11 +326,11 @@ def extract_ids_and_classes_from_selectors(selectors):
     classes = set()
     origins = collections.defaultdict(lambda: [])
     for selector in selectors:
-        for id in REGEX_ID.findall(selector):
+        selector_ids, selector_classes = selector_ids_and_classes(selector)
+        for id in set(selector_ids):
             ids.add(id)
             origins['#' + id].append(selector)
-        for classs in REGEX_CLASS.findall(selector):
+        for classs in set(selector_classes):
             classes.add(classs)
             origins['.' + classs].append(selector)
     return (ids, classes, origins)
-
@@ -0,0 +1,119 @@
+
+import os
+import logging
+import collections
+import urllib.parse
+
+from cssdeadwood.css_extract import CssSelectorParser, extract_css_selector_lines, extract_css_imports
+
+
+_log = logging.getLogger('cssdeadwood.discover')
+
+
+def resolve_reference(href, base_file, site_root=None):
+    '''
+    Resolve a (relative) URL reference in a local HTML or CSS file to a local file path.
+
+    @param href URL reference (e.g. "../css/style.css?v=2")
+    @param base_file file containing the reference
+    @param site_root folder to resolve root-relative references (e.g. "/css/style.css") against
+
+    @return file path, or None if it can not be resolved to a local file (e.g. external URL)
+    '''
+    parts = urllib.parse.urlsplit(href.strip())
+    if parts.scheme or parts.netloc or not parts.path:
+        return None
+    path = urllib.parse.unquote(parts.path)
+    if path.startswith('/'):
+        if site_root is None:
+            return None
+        return os.path.normpath(os.path.join(site_root, path.lstrip('/')))
+    return os.path.normpath(os.path.join(os.path.dirname(base_file), path))
+
+
+class StylesheetRegistry(object):
+    '''
+    Registry of the style sheets referenced by HTML pages (linked with <link rel="stylesheet">,
+    inline <style> elements and their @import rules), where each distinct
+    style sheet is loaded only once.
+
+    Style sheets are identified by their file path, or for inline style sheets,
+    by a label referring to the first page containing it.
+    '''
+
+    def __init__(self, site_root=None, extract=extract_css_selector_lines):
+        '''
+        @param site_root folder to resolve root-relative references against
+        @param extract function to extract selectors from a CSS file,
+            as mapping of selectors to list of line numbers
+        '''
+        self.site_root = site_root
+        self.extract = extract
+        # Mapping of style sheet key to selector lines.
+        self.selector_lines = collections.OrderedDict()
+        # Mapping of style sheet key to resolved @import references.
+        self._imports = {}
+        # Mapping of inline style sheet content to key.
+        self._inline_keys = {}
+
+    def _add_imports(self, key, imports, base_file, keys):
+        for href in imports:
+            path = resolve_reference(href, base_file, self.site_root)
+            if path is None:
+                _log.warning('Skipping @import %r from %r: not a local file.' % (href, key))
+            else:
+                self._add_file(path, keys)
+
+    def _add_file(self, path, keys):
+        if path in keys:
+            return
+        if path not in self.selector_lines:
+            if not os.path.isfile(path):
+                _log.warning('Style sheet %r not found.' % path)
+                return
+            _log.info('Loading CSS selectors from %r' % path)
+            self.selector_lines[path] = self.extract(path)
+            self._imports[path] = extract_css_imports(path)
+        keys.append(path)
+        self._add_imports(path, self._imports[path], path, keys)
+
+    def _add_inline(self, css, html_file, index, keys):
+        key = self._inline_keys.get(css)
+        if key is None:
+            key = '%s <style #%d>' % (html_file, index)
+            parser = CssSelectorParser()
+            lines = collections.defaultdict(list)
+            for selector, line in parser.feed(css) + parser.close():
+                lines[selector].append(line)
+            self.selector_lines[key] = dict((s, sorted(set(l))) for (s, l) in lines.items())
+            self._imports[key] = parser.imports
+            self._inline_keys[css] = key
+        if key not in keys:
+            keys.append(key)
+            self._add_imports(key, self._imports[key], html_file, keys)
+
+    def page_stylesheets(self, html_element, html_file):
+        '''
+        Discover (and load) the style sheets used by a HTML page.
+
+        @param html_element root element of the parsed HTML page
+        @param html_file path of the HTML file (to resolve relative references against)
+
+        @return list of style sheet keys
+        '''
+        keys = []
+        inline_index = 0
+        for element in html_element.iter('link', 'style'):
+            if element.tag == 'link':
+                href = element.get('href')
+                if not href or 'stylesheet' not in (element.get('rel') or '').lower().split():
+                    continue
+                path = resolve_reference(href, html_file, self.site_root)
+                if path is None:
+                    _log.warning('Skipping style sheet %r from %r: not a local file (use --site-root for root-relative references).' % (href, html_file))
+                else:
+                    self._add_file(path, keys)
+            elif element.text and element.text.strip():
+                inline_index += 1
+                self._add_inline(element.text, html_file, inline_index, keys)
+        return keys
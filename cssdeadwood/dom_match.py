@@ -1,11 +1,19 @@
 
+import io
+import os
+import re
+import time
+import functools
 import logging
+import collections
 
 import lxml
 import lxml.etree
 import lxml.cssselect
 import cssselect
 
+from cssdeadwood import bitset
+
 
 # Global logging object
 _log = logging.getLogger('cssdeadwood.dom_match')
@@ -18,8 +26,14 @@ class CssDeadwoodHtmlTranslator(cssselect.HTMLTranslator):
     Simple extension of cssselect.HTMLTranslator to make sure that
     pseudo classes like :hover, :focus, :visited, etc always match,
     which is what we want in a dead code detection app.
+    Vendor-prefixed pseudo-classes (e.g. ":-moz-focusring") always match too.
     '''
 
+    def xpath_pseudo(self, pseudo):
+        if pseudo.ident.startswith('-'):
+            return self.xpath(pseudo.selector)
+        return super().xpath_pseudo(pseudo)
+
     def pseudo_always_matches(self, xpath):
         """Common implementation for pseudo-classes that alwyas match."""
         return xpath
@@ -33,60 +47,1202 @@ class CssDeadwoodHtmlTranslator(cssselect.HTMLTranslator):
     xpath_enabled_pseudo = pseudo_always_matches
     xpath_disabled_pseudo = pseudo_always_matches
     xpath_checked_pseudo = pseudo_always_matches
+    xpath_focus_visible_pseudo = pseudo_always_matches
+    xpath_focus_within_pseudo = pseudo_always_matches
+
+
+# Pseudo-classes that CssDeadwoodHtmlTranslator makes always match.
+ALWAYS_MATCHING_PSEUDO_CLASSES = frozenset([
+    'link', 'visited', 'hover', 'active', 'focus', 'target', 'enabled', 'disabled', 'checked',
+    'focus-visible', 'focus-within',
+])
 
 
-def match_selectors_against_html_root_element(selectors, html_element):
+def is_always_matching_pseudo_class(ident):
+    '''Check if a pseudo-class always matches (see CssDeadwoodHtmlTranslator).'''
+    ident = ident.lower()
+    return ident in ALWAYS_MATCHING_PSEUDO_CLASSES or ident.startswith('-')
+
+
+class SelectorRequirements(object):
+    '''
+    Tag names, ids, classes and attribute names that must be present
+    in a document for a (parsed) CSS selector to have a chance to match.
     '''
-    Find the selectors that match with the DOM from the given HTML.
 
-    @param selectors set of CSS selectors (strings)
-    @param html_element lxml.etree.Element object
+    __slots__ = ('tags', 'ids', 'classes', 'attributes')
 
-    @return set of found selectors
+    def __init__(self, parsed_tree):
+        tags = set()
+        ids = set()
+        classes = set()
+        attributes = set()
+        # Walk the "positive" parts of the cssselect parse tree
+        # (e.g. skip the argument of :not() and the alternatives of :is()).
+        todo = [parsed_tree]
+        while todo:
+            tree = todo.pop()
+            if isinstance(tree, cssselect.parser.CombinedSelector):
+                todo.extend([tree.selector, tree.subselector])
+                continue
+            if isinstance(tree, cssselect.parser.Element):
+                if tree.element and tree.element != '*':
+                    tags.add(tree.element.lower())
+            elif isinstance(tree, cssselect.parser.Class):
+                classes.add(tree.class_name)
+            elif isinstance(tree, cssselect.parser.Hash):
+                ids.add(tree.id)
+            elif isinstance(tree, cssselect.parser.Attrib) and tree.operator != '!=':
+                # Note that "[attr!=value]" also matches elements without that attribute.
+                attributes.add(tree.attrib.lower())
+            if getattr(tree, 'selector', None) is not None:
+                todo.append(tree.selector)
+        self.tags = frozenset(tags)
+        self.ids = frozenset(ids)
+        self.classes = frozenset(classes)
+        self.attributes = frozenset(attributes)
+
+
+class DocumentIndex(object):
+    '''
+    Tag names, ids, classes and attribute names present in a DOM (sub)tree,
+    collected in one tree walk.
+    '''
+
+    __slots__ = ('tags', 'ids', 'classes', 'attributes')
+
+    def __init__(self, html_element):
+        self.tags = set()
+        self.ids = set()
+        self.classes = set()
+        self.attributes = set()
+        for element in html_element.iter(lxml.etree.Element):
+            self.tags.add(element.tag)
+            attrib = element.attrib
+            if attrib:
+                self.attributes.update(attrib.keys())
+                if 'class' in attrib:
+                    self.classes.update(attrib['class'].split())
+                if 'id' in attrib:
+                    self.ids.add(attrib['id'])
+
+    def could_match(self, requirements):
+        '''
+        Check if a selector with given requirements could match with the document.
+        '''
+        return (
+            requirements.ids.issubset(self.ids)
+            and requirements.classes.issubset(self.classes)
+            and requirements.tags.issubset(self.tags)
+            and requirements.attributes.issubset(self.attributes)
+        )
+
+
+# Regex to find class and id attributes (and their values) in raw HTML bytes.
+_REGEX_RAW_CLASS_ID_ATTRIBUTE = re.compile(
+    br'''[\s"'/](class|id)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>][^\s>]*))''',
+    re.IGNORECASE
+)
+
+
+def _is_ascii(word):
+    try:
+        word.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+class RawDocumentIndex(object):
+    '''
+    Ids and classes mentioned in the class and id attributes of a HTML document,
+    collected with a regex scan of its raw bytes (without parsing it),
+    to reject selectors before paying for the DOM parse.
+
+    The scan is conservative: it finds a superset of the ids and classes in the DOM
+    (e.g. it also picks up attributes in comments and scripts).
+    Only ASCII ids and classes are checked, as non-ASCII ones depend on
+    the document encoding.
+    '''
+
+    __slots__ = ('ids', 'classes')
+
+    def __init__(self, ids, classes):
+        self.ids = ids
+        self.classes = classes
+
+    @classmethod
+    def scan(cls, html_bytes):
+        '''
+        @param html_bytes raw HTML document (bytes)
+
+        @return RawDocumentIndex, or None if the document can not be scanned reliably
+            (e.g. UTF-16 encoded, or with character references in class/id values)
+        '''
+        if b'\x00' in html_bytes:
+            return None
+        ids = set()
+        class_values = []
+        for name, double_quoted, single_quoted, unquoted in _REGEX_RAW_CLASS_ID_ATTRIBUTE.findall(html_bytes):
+            value = double_quoted or single_quoted or unquoted
+            if len(name) == 2:
+                ids.add(value)
+            else:
+                class_values.append(value)
+        class_values = b' '.join(class_values)
+        if b'&' in class_values or any(b'&' in value for value in ids):
+            return None
+        ids = set(value.decode('ascii', 'replace') for value in ids)
+        classes = set(_REGEX_XPATH_WHITESPACE.split(class_values.decode('ascii', 'replace')))
+        return cls(ids, classes)
+
+    def could_match(self, requirements):
+        '''
+        Check if a selector with given requirements could match with the document.
+        '''
+        return (
+            (requirements.ids.issubset(self.ids) or all(w in self.ids or not _is_ascii(w) for w in requirements.ids))
+            and (requirements.classes.issubset(self.classes) or all(w in self.classes or not _is_ascii(w) for w in requirements.classes))
+        )
+
+
+class UnsupportedSelector(Exception):
+    '''Selector construct that is not supported by the bulk matching engine.'''
+    pass
+
+
+# Precompiled regex to split class (and other whitespace separated) attribute values,
+# consistent with XPath normalize-space() as used in the cssselect translations.
+_REGEX_XPATH_WHITESPACE = re.compile(r'[ \t\n\r]+')
+
+
+def _split_attribute_value(value):
+    return [v for v in _REGEX_XPATH_WHITESPACE.split(value) if v]
+
+
+def _preceding_sibling_elements(element):
+    return element.itersiblings(lxml.etree.Element, preceding=True)
+
+
+def _following_sibling_elements(element):
+    return element.itersiblings(lxml.etree.Element)
+
+
+# Structural pseudo-class tests for the bulk matching engine.
+_STRUCTURAL_PSEUDO_CLASSES = {
+    'root': lambda e: e.getparent() is None,
+    'first-child': lambda e: next(_preceding_sibling_elements(e), None) is None,
+    'last-child': lambda e: next(_following_sibling_elements(e), None) is None,
+    'only-child': lambda e: next(_preceding_sibling_elements(e), None) is None and next(_following_sibling_elements(e), None) is None,
+    'first-of-type': lambda e: next(e.itersiblings(e.tag, preceding=True), None) is None,
+    'last-of-type': lambda e: next(e.itersiblings(e.tag), None) is None,
+    'only-of-type': lambda e: next(e.itersiblings(e.tag, preceding=True), None) is None and next(e.itersiblings(e.tag), None) is None,
+    'empty': lambda e: next(e.iterchildren(lxml.etree.Element), None) is None and not e.xpath('string()'),
+}
+
+# Structural pseudo-classes that look at the preceding or following sibling elements.
+_PRECEDING_SIBLING_PSEUDO_CLASSES = frozenset(['first-child', 'only-child', 'first-of-type', 'only-of-type', 'nth-child', 'nth-of-type'])
+_FOLLOWING_SIBLING_PSEUDO_CLASSES = frozenset(['last-child', 'only-child', 'last-of-type', 'only-of-type', 'nth-last-child', 'nth-last-of-type'])
+
+
+def _nth_test(name, a, b):
+    '''Build test for the ":nth-child(an+b)" family of pseudo-classes.'''
+    if name in ('nth-child', 'nth-last-child'):
+        siblings = lambda e: e.itersiblings(lxml.etree.Element, preceding=(name == 'nth-child'))
+    else:
+        siblings = lambda e: e.itersiblings(e.tag, preceding=(name == 'nth-of-type'))
+
+    def test(element):
+        n = 1 + sum(1 for _ in siblings(element))
+        if a == 0:
+            return n == b
+        return (n - b) % a == 0 and (n - b) // a >= 0
+
+    return test
+
+
+def _attribute_test(operator, expected):
+    '''Build attribute value test (like cssselect.HTMLTranslator translates it to XPath).'''
+    if operator == 'exists':
+        return lambda v: v is not None
+    elif operator == '=':
+        return lambda v: v == expected
+    elif operator == '!=':
+        return lambda v: v is None or v != expected
+    elif operator == '~=':
+        if not expected or re.search(r'[ \t\r\n\f]', expected):
+            return lambda v: False
+        return lambda v: v is not None and expected in _split_attribute_value(v)
+    elif operator == '|=':
+        return lambda v: v is not None and (v == expected or v.startswith(expected + '-'))
+    elif operator in ('^=', '$=', '*='):
+        if not expected:
+            return lambda v: False
+        if operator == '^=':
+            return lambda v: v is not None and v.startswith(expected)
+        elif operator == '$=':
+            return lambda v: v is not None and v.endswith(expected)
+        return lambda v: v is not None and expected in v
+    raise UnsupportedSelector(operator)
+
+
+class CompoundSelector(object):
+    '''
+    Compound selector (e.g. "div.nav#main:first-child"),
+    compiled for direct testing against lxml elements by the bulk matching engine.
+
+    In relaxed mode, unsupported constructs and tests that look at following
+    sibling elements are left out instead of raising UnsupportedSelector,
+    resulting in a necessary (but not sufficient) condition for a match:
+    the `exact` attribute tells if anything was left out.
+    '''
+
+    __slots__ = ('tag', 'ids', 'classes', 'attributes', 'tests', 'negations', 'exact', 'uses_preceding', 'uses_following')
+
+    def __init__(self, tree, relaxed=False):
+        self.tag = None
+        self.ids = []
+        self.classes = []
+        self.attributes = []
+        self.tests = []
+        self.negations = []
+        self.exact = True
+        # Whether the tests look at preceding or following sibling elements.
+        self.uses_preceding = False
+        self.uses_following = False
+        while tree is not None:
+            try:
+                if self._add(tree, relaxed):
+                    break
+            except UnsupportedSelector:
+                if not relaxed:
+                    raise
+                self.exact = False
+                if isinstance(tree, cssselect.parser.Element):
+                    break
+            tree = tree.selector
+
+    def _add(self, tree, relaxed):
+        '''Add the test of a node of the cssselect parse tree. Returns True at the element node.'''
+        if isinstance(tree, cssselect.parser.Element):
+            if tree.namespace:
+                raise UnsupportedSelector('namespace')
+            if tree.element and tree.element != '*':
+                self.tag = tree.element.lower()
+            return True
+        elif isinstance(tree, cssselect.parser.Class):
+            self.classes.append(tree.class_name)
+        elif isinstance(tree, cssselect.parser.Hash):
+            self.ids.append(tree.id)
+        elif isinstance(tree, cssselect.parser.Attrib):
+            if tree.namespace or getattr(tree, 'flag', None):
+                raise UnsupportedSelector('attribute namespace or flag')
+            # Depending on cssselect version, value is a string or a Token.
+            value = getattr(tree.value, 'value', tree.value)
+            self.attributes.append((tree.attrib.lower(), _attribute_test(tree.operator, value)))
+        elif isinstance(tree, cssselect.parser.Pseudo):
+            ident = tree.ident.lower()
+            if ident in _STRUCTURAL_PSEUDO_CLASSES:
+                self._add_structural_test(ident, _STRUCTURAL_PSEUDO_CLASSES[ident], relaxed)
+            elif not is_always_matching_pseudo_class(ident):
+                raise UnsupportedSelector(ident)
+        elif isinstance(tree, cssselect.parser.Function):
+            name = tree.name.lower()
+            if name not in ('nth-child', 'nth-last-child', 'nth-of-type', 'nth-last-of-type'):
+                raise UnsupportedSelector(name)
+            try:
+                a, b = cssselect.parser.parse_series(tree.arguments)
+            except Exception:
+                raise UnsupportedSelector(name)
+            self._add_structural_test(name, _nth_test(name, a, b), relaxed)
+        elif isinstance(tree, cssselect.parser.Negation):
+            if isinstance(tree.subselector, cssselect.parser.CombinedSelector):
+                raise UnsupportedSelector(':not() with combinator')
+            # A relaxed negation would not be a necessary condition, so only exact ones are kept.
+            negation = CompoundSelector(tree.subselector)
+            if relaxed and negation.uses_following:
+                raise UnsupportedSelector(':not() with following sibling test')
+            self.negations.append(negation)
+            self.uses_preceding = self.uses_preceding or negation.uses_preceding
+            self.uses_following = self.uses_following or negation.uses_following
+        else:
+            raise UnsupportedSelector(type(tree).__name__)
+        return False
+
+    def _add_structural_test(self, name, test, relaxed):
+        if name in _FOLLOWING_SIBLING_PSEUDO_CLASSES:
+            if relaxed:
+                raise UnsupportedSelector(name)
+            self.uses_following = True
+        if name in _PRECEDING_SIBLING_PSEUDO_CLASSES:
+            self.uses_preceding = True
+        self.tests.append(test)
+
+    def matches(self, element):
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        attrib = element.attrib
+        for id in self.ids:
+            if attrib.get('id') != id:
+                return False
+        if self.classes:
+            classes = _split_attribute_value(attrib.get('class', ''))
+            for classs in self.classes:
+                if classs not in classes:
+                    return False
+        for name, test in self.attributes:
+            if not test(attrib.get(name)):
+                return False
+        for test in self.tests:
+            if not test(element):
+                return False
+        for negation in self.negations:
+            if negation.matches(element):
+                return False
+        return True
+
+
+def _compile_chain(tree, relaxed=False):
+    '''
+    Compile a cssselect parse tree to a chain of (compound selector, combinator) tuples,
+    from right to left, where the combinator links the compound selector with the next one.
+    '''
+    chain = []
+    while isinstance(tree, cssselect.parser.CombinedSelector):
+        if tree.combinator not in (' ', '>', '+', '~'):
+            raise UnsupportedSelector(tree.combinator)
+        chain.append((CompoundSelector(tree.subselector, relaxed=relaxed), tree.combinator))
+        tree = tree.selector
+    chain.append((CompoundSelector(tree, relaxed=relaxed), None))
+    return tuple(chain)
+
+
+def _compile_stream_chain(tree, chain):
+    '''
+    Chain of compound selectors for the streaming matcher, which tests elements
+    as soon as they are complete (so without knowledge of their following siblings):
+    the exact chain if possible, otherwise the relaxed chain.
+
+    @return (chain or None, whether the chain is exact)
+    '''
+    if chain is not None and not any(compound.uses_following for compound, _ in chain):
+        return chain, True
+    try:
+        relaxed = _compile_chain(tree, relaxed=True)
+    except UnsupportedSelector:
+        return None, False
+    return relaxed, all(compound.exact for compound, _ in relaxed)
+
+
+def _uses_siblings(chain):
+    '''Check if a chain of compound selectors looks at (preceding) sibling elements.'''
+    return any(compound.uses_preceding or combinator in ('+', '~') for compound, combinator in chain)
+
+
+def _ancestor_keys(chain):
+    '''
+    Keys (tag name, "#id" or ".class") that must be present in the ancestors
+    of an element for it to match with the given chain of compound selectors:
+    the compound selectors that are linked to the right-most one
+    with descendant or child combinators only.
+    '''
+    keys = set()
+    for i in range(1, len(chain)):
+        if chain[i - 1][1] not in (' ', '>'):
+            break
+        compound = chain[i][0]
+        if compound.tag:
+            keys.add(compound.tag)
+        keys.update('#' + id for id in compound.ids)
+        keys.update('.' + classs for classs in compound.classes)
+    return tuple(keys)
+
+
+def _match_chain(element, chain, root, i=0):
+    '''
+    Check if given element matches with the chain of compound selectors (from given index),
+    where ancestors are only considered up to given root element.
+    '''
+    compound, combinator = chain[i]
+    if not compound.matches(element):
+        return False
+    if combinator is None:
+        return True
+    if combinator == ' ' or combinator == '>':
+        if element is root:
+            return False
+        for ancestor in element.iterancestors():
+            if _match_chain(ancestor, chain, root, i + 1):
+                return True
+            if combinator == '>' or ancestor is root:
+                return False
+        return False
+    elif combinator == '+':
+        previous = next(_preceding_sibling_elements(element), None)
+        return previous is not None and _match_chain(previous, chain, root, i + 1)
+    else:
+        for previous in _preceding_sibling_elements(element):
+            if _match_chain(previous, chain, root, i + 1):
+                return True
+        return False
+
+
+class CompiledSelector(object):
+    '''
+    CSS selector compiled to an XPath object, ready for evaluation
+    against a DOM tree, together with its requirements
+    and chain of compound selectors for the bulk matching engine
+    (None if not supported by that engine)
+    and for the streaming matcher (see _compile_stream_chain()),
+    and its key for subsumption checks (see _lattice_key()).
+    '''
+
+    __slots__ = (
+        'xpath', 'requirements', 'chain', 'ancestor_keys',
+        'stream_chain', 'stream_exact', 'stream_ancestor_keys', 'stream_uses_siblings',
+        'lattice_key',
+    )
+
+    def __init__(self, xpath, requirements, chain=None, stream_chain=None, stream_exact=False, lattice_key=None):
+        self.xpath = xpath
+        self.requirements = requirements
+        self.lattice_key = lattice_key
+        self.chain = chain
+        self.ancestor_keys = _ancestor_keys(chain) if chain else ()
+        self.stream_chain = stream_chain
+        self.stream_exact = stream_exact
+        self.stream_ancestor_keys = _ancestor_keys(stream_chain) if stream_chain else ()
+        self.stream_uses_siblings = _uses_siblings(stream_chain) if stream_chain else False
+
+
+# Maximum number of compiled selectors to keep in the compile_selector() cache.
+COMPILED_SELECTOR_CACHE_SIZE = 100000
+
+
+@functools.lru_cache(maxsize=COMPILED_SELECTOR_CACHE_SIZE)
+def compile_selector(selector_str):
+    '''
+    Compile a CSS selector string to XPath objects, ready for evaluation
+    against a DOM tree.
+
+    Compilation results are cached (keyed on the selector string),
+    so that parsing and translating each selector only happens once,
+    no matter how many HTML documents it is matched against.
+
+    @param selector_str CSS selector (string)
+
+    @return tuple of CompiledSelector objects (empty if selector could not be compiled)
     '''
-    found_selectors = set()
     css_to_xpath_translator = CssDeadwoodHtmlTranslator()
+    compiled = []
+    try:
+        # Instead of just calling css_to_xpath(selector_str),
+        # we first convert the css selector string to a cssselect.Selector instance
+        # to pass to selector_to_xpath(), so we can properly ignore pseudo elements.
+        # Note that cssselect.parse() always returns a list, so we do a for loop.
+        for selector in cssselect.parse(selector_str):
+            selector.pseudo_element = None
+            xpath_expr = css_to_xpath_translator.selector_to_xpath(selector)
+            try:
+                chain = _compile_chain(selector.parsed_tree)
+            except UnsupportedSelector:
+                chain = None
+            stream_chain, stream_exact = _compile_stream_chain(selector.parsed_tree, chain)
+            compiled.append(CompiledSelector(
+                lxml.etree.XPath(xpath_expr), SelectorRequirements(selector.parsed_tree),
+                chain, stream_chain, stream_exact, _lattice_key(selector.parsed_tree)
+            ))
+    except Exception:
+        _log.exception('Failed to compile CSS selector %r' % selector_str)
+        return ()
+    return tuple(compiled)
+
+
+@functools.lru_cache(maxsize=COMPILED_SELECTOR_CACHE_SIZE)
+def canonical_selector(selector_str):
+    '''
+    Canonical form of a CSS selector for matching: selectors that only differ
+    in pseudo-elements, always matching pseudo-classes (including vendor-prefixed ones),
+    letter case of tag names, etc. (e.g. "a:hover", "A:focus" and "a::before")
+    compile to the same XPath expressions and get the same canonical form.
+
+    @return canonical form (string), or None if the selector could not be compiled
+    '''
+    compiled = compile_selector(selector_str)
+    if not compiled:
+        return None
+    return ' | '.join(sorted(set(c.xpath.path for c in compiled)))
+
+
+def equivalent_selector_groups(selectors):
+    '''
+    Group selectors in equivalence classes of selectors with the same canonical form,
+    so that each class only has to be matched once.
+
+    @param selectors iterable of CSS selectors (strings)
+
+    @return dictionary mapping a representative selector of each class
+        to the list of all selectors in the class
+    '''
+    groups = {}
+    representatives = {}
+    for selector_str in selectors:
+        canonical = canonical_selector(selector_str)
+        if canonical is None:
+            groups[selector_str] = [selector_str]
+            continue
+        representative = representatives.get(canonical)
+        if representative is None:
+            representatives[canonical] = selector_str
+            groups[selector_str] = [selector_str]
+        else:
+            groups[representative].append(selector_str)
+    return groups
+
+
+class SelectorGroups(object):
+    '''
+    Equivalence classes (see equivalent_selector_groups()) of a fixed set of selectors,
+    computed once and addressed by selector id (index in a selector list),
+    for matching (shrinking) subsets of these selectors given as bitsets
+    (see cssdeadwood.bitset), e.g. the selectors that are unmatched so far.
+
+    Only the representatives of the classes are matched
+    and found representatives are expanded to the ids of their class,
+    so that the bookkeeping per document does not have to convert bitsets
+    to sets of selectors and back.
+    Bitsets should consist of whole classes, which is the case when
+    starting from all selectors and dropping found bitsets (see found_mask()).
+    '''
+
+    def __init__(self, selector_list, mask=None):
+        '''
+        @param selector_list list of selectors, indexed by selector id
+        @param mask optional bitset of the selectors to group (default: all selectors)
+        '''
+        self.selector_list = selector_list
+        if mask is None:
+            mask = bitset.full(len(selector_list))
+        ids = dict((selector_list[i], i) for i in bitset.iter_indices(mask))
+        groups = equivalent_selector_groups(ids)
+        # Mapping of representative selector to the ids of the selectors in its class.
+        self.members = dict((r, tuple(ids[s] for s in selectors)) for (r, selectors) in groups.items())
+        self.representatives_mask = bitset.from_indices((ids[r] for r in groups), len(selector_list))
+
+    def representatives(self, mask, stats=None):
+        '''
+        @param mask bitset of selectors
+        @param stats optional dictionary to add the number of 'equivalent_selectors'
+            (selectors not to match separately) to
+
+        @return list of the representative selectors of the classes in given bitset
+        '''
+        representatives_mask = mask & self.representatives_mask
+        if stats is not None:
+            _add_stat(stats, 'equivalent_selectors', bitset.count(mask) - bitset.count(representatives_mask))
+        return bitset.select(self.selector_list, representatives_mask)
+
+    def found_mask(self, found_selectors):
+        '''
+        @param found_selectors iterable of found representative selectors
+
+        @return bitset of the selectors in the classes of the found representatives
+        '''
+        members = self.members
+        return bitset.from_indices(i for selector_str in found_selectors for i in members[selector_str])
+
+
+def _fan_out(found_selectors, groups):
+    '''Expand found representative selectors to all selectors of their class.'''
+    return set(selector_str for representative in found_selectors for selector_str in groups[representative])
+
+
+# Available matching engines
+ENGINE_XPATH = 'xpath'
+ENGINE_BULK = 'bulk'
+ENGINES = (ENGINE_XPATH, ENGINE_BULK)
+
+
+def _add_stat(stats, key, value):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + value
+
+
+def _compound_words(tree):
+    '''
+    @return frozenset of the "words" (tag, ids, classes and attribute tests)
+        of a compound selector parse tree, or None if it contains other constructs
+    '''
+    words = []
+    while True:
+        if isinstance(tree, cssselect.parser.Element):
+            if tree.namespace:
+                return None
+            if tree.element and tree.element != '*':
+                words.append(('tag', tree.element.lower()))
+            return frozenset(words)
+        elif isinstance(tree, cssselect.parser.Class):
+            words.append(('class', tree.class_name))
+        elif isinstance(tree, cssselect.parser.Hash):
+            words.append(('id', tree.id))
+        elif isinstance(tree, cssselect.parser.Attrib):
+            if tree.namespace or getattr(tree, 'flag', None):
+                return None
+            words.append(('attribute', tree.attrib.lower(), tree.operator, getattr(tree.value, 'value', tree.value)))
+        elif not (isinstance(tree, cssselect.parser.Pseudo) and is_always_matching_pseudo_class(tree.ident)):
+            return None
+        tree = tree.selector
+
+
+def _lattice_key(tree):
+    '''
+    Key of a selector parse tree for subsumption checks (see _generalizes()).
+
+    @return tuple (compounds, combinators, words) with the tuple of compound selectors
+        (as frozensets of words, from right to left), the string of the combinators between them
+        and the frozenset of all words, or None if the selector has other constructs
+        (e.g. structural pseudo-classes or negations)
+    '''
+    compounds = []
+    combinators = ''
+    while isinstance(tree, cssselect.parser.CombinedSelector):
+        compounds.append(_compound_words(tree.subselector))
+        combinators += tree.combinator
+        tree = tree.selector
+    compounds.append(_compound_words(tree))
+    if None in compounds:
+        return None
+    return tuple(compounds), combinators, frozenset().union(*compounds)
+
+
+def _generalizes(general, specific):
+    '''
+    Check (conservatively) if every element matching a selector
+    also matches another one, e.g. ".item" or ".nav .active" for ".nav > ul .item.active".
+
+    @param general lattice key (see _lattice_key()) of the general selector
+    @param specific lattice key of the specific selector
+    '''
+    general_compounds, general_combinators, _ = general
+    specific_compounds, specific_combinators, _ = specific
+    # The subject compound must be more general.
+    if not general_compounds[0].issubset(specific_compounds[0]):
+        return False
+    if len(general_compounds) == 1:
+        return True
+    # Otherwise: a chain of descendant combinators, to embed in the chain of ancestors
+    # (the compounds linked to the subject with descendant or child combinators).
+    if general_combinators.strip(' '):
+        return False
+    ancestors = 1 + len(specific_combinators) - len(specific_combinators.lstrip(' >'))
+    j = 1
+    for compound in general_compounds[1:]:
+        while j < ancestors and not compound.issubset(specific_compounds[j]):
+            j += 1
+        if j >= ancestors:
+            return False
+        j += 1
+    return True
+
+
+class _Frontier(object):
+    '''
+    Subsumption bookkeeping for matching a set of selectors with a document,
+    to evaluate only a "frontier" of them:
+    selectors are evaluated from general to specific,
+    and when a selector does not match, the more specific ones are rejected,
+    when it matches, the more general ones are matched,
+    both without evaluation.
+    Only selectors with a single compiled form and a lattice key take part.
+    '''
+
+    def __init__(self, candidates):
+        '''
+        @param candidates list of (selector, tuple of CompiledSelector) tuples
+        '''
+        self.keys = {}
+        self.by_word = collections.defaultdict(list)
+        for selector_str, compiled in candidates:
+            if len(compiled) == 1 and compiled[0].lattice_key is not None:
+                key = self.keys[selector_str] = compiled[0].lattice_key
+                for word in key[2]:
+                    self.by_word[word].append(selector_str)
+        # Outcomes (True: matched, False: not matched) inferred without evaluation.
+        self.inferred = {}
+        self.evaluated = set()
+
+        def generality(candidate):
+            key = self.keys.get(candidate[0])
+            return (len(key[2]), len(key[0])) if key else (0, 0)
+        self.order = sorted(candidates, key=generality)
+
+    def record(self, selector_str, matched):
+        '''Record the outcome of an evaluation and infer the outcomes of related selectors.'''
+        self.evaluated.add(selector_str)
+        key = self.keys.get(selector_str)
+        if key is None or not key[2]:
+            return
+        keys = self.keys
+        if matched:
+            related = set()
+            for word in key[2]:
+                related.update(self.by_word[word])
+            related = (other for other in related if _generalizes(keys[other], key))
+        else:
+            rarest = min(key[2], key=lambda word: len(self.by_word[word]))
+            related = (other for other in self.by_word[rarest] if _generalizes(key, keys[other]))
+        for other in related:
+            if other not in self.evaluated and other not in self.inferred:
+                self.inferred[other] = matched
+
+
+def _match_xpath(selectors, html_element, stats=None, counts=None, index=None):
+    '''
+    XPath matching engine: evaluate the XPath expression of each selector.
+    If a counts dictionary is given, the number of matching elements
+    of each found selector is added to it.
+    Otherwise, outcomes are propagated between selectors that generalize
+    each other (see _Frontier), so that not every selector has to be evaluated.
+    A (reusable) DocumentIndex of the DOM can be given to avoid rebuilding it.
+    '''
+    found_selectors = set()
+    selector_times = stats.get('selector_times') if stats is not None else None
+    evaluations = 0
+    rejections = 0
+    if index is None:
+        index = DocumentIndex(html_element)
+    # Reject selectors with requirements that are not in the document.
+    candidates = []
     for selector_str in selectors:
+        compiled = compile_selector(selector_str)
+        possible = tuple(c for c in compiled if index.could_match(c.requirements))
+        rejections += len(compiled) - len(possible)
+        if possible:
+            candidates.append((selector_str, possible))
+    frontier = None
+    if counts is None and len(candidates) > 1:
+        frontier = _Frontier(candidates)
+        candidates = frontier.order
+    for selector_str, possible in candidates:
+        if frontier is not None and selector_str in frontier.inferred:
+            continue
+        if selector_times is not None:
+            start = time.perf_counter()
         try:
-            # Instead of just calling css_to_xpath(selector_str),
-            # we first convert the css selector string to a cssselect.Selector instance
-            # to pass to selector_to_xpath(), so we can properly ignore pseudo elements.
-            # Note that cssselect.parse() always returns a list, so we do a for loop.
-            for selector in cssselect.parse(selector_str):
-                selector.pseudo_element = None
-                xpath_expr = css_to_xpath_translator.selector_to_xpath(selector)
-                if len(html_element.xpath(xpath_expr)) > 0:
+            elements = set()
+            for compiled in possible:
+                evaluations += 1
+                result = compiled.xpath(html_element)
+                if len(result) > 0:
                     found_selectors.add(selector_str)
+                    if counts is None:
+                        break
+                    elements.update(result)
+            if elements:
+                counts[selector_str] = counts.get(selector_str, 0) + len(elements)
+            if frontier is not None:
+                frontier.record(selector_str, selector_str in found_selectors)
         except Exception:
-            global _log
             _log.exception('lxml css select failed on selector %r' % selector_str)
+        if selector_times is not None:
+            selector_times[selector_str] = selector_times.get(selector_str, 0.0) + time.perf_counter() - start
+    if frontier is not None:
+        found_selectors.update(s for (s, matched) in frontier.inferred.items() if matched)
+        _add_stat(stats, 'inferences', len(frontier.inferred))
+    _add_stat(stats, 'evaluations', evaluations)
+    _add_stat(stats, 'rejections', rejections)
+    return found_selectors
+
+
+class _DispatchTable(object):
+    '''
+    Dispatch table of selector entries, keyed on the id, class or tag
+    of the right-most compound selector (like browsers do).
+    '''
+
+    def __init__(self):
+        self.by_key = collections.defaultdict(list)
+        self.universal = []
+
+    def add(self, compound, entry):
+        if compound.ids:
+            self.by_key['#' + compound.ids[0]].append(entry)
+        elif compound.classes:
+            self.by_key['.' + compound.classes[0]].append(entry)
+        elif compound.tag:
+            self.by_key[compound.tag].append(entry)
+        else:
+            self.universal.append(entry)
+
+    def candidates(self, keys):
+        '''Lists of candidate entries for an element with given keys.'''
+        return [self.universal] + [self.by_key[k] for k in keys if k in self.by_key]
+
+
+def _element_keys(element):
+    '''Dispatch table keys (tag name, "#id" and ".class") of an element.'''
+    keys = [element.tag]
+    attrib = element.attrib
+    if attrib:
+        if 'id' in attrib:
+            keys.append('#' + attrib['id'])
+        if 'class' in attrib:
+            keys.extend(set('.' + c for c in _split_attribute_value(attrib['class'])))
+    return keys
+
+
+def _match_bulk(selectors, html_element, stats=None, counts=None):
+    '''
+    Bulk matching engine: walk the DOM tree once, look up the candidate selectors
+    for each element in a dispatch table (keyed on the id, class or tag of the
+    right-most compound selector, like browsers do) and only verify these.
+    Candidates are verified against the ancestors of the element
+    only if the required ids, classes and tags are present among these ancestors.
+    Selectors that are not supported by this engine are handled by the XPath engine.
+    If a counts dictionary is given, found selectors are not dropped after their
+    first match, but the number of matching elements is added to it.
+    '''
+    table = _DispatchTable()
+    unsupported = set()
+    remaining = set()
+    for selector_str in selectors:
+        compiled = compile_selector(selector_str)
+        if any(c.chain is None for c in compiled):
+            unsupported.add(selector_str)
+            continue
+        for c in compiled:
+            remaining.add(selector_str)
+            table.add(c.chain[0][0], (selector_str, c.chain, c.ancestor_keys))
+
+    found_selectors = set()
+    selector_times = stats.get('selector_times') if stats is not None else None
+    evaluations = 0
+    # Counts of the keys of the ancestors of the current element
+    # and stack of the keys of the current element and its ancestors.
+    ancestors = collections.Counter()
+    stack = []
+    for event, element in lxml.etree.iterwalk(html_element, events=('start', 'end'), tag=lxml.etree.Element):
+        if event == 'end':
+            ancestors.subtract(stack.pop())
+            continue
+        if not remaining:
+            break
+        keys = _element_keys(element)
+        # Selectors matching with the current element (when counting).
+        element_matches = set()
+        for candidates in table.candidates(keys):
+            for selector_str, chain, ancestor_keys in candidates:
+                if selector_str in remaining and selector_str not in element_matches and all(ancestors[k] for k in ancestor_keys):
+                    evaluations += 1
+                    if selector_times is not None:
+                        start = time.perf_counter()
+                    matched = _match_chain(element, chain, html_element)
+                    if selector_times is not None:
+                        selector_times[selector_str] = selector_times.get(selector_str, 0.0) + time.perf_counter() - start
+                    if matched:
+                        found_selectors.add(selector_str)
+                        if counts is None:
+                            remaining.discard(selector_str)
+                        else:
+                            element_matches.add(selector_str)
+                            counts[selector_str] = counts.get(selector_str, 0) + 1
+        ancestors.update(keys)
+        stack.append(keys)
+    _add_stat(stats, 'evaluations', evaluations)
+
+    if unsupported:
+        found_selectors.update(_match_xpath(unsupported, html_element, stats=stats, counts=counts))
+    return found_selectors
+
+
+def _free_element(element, free_preceding_siblings):
+    '''
+    Free the memory of the (no longer needed) subtree of a completed element
+    while streaming, and optionally its preceding siblings.
+    '''
+    if len(element):
+        if not element.text and not _STRUCTURAL_PSEUDO_CLASSES['empty'](element):
+            # Keep the element non-empty for later ":empty" tests.
+            element.text = ' '
+        del element[:]
+    if free_preceding_siblings:
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _match_stream(selectors, html_resource, engine=ENGINE_XPATH, stats=None):
+    '''
+    Streaming matcher: parse the HTML incrementally and test each element
+    against its candidate selectors (looked up as in the bulk engine)
+    as soon as it is complete, after which its subtree is freed.
+    Preceding siblings are freed too, when no remaining selector looks at them.
+    Parsing stops as soon as all selectors are resolved.
+
+    Selectors that look at following siblings (e.g. ":last-child") or that are
+    not supported by the bulk engine are streamed in relaxed form: if that one
+    does not match, the selector does not match either; otherwise the
+    document is parsed completely to match it with given engine.
+    '''
+    table = _DispatchTable()
+    remaining = set()
+    uncertain = set()
+    # Remaining selectors that look at preceding siblings.
+    sibling_users = set()
+    for selector_str in selectors:
+        compiled = compile_selector(selector_str)
+        if any(c.stream_chain is None for c in compiled):
+            uncertain.add(selector_str)
+            continue
+        for c in compiled:
+            remaining.add(selector_str)
+            table.add(c.stream_chain[0][0], (selector_str, c.stream_chain, c.stream_ancestor_keys, c.stream_exact))
+            if c.stream_uses_siblings:
+                sibling_users.add(selector_str)
+
+    found_selectors = set()
+    selector_times = stats.get('selector_times') if stats is not None else None
+    evaluations = 0
+    elements = 0
+    ancestors = collections.Counter()
+    stack = []
+    root = None
+    if remaining:
+        for event, element in lxml.etree.iterparse(html_resource, events=('start', 'end'), html=True):
+            if event == 'start':
+                if root is None:
+                    root = element
+                keys = _element_keys(element)
+                for key in keys:
+                    ancestors[key] += 1
+                stack.append(keys)
+                continue
+            elements += 1
+            keys = stack.pop()
+            for key in keys:
+                ancestors[key] -= 1
+            for candidates in table.candidates(keys):
+                for selector_str, chain, ancestor_keys, exact in candidates:
+                    if selector_str in remaining and all(ancestors[k] for k in ancestor_keys):
+                        evaluations += 1
+                        if selector_times is not None:
+                            start = time.perf_counter()
+                        matched = _match_chain(element, chain, root)
+                        if selector_times is not None:
+                            selector_times[selector_str] = selector_times.get(selector_str, 0.0) + time.perf_counter() - start
+                        if matched:
+                            remaining.discard(selector_str)
+                            sibling_users.discard(selector_str)
+                            (found_selectors if exact else uncertain).add(selector_str)
+            if not remaining:
+                break
+            _free_element(element, free_preceding_siblings=not sibling_users)
+    _add_stat(stats, 'evaluations', evaluations)
+    _add_stat(stats, 'streamed_elements', elements)
+
+    if uncertain:
+        _add_stat(stats, 'full_parses', 1)
+        if hasattr(html_resource, 'seek'):
+            html_resource.seek(0)
+        html_element = lxml.etree.parse(html_resource, parser=lxml.etree.HTMLParser()).getroot()
+        found_selectors.update(match_selectors_against_html_root_element(uncertain, html_element, engine=engine, stats=stats))
     return found_selectors
 
 
-def match_selectors_against_html_string(selectors, html_string):
+def _match_root_element(selectors, html_element, engine=ENGINE_XPATH, stats=None, index=None):
+    '''
+    Find the selectors that match with the DOM (without grouping equivalent selectors).
+    '''
+    start = time.perf_counter()
+    if engine == ENGINE_BULK:
+        found_selectors = _match_bulk(selectors, html_element, stats=stats)
+    elif engine == ENGINE_XPATH:
+        found_selectors = _match_xpath(selectors, html_element, stats=stats, index=index)
+    else:
+        raise ValueError('Invalid matching engine %r' % engine)
+    _add_stat(stats, 'match_time', time.perf_counter() - start)
+    return found_selectors
+
+
+def _group_selectors(selectors, stats=None):
+    groups = equivalent_selector_groups(selectors)
+    _add_stat(stats, 'equivalent_selectors', len(selectors) - len(groups))
+    return groups
+
+
+def match_selectors_against_html_root_element(selectors, html_element, engine=ENGINE_XPATH, stats=None, index=None, grouped=False):
+    '''
+    Find the selectors that match with the DOM from the given HTML.
+
+    Equivalent selectors (see equivalent_selector_groups()) are matched only once.
+    With the XPath engine, selectors that require ids, classes, tags or attributes
+    that are not present in the DOM are rejected without XPath evaluation.
+    The bulk engine matches all selectors in a single DOM tree walk.
+
+    @param selectors set of CSS selectors (strings)
+    @param html_element lxml.etree.Element object
+    @param engine matching engine: ENGINE_XPATH or ENGINE_BULK
+    @param stats optional dictionary to add matching statistics to:
+        'match_time', 'equivalent_selectors' (selectors not matched separately),
+        'evaluations' (selector evaluations) and 'rejections'
+        (selectors rejected without evaluation). If it contains a 'selector_times'
+        dictionary, evaluation times per (representative) selector are added to it.
+    @param index optional DocumentIndex of the DOM (for the XPath engine),
+        to reuse when matching the same DOM repeatedly
+    @param grouped whether the selectors are already representatives of distinct
+        equivalence classes (see SelectorGroups), so that grouping can be skipped
+
+    @return set of found selectors
+    '''
+    if grouped:
+        return _match_root_element(selectors, html_element, engine=engine, stats=stats, index=index)
+    groups = _group_selectors(selectors, stats)
+    return _fan_out(_match_root_element(groups, html_element, engine=engine, stats=stats, index=index), groups)
+
+
+def match_selectors_against_html_string(selectors, html_string, engine=ENGINE_XPATH, stats=None):
     '''
     Find the selectors that match with the DOM from the given HTML.
 
     @param selectors set of CSS selectors (strings)
     @param html_string html string
+    @param engine matching engine: ENGINE_XPATH or ENGINE_BULK
+    @param stats optional dictionary to add parsing ('parse_time') and matching statistics to
 
     @return set of found selectors
     '''
+    start = time.perf_counter()
     parser = lxml.etree.HTMLParser()
     html_element = lxml.etree.fromstring(html_string, parser=parser)
-    return match_selectors_against_html_root_element(selectors, html_element)
+    _add_stat(stats, 'parse_time', time.perf_counter() - start)
+    return match_selectors_against_html_root_element(selectors, html_element, engine=engine, stats=stats)
+
+
+def could_any_match(selectors, raw_index):
+    '''
+    Pre-filter stage: check if any of the selectors could match with a document,
+    judging from the ids and classes in its raw bytes.
+    Stops at the first selector that could match: rejecting individual selectors
+    is left to the DocumentIndex of the parsed document.
+
+    @param selectors set of CSS selectors (strings)
+    @param raw_index RawDocumentIndex of the document
+    '''
+    for selector_str in selectors:
+        for compiled in compile_selector(selector_str):
+            if raw_index.could_match(compiled.requirements):
+                return True
+    return False
+
 
+def parse_html_bytes(html_bytes, base_url=None, selectors=None, stats=None):
+    '''
+    Parse a HTML document from its raw bytes, unless none of the given selectors
+    could match with it, judging from a scan of the raw bytes (see RawDocumentIndex).
+
+    @param html_bytes raw HTML document (bytes)
+    @param base_url optional file path or url of the document
+    @param selectors optional set of CSS selectors (strings) for the pre-filter stage
+    @param stats optional dictionary to add statistics ('parse_time' and 'prefilter_skips') to
 
-def match_selectors_against_html_resource(selectors, html_resource):
+    @return root element, or None if the pre-filter skipped the document
+    '''
+    start = time.perf_counter()
+    if selectors is not None:
+        raw_index = RawDocumentIndex.scan(html_bytes)
+        if raw_index is not None and not could_any_match(selectors, raw_index):
+            _add_stat(stats, 'prefilter_skips', 1)
+            return None
+    html_element = lxml.etree.parse(io.BytesIO(html_bytes), parser=lxml.etree.HTMLParser(), base_url=base_url).getroot()
+    _add_stat(stats, 'parse_time', time.perf_counter() - start)
+    return html_element
+
+
+def match_selectors_against_html_resource(selectors, html_resource, engine=ENGINE_XPATH, stats=None, streaming=False, prefilter=True, grouped=False):
     '''
     Find the selectors that match with the DOM from the given HTML.
 
     @param selectors set of CSS selectors (strings)
     @param html_resource HTML file path/url or file(-like) object.
+    @param engine matching engine: ENGINE_XPATH or ENGINE_BULK
+    @param stats optional dictionary to add parsing ('parse_time') and matching statistics to
+    @param streaming parse and match the HTML incrementally, freeing processed elements
+        and stopping early when all selectors are matched, to limit memory usage
+        on large documents. The matching engine is only used for the selectors
+        that can not be resolved while streaming (statistics 'stream_time',
+        'streamed_elements' and 'full_parses').
+    @param prefilter for (non-streaming) local HTML files: first scan the raw bytes
+        for ids and classes (see RawDocumentIndex) and skip parsing altogether
+        if none of the selectors could match (statistic 'prefilter_skips').
+    @param grouped whether the selectors are already representatives of distinct
+        equivalence classes (see SelectorGroups), so that grouping can be skipped
 
     @return set of found selectors
     '''
-    parser = lxml.etree.HTMLParser()
-    html_element = lxml.etree.parse(html_resource, parser=parser).getroot()
-    return match_selectors_against_html_root_element(selectors, html_element)
+    if grouped:
+        return _match_resource(selectors, html_resource, engine, stats, streaming, prefilter)
+    groups = _group_selectors(selectors, stats)
+    return _fan_out(_match_resource(groups, html_resource, engine, stats, streaming, prefilter), groups)
+
+
+def _match_resource(selectors, html_resource, engine, stats, streaming, prefilter):
+    '''
+    Find the selectors that match with the DOM from the given HTML (without grouping equivalent selectors).
+    '''
+    start = time.perf_counter()
+    if streaming:
+        found_selectors = _match_stream(selectors, html_resource, engine=engine, stats=stats)
+        _add_stat(stats, 'stream_time', time.perf_counter() - start)
+        return found_selectors
+    if prefilter and isinstance(html_resource, str) and os.path.isfile(html_resource):
+        with open(html_resource, 'rb') as f:
+            html_bytes = f.read()
+        html_element = parse_html_bytes(html_bytes, base_url=html_resource, selectors=selectors, stats=stats)
+        if html_element is None:
+            return set()
+    else:
+        html_element = lxml.etree.parse(html_resource, parser=lxml.etree.HTMLParser()).getroot()
+        _add_stat(stats, 'parse_time', time.perf_counter() - start)
+    return _match_root_element(selectors, html_element, engine=engine, stats=stats)
+
 
+def count_selector_matches_against_html_root_element(selectors, html_element, engine=ENGINE_XPATH, stats=None):
+    '''
+    Count the elements matching with each selector in the DOM from the given HTML.
+
+    @param selectors set of CSS selectors (strings)
+    @param html_element lxml.etree.Element object
+    @param engine matching engine: ENGINE_XPATH or ENGINE_BULK
+    @param stats optional dictionary to add matching statistics to
+
+    @return dictionary mapping the found selectors to their number of matching elements
+    '''
+    start = time.perf_counter()
+    groups = _group_selectors(selectors, stats)
+    counts = {}
+    if engine == ENGINE_BULK:
+        _match_bulk(groups, html_element, stats=stats, counts=counts)
+    elif engine == ENGINE_XPATH:
+        _match_xpath(groups, html_element, stats=stats, counts=counts)
+    else:
+        raise ValueError('Invalid matching engine %r' % engine)
+    _add_stat(stats, 'match_time', time.perf_counter() - start)
+    return dict((selector_str, count) for (representative, count) in counts.items() for selector_str in groups[representative])
+
+
+def count_selector_matches_against_html_resource(selectors, html_resource, engine=ENGINE_XPATH, stats=None):
+    '''
+    Count the elements matching with each selector in the DOM from the given HTML.
+
+    @param selectors set of CSS selectors (strings)
+    @param html_resource HTML file path/url or file(-like) object.
+    @param engine matching engine: ENGINE_XPATH or ENGINE_BULK
+    @param stats optional dictionary to add parsing ('parse_time') and matching statistics to
+
+    @return dictionary mapping the found selectors to their number of matching elements
+    '''
+    start = time.perf_counter()
+    html_element = lxml.etree.parse(html_resource, parser=lxml.etree.HTMLParser()).getroot()
+    _add_stat(stats, 'parse_time', time.perf_counter() - start)
+    return count_selector_matches_against_html_root_element(selectors, html_element, engine=engine, stats=stats)
@@ -0,0 +1,61 @@
+
+import array
+
+
+class Histogram(object):
+    '''
+    Usage counters for a fixed set of keys (e.g. CSS selectors or ids/classes):
+    per key the number of documents (e.g. HTML pages or source files) it occurs in
+    and its total number of hits (e.g. matching elements or occurrences).
+
+    Counters are stored in arrays, indexed by key id (position in the sorted keys),
+    so that counts from worker processes can be passed around and merged compactly.
+    '''
+
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+        self.ids = dict((key, i) for (i, key) in enumerate(self.keys))
+        self.documents = self.zeros()
+        self.hits = self.zeros()
+
+    def zeros(self):
+        '''Array of zero counters, one per key.'''
+        return array.array('Q', [0]) * len(self.keys)
+
+    def to_array(self, counts):
+        '''Convert a mapping of key to count to an array of counters.'''
+        result = self.zeros()
+        for key, count in counts.items():
+            result[self.ids[key]] = count
+        return result
+
+    def add(self, counts):
+        '''
+        Add the hit counts of a document.
+
+        @param counts array of counters (see to_array()) or mapping of key to count
+        '''
+        if not isinstance(counts, array.array):
+            counts = self.to_array(counts)
+        documents = self.documents
+        hits = self.hits
+        for i, count in enumerate(counts):
+            if count:
+                documents[i] += 1
+                hits[i] += count
+
+    def get(self, key):
+        '''@return (number of documents, number of hits) for given key'''
+        i = self.ids[key]
+        return self.documents[i], self.hits[i]
+
+    def export(self, documents_label='documents', hits_label='hits', keys=None):
+        '''
+        @param keys optional subset of the keys to export
+
+        @return JSON-serializable mapping of key to dictionary with counts
+        '''
+        return dict(
+            (key, {documents_label: self.documents[self.ids[key]], hits_label: self.hits[self.ids[key]]})
+            for key in (self.keys if keys is None else keys)
+        )
@@ -0,0 +1,290 @@
+
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+
+
+_log = logging.getLogger('cssdeadwood.parallel')
+
+
+class SharedRef(object):
+    '''
+    Reference (to pass as task argument) to an object shared with worker processes.
+    '''
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __getstate__(self):
+        return self.key
+
+    def __setstate__(self, key):
+        self.key = key
+
+
+# Objects shared with forked worker processes.
+_shared_objects = {}
+
+
+def share(obj):
+    '''
+    Share a (large, read-only) object, e.g. the list of all selectors to decode bitsets with,
+    with process pool workers, so that it does not have to be pickled for every task.
+
+    When worker processes are forked, they inherit the object and only a small
+    reference has to be passed. With other start methods ("spawn" on Windows and macOS),
+    the object itself is passed. Must be called before the process pool starts its workers.
+
+    @return the object or a reference to it, to pass as task argument
+        and resolve in the worker with shared()
+    '''
+    if multiprocessing.get_start_method() != 'fork':
+        return obj
+    key = id(obj)
+    _shared_objects[key] = obj
+    return SharedRef(key)
+
+
+def unshare(ref):
+    '''Release an object shared with share().'''
+    if isinstance(ref, SharedRef):
+        _shared_objects.pop(ref.key, None)
+
+
+def shared(ref):
+    '''Resolve a task argument from share().'''
+    if isinstance(ref, SharedRef):
+        return _shared_objects[ref.key]
+    return ref
+
+
+def shrinking_map(executor, func, items, get_args, max_pending):
+    '''
+    Apply a function to the given items with an executor (process or thread pool),
+    where the extra arguments for each call are determined at submit time.
+
+    Typical use case is matching items against a "shrinking" set
+    (e.g. the currently unmatched selectors): the caller updates that set
+    as results come in, so that later submitted items do less work.
+
+    @param executor concurrent.futures.Executor instance
+    @param func function to call as func(item, *args)
+    @param items iterable of items (consumed lazily)
+    @param get_args callable returning the tuple of extra arguments to use
+        for the next submission, or None to stop submitting new items
+        (e.g. when there is nothing left to search for).
+    @param max_pending maximum number of submitted, but unfinished calls
+
+    @return generator of (item, result) tuples, in order of completion
+    '''
+    items = iter(items)
+    pending = {}
+    exhausted = False
+    while True:
+        # Fill up the pending queue.
+        while not exhausted and len(pending) < max_pending:
+            args = get_args()
+            if args is None:
+                exhausted = True
+                break
+            try:
+                item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[executor.submit(func, item, *args)] = item
+        if not pending:
+            break
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            yield item, future.result()
+
+
+# Default maximum number of items waiting between two pipeline stages.
+PIPELINE_QUEUE_SIZE = 8
+
+# Maximum number of parsed documents (e.g. lxml trees, which take a multiple of the size
+# of the raw document in memory) waiting for the consumer of a pipeline.
+PIPELINE_PARSED_QUEUE_SIZE = 1
+
+# Files of at least this size (in bytes) are not read ahead in a pipeline,
+# but read by the next stage, to bound the memory taken by the read queue.
+PIPELINE_READ_AHEAD_MAX_SIZE = 16 * 1024 * 1024
+
+# End of stream marker in the pipeline queues.
+_DONE = object()
+
+
+class _Failure(object):
+    '''Exception raised in a pipeline stage, passed downstream to the consumer.'''
+
+    __slots__ = ('exception',)
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class PipelineStage(object):
+    '''
+    Stage of a Pipeline, with its statistics.
+    '''
+
+    __slots__ = ('name', 'function', 'queue_size', 'items', 'busy', 'depth_total', 'depth_max')
+
+    def __init__(self, name, function=None, queue_size=None):
+        self.name = name
+        self.function = function
+        # Maximum number of results waiting in the output queue (None: pipeline default).
+        # If given explicitly, it also bounds the number of results being produced:
+        # the stage waits for a free slot before processing an item.
+        self.queue_size = queue_size
+        # Number of processed items and total processing time.
+        self.items = 0
+        self.busy = 0.0
+        # Sum and maximum of the input queue depth (sampled when taking an item).
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def took(self, depth):
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    def summary(self, duration):
+        '''@return human readable summary of the statistics'''
+        return '%d items, %.1f items/s, busy %.0f%%, input queue depth avg %.1f max %d' % (
+            self.items, self.items / duration if duration else 0.0,
+            100.0 * self.busy / duration if duration else 0.0,
+            self.depth_total / self.items if self.items else 0.0, self.depth_max
+        )
+
+
+class Pipeline(object):
+    '''
+    Chain of processing stages (e.g. reading and parsing files), each running
+    in its own thread and connected with bounded queues, so that e.g. disk or network I/O
+    for one item overlaps with the processing of the previous ones.
+    A stage blocks when its output queue is full (backpressure),
+    which limits the number of items (e.g. file contents) kept in memory.
+
+    The results of the last stage are consumed by the caller (e.g. the matching stage),
+    which can stop early by closing the generator (e.g. breaking out of the for loop).
+    Stage statistics (throughput, busy time and input queue depth) are logged at the end.
+    '''
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE, name='pipeline'):
+        '''
+        @param stages list of (name, function) or (name, function, queue size) tuples:
+            each function is called with the results of the previous stage (or the input items
+            for the first stage). The optional queue size overrides the default for its output queue
+            and bounds the number of results that are queued or being produced
+            (e.g. to keep at most one large result in memory besides the one being consumed)
+        @param queue_size default maximum number of items waiting in each queue
+        @param name name for logging
+        '''
+        self.stages = [PipelineStage(*stage) for stage in stages]
+        self.consumer = PipelineStage('consume')
+        self.queue_size = queue_size
+        self.name = name
+        self.duration = 0.0
+
+    def _run_stage(self, stage, source, output, stop):
+        '''Thread target: process the items from source (iterable or queue) and put the results in the output queue.'''
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    output.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        slots = getattr(output, 'slots', None)
+        try:
+            for item in (self._drain(source, stage, stop) if isinstance(source, queue.Queue) else source):
+                if isinstance(item, _Failure):
+                    put(item)
+                    return
+                if slots is not None:
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                start = time.perf_counter()
+                result = stage.function(item)
+                stage.busy += time.perf_counter() - start
+                stage.items += 1
+                if not put(result):
+                    return
+        except Exception as e:
+            put(_Failure(e))
+        put(_DONE)
+
+    @staticmethod
+    def _drain(source, stage, stop):
+        '''Generator of the items from a pipeline queue, until the end of stream marker.'''
+        slots = getattr(source, 'slots', None)
+        while not stop.is_set():
+            try:
+                depth = source.qsize()
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            if slots is not None and not isinstance(item, _Failure):
+                slots.release()
+            stage.took(depth)
+            yield item
+
+    def run(self, items):
+        '''
+        Run the given items through the pipeline.
+
+        @return generator of the results of the last stage, in order of the input items
+        '''
+        start = time.perf_counter()
+        stop = threading.Event()
+        queues = []
+        for stage in self.stages:
+            if stage.queue_size is None:
+                queues.append(queue.Queue(maxsize=self.queue_size))
+            else:
+                output = queue.Queue(maxsize=stage.queue_size)
+                output.slots = threading.Semaphore(stage.queue_size)
+                queues.append(output)
+        threads = []
+        source = iter(items)
+        for stage, output in zip(self.stages, queues):
+            thread = threading.Thread(target=self._run_stage, args=(stage, source, output, stop), name='%s-%s' % (self.name, stage.name))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+            source = output
+        consumer = self.consumer
+        debug = _log.isEnabledFor(logging.DEBUG)
+        try:
+            for item in self._drain(source, consumer, stop):
+                if isinstance(item, _Failure):
+                    raise item.exception
+                if debug:
+                    _log.debug('%s queue depths: %s' % (self.name, ', '.join('%s %d' % (s.name, q.qsize()) for s, q in zip(self.stages, queues))))
+                consume_start = time.perf_counter()
+                yield item
+                consumer.busy += time.perf_counter() - consume_start
+                consumer.items += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.duration = time.perf_counter() - start
+            self.log_stats()
+
+    def log_stats(self):
+        for stage in self.stages + [self.consumer]:
+            _log.info('%s stage %s: %s' % (self.name, stage.name, stage.summary(self.duration)))
@@ -0,0 +1,151 @@
+
+import sys
+import time
+import contextlib
+import collections
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+
+def peak_rss():
+    '''
+    Peak resident set size (in bytes) of this process and its (finished) child processes,
+    or None if not available on this platform.
+    '''
+    if resource is None:
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS, but in kilobytes on Linux.
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+class Collector(object):
+    '''
+    Base class for instrumentation collectors: receives timing and counter events
+    from CssDeadwoodApp. Subclasses override the events they are interested in.
+    '''
+
+    def stage(self, name, duration):
+        '''Analysis stage (e.g. 'dom_matching') finished in given duration (seconds).'''
+        pass
+
+    def file(self, stage, path, duration, details=None):
+        '''
+        A file was processed in given stage and duration (seconds),
+        with optional dictionary of details (e.g. parse and match times).
+        '''
+        pass
+
+    def selectors(self, stage, selector_times):
+        '''Selector evaluation times (mapping of selector to seconds) in given stage.'''
+        pass
+
+    def count(self, name, value=1):
+        '''Increment a counter.'''
+        pass
+
+
+class Instrumentation(Collector):
+    '''
+    Collector that dispatches all events to a list of collectors.
+    '''
+
+    def __init__(self, collectors=None):
+        self.collectors = list(collectors or [])
+
+    @contextlib.contextmanager
+    def timed_stage(self, name):
+        '''Context manager to time an analysis stage.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(name, time.perf_counter() - start)
+
+    def stage(self, name, duration):
+        for collector in self.collectors:
+            collector.stage(name, duration)
+
+    def file(self, stage, path, duration, details=None):
+        for collector in self.collectors:
+            collector.file(stage, path, duration, details)
+
+    def selectors(self, stage, selector_times):
+        for collector in self.collectors:
+            collector.selectors(stage, selector_times)
+
+    def count(self, name, value=1):
+        for collector in self.collectors:
+            collector.count(name, value)
+
+
+class Profiler(Collector):
+    '''
+    Collector that aggregates the events into a profile report:
+    stage timings, counters, slowest files per stage and slowest selectors.
+    '''
+
+    def __init__(self, top=10):
+        self.top = top
+        self.stages = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.files = collections.defaultdict(list)
+        self.selector_times = collections.Counter()
+
+    def stage(self, name, duration):
+        self.stages[name] = self.stages.get(name, 0.0) + duration
+
+    def file(self, stage, path, duration, details=None):
+        self.files[stage].append((duration, path, details or {}))
+
+    def selectors(self, stage, selector_times):
+        self.selector_times.update(selector_times)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def report(self):
+        '''
+        @return profile report as JSON-serializable dictionary
+        '''
+        slowest_files = {}
+        for stage, files in self.files.items():
+            slowest_files[stage] = [
+                dict(path=path, duration=duration, **details)
+                for (duration, path, details) in sorted(files, key=lambda f: f[0], reverse=True)[:self.top]
+            ]
+        return {
+            'stages': dict(self.stages),
+            'file_totals': dict((stage, {'count': len(files), 'duration': sum(f[0] for f in files)}) for stage, files in self.files.items()),
+            'counters': dict(self.counters),
+            'slowest_files': slowest_files,
+            'slowest_selectors': [{'selector': s, 'duration': d} for (s, d) in self.selector_times.most_common(self.top)],
+            'peak_rss': peak_rss(),
+        }
+
+    def print_report(self, out=None):
+        out = out or sys.stdout
+        report = self.report()
+        out.write(' Profile '.center(80, '-') + '\n')
+        out.write('Stages:\n')
+        for stage, duration in report['stages'].items():
+            out.write('  %-30s %10.3f s\n' % (stage, duration))
+        if report['counters']:
+            out.write('Counters:\n')
+            for name, value in sorted(report['counters'].items()):
+                out.write('  %-30s %10d\n' % (name, value))
+        for stage, files in sorted(report['slowest_files'].items()):
+            totals = report['file_totals'][stage]
+            out.write('Slowest files in %s (%d files, %.3f s in total):\n' % (stage, totals['count'], totals['duration']))
+            for f in files:
+                out.write('  %10.3f s  %s\n' % (f['duration'], f['path']))
+        if report['slowest_selectors']:
+            out.write('Slowest selectors:\n')
+            for s in report['slowest_selectors']:
+                out.write('  %10.6f s  %s\n' % (s['duration'], s['selector']))
+        if report['peak_rss'] is not None:
+            out.write('Peak RSS: %.1f MB\n' % (report['peak_rss'] / 1024.0 / 1024))
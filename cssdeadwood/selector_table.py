@@ -0,0 +1,188 @@
+
+import sys
+import array
+
+from cssdeadwood import bitset
+from cssdeadwood.css_extract import selector_ids_and_classes
+
+
+class SelectorRecord(object):
+    '''
+    Compact record of a distinct CSS selector in a SelectorTable.
+    '''
+
+    __slots__ = ('id', 'selector', 'ids', 'classes', 'sources')
+
+    def __init__(self, id, selector, ids, classes):
+        # Integer id (index in the table).
+        self.id = id
+        # Selector string (interned).
+        self.selector = selector
+        # Tuples of word ids (see SelectorTable.words) of the ids and classes in the selector.
+        self.ids = ids
+        self.classes = classes
+        # Flat array of (CSS file id, line number) pairs where the selector is defined.
+        self.sources = array.array('I')
+
+
+class SelectorTable(object):
+    '''
+    Table of distinct CSS selectors, shared by the analysis stages.
+
+    Each selector is stored once (as interned string) with an integer id,
+    in a record with its ids and classes (parsed once, as integer word ids)
+    and its source locations. Sets of selectors can be represented
+    as integer bitsets ("masks", see cssdeadwood.bitset) over the selector ids,
+    so that set operations are integer operations. Likewise for sets of id/class names
+    with bitsets over the word ids.
+    '''
+
+    def __init__(self):
+        self.records = []
+        self._ids = {}
+        # CSS files (labels) and their ids.
+        self.files = []
+        self._file_ids = {}
+        # Per CSS file: array of its selector ids.
+        self._file_selectors = []
+        # Id and class names ("words"), their ids and per word the array of selector ids using it.
+        self.words = []
+        self._word_ids = {}
+        self._word_selectors = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, selector):
+        return selector in self._ids
+
+    def _word_id(self, word):
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self.words)
+            self.words.append(sys.intern(word))
+            self._word_selectors.append(array.array('I'))
+        return word_id
+
+    def _file_id(self, css_file):
+        file_id = self._file_ids.get(css_file)
+        if file_id is None:
+            file_id = self._file_ids[css_file] = len(self.files)
+            self.files.append(css_file)
+            self._file_selectors.append(array.array('I'))
+        return file_id
+
+    def add(self, selector, css_file=None, lines=()):
+        '''
+        Add a selector (if not already present) and optionally its source locations.
+
+        @return selector id
+        '''
+        selector_id = self._ids.get(selector)
+        if selector_id is None:
+            selector_id = self._ids[selector] = len(self.records)
+            ids, classes = selector_ids_and_classes(selector)
+            record = SelectorRecord(
+                selector_id, sys.intern(selector),
+                tuple(sorted(set(self._word_id(w) for w in ids))),
+                tuple(sorted(set(self._word_id(w) for w in classes))),
+            )
+            self.records.append(record)
+            for word_id in set(record.ids + record.classes):
+                self._word_selectors[word_id].append(selector_id)
+        if css_file is not None:
+            file_id = self._file_id(css_file)
+            file_selectors = self._file_selectors[file_id]
+            if not file_selectors or file_selectors[-1] != selector_id:
+                file_selectors.append(selector_id)
+            sources = self.records[selector_id].sources
+            for line in lines:
+                sources.extend((file_id, line))
+        return selector_id
+
+    def add_selector_lines(self, css_file, selector_lines):
+        '''
+        Add the selectors of a CSS file.
+
+        @param selector_lines mapping of selectors to list of line numbers
+
+        @return list of selector ids
+        '''
+        self._file_id(css_file)
+        return [self.add(selector, css_file, lines) for (selector, lines) in sorted(selector_lines.items())]
+
+    def id(self, selector):
+        '''@return id of given selector'''
+        return self._ids[selector]
+
+    def selector(self, selector_id):
+        '''@return selector string with given id'''
+        return self.records[selector_id].selector
+
+    def file_selectors(self, css_file):
+        '''@return array of the ids of the selectors defined in given CSS file'''
+        return self._file_selectors[self._file_ids[css_file]]
+
+    def sources(self, selector):
+        '''@return list of (CSS file, line) tuples where given selector is defined'''
+        sources = self.records[self._ids[selector]].sources
+        return [(self.files[sources[i]], sources[i + 1]) for i in range(0, len(sources), 2)]
+
+    def ids_and_classes(self, mask=None):
+        '''
+        @param mask optional bitset of selectors to limit to (default: all selectors)
+
+        @return (set of ids, set of classes) used in the selectors
+        '''
+        ids = set()
+        classes = set()
+        records = self.records if mask is None else bitset.select(self.records, mask)
+        for record in records:
+            ids.update(record.ids)
+            classes.update(record.classes)
+        return set(self.words[i] for i in ids), set(self.words[i] for i in classes)
+
+    def word_selectors(self, word):
+        '''@return array of the ids of the selectors using given id or class name'''
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            return array.array('I')
+        return self._word_selectors[word_id]
+
+    def mask(self, selectors):
+        '''
+        @param selectors iterable of selector strings or selector ids
+
+        @return bitset (integer) with the bits of given selectors set
+        '''
+        ids = self._ids
+        return bitset.from_indices((s if isinstance(s, int) else ids[s] for s in selectors), len(self.records))
+
+    def full_mask(self):
+        '''@return bitset of all selectors'''
+        return bitset.full(len(self.records))
+
+    iter_ids = staticmethod(bitset.iter_indices)
+
+    def selectors(self, mask):
+        '''@return list of the selector strings in given bitset (in selector id order)'''
+        return [record.selector for record in bitset.select(self.records, mask)]
+
+    def selector_list(self):
+        '''@return list of all selector strings, indexed by selector id'''
+        return [record.selector for record in self.records]
+
+    def word_ids(self):
+        '''@return mapping of id/class name to word id'''
+        return self._word_ids
+
+    def word_mask(self, words):
+        '''@return bitset (over the word ids) of given id/class names'''
+        return bitset.from_indices((self._word_ids[w] for w in words), len(self.words))
+
+    def word_selector_mask(self, word_mask):
+        '''@return bitset of the selectors using any of the id/class names in given word bitset'''
+        return bitset.from_indices(
+            (i for word_id in bitset.iter_indices(word_mask) for i in self._word_selectors[word_id]),
+            len(self.records)
+        )
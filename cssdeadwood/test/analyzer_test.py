@@ -0,0 +1,181 @@
+import os
+import io
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+
+from cssdeadwood.analyzer import Analyzer, FileWatcher
+from cssdeadwood.dom_match import ENGINES
+from cssdeadwood.app import CssDeadwoodApp
+
+
+class AnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, content):
+        file_name = os.path.join(self.path, name)
+        with open(file_name, 'w') as f:
+            f.write(content)
+        return file_name
+
+    def testAnalysis(self):
+        for engine in ENGINES:
+            analyzer = Analyzer(engine=engine)
+            css = self.write('style.css', 'a, p.x { x: y }\n.ad, h1 { x: y }')
+            html = self.write('page.html', '<html><body><p class="x"><a>x</a></p></body></html>')
+            src = self.write('ad.py', 'render("ad")')
+            used, unused = analyzer.add_files([src, html, css, self.write('notes.txt', 'h1')])
+            self.assertEqual(used, set(['a', 'p.x', '.ad']))
+            self.assertEqual(unused, set(['h1']))
+            self.assertEqual(analyzer.results()[css]['unused_selectors'], ['h1'])
+
+    def testHtmlEvents(self):
+        analyzer = Analyzer()
+        css = self.write('style.css', 'a { x: y }\np { x: y }\nh1 { x: y }')
+        page1 = self.write('page1.html', '<html><body><p><a>x</a></p></body></html>')
+        page2 = self.write('page2.html', '<html><body><p>x</p></body></html>')
+        analyzer.add_files([css, page1, page2])
+        self.assertEqual(analyzer.unused_selectors(), set(['h1']))
+        # The only page with a link loses it.
+        self.write('page1.html', '<html><body><h1>x</h1></body></html>')
+        self.assertEqual(analyzer.update_file(page1), (set(['h1']), set(['a'])))
+        # Paragraphs are still used in the other page.
+        self.assertEqual(analyzer.remove_file(page1), (set(), set(['h1'])))
+        self.assertEqual(analyzer.unused_selectors(), set(['a', 'h1']))
+        self.assertEqual(analyzer.remove_file(page2), (set(), set(['p'])))
+
+    def testCssEvents(self):
+        analyzer = Analyzer()
+        css1 = self.write('one.css', 'a { x: y }\n.ad { x: y }')
+        css2 = self.write('two.css', '.ad { x: y }\nh1 { x: y }')
+        html = self.write('page.html', '<html><body><h1>x</h1></body></html>')
+        analyzer.add_files([css1, html])
+        self.assertEqual(analyzer.unused_selectors(), set(['a', '.ad']))
+        self.assertEqual(analyzer.add_file(css2), (set(['h1']), set()))
+        # Selectors shared with another CSS file are kept.
+        self.assertEqual(analyzer.remove_file(css1), (set(), set()))
+        self.assertEqual(analyzer.unused_selectors(), set(['.ad']))
+        self.write('two.css', 'h1 { x: y }\nh2 { x: y }')
+        self.assertEqual(analyzer.update_file(css2), (set(), set(['h2'])))
+        self.assertEqual(analyzer.unused_selectors(), set(['h2']))
+        self.assertEqual(list(analyzer.results()), [css2])
+
+    def testUnreadableFiles(self):
+        analyzer = Analyzer()
+        css = self.write('style.css', 'a { x: y }\np { x: y }\nh1 { x: y }')
+        page1 = self.write('page1.html', '<html><body><p><a>x</a></p></body></html>')
+        page2 = self.write('page2.html', '<html><body><p>x</p></body></html>')
+        analyzer.add_files([css, page1, page2])
+        self.assertEqual(analyzer.unused_selectors(), set(['h1']))
+        # The witness of "a" and "p" can not be read anymore: it is left out,
+        # "p" is matched again against the other page and the other files are still loaded.
+        os.remove(page1)
+        os.mkdir(page1)
+        page3 = self.write('page3.html', '<html><body><h1>x</h1></body></html>')
+        self.assertEqual(analyzer.add_files([page1, page3]), (set(['h1']), set(['a'])))
+        self.assertEqual(analyzer.failed_files(), set([page1]))
+        self.assertEqual(analyzer.failed_files(), set())
+        self.assertEqual(analyzer.remove_file(page2), (set(), set(['p'])))
+        os.rmdir(page1)
+        self.write('page1.html', '<html><body><p><a>x</a></p></body></html>')
+        self.assertEqual(analyzer.add_file(page1), (set(['a', 'p']), set()))
+        self.assertEqual(analyzer.failed_files(), set())
+
+    def testSourceEvents(self):
+        analyzer = Analyzer()
+        css = self.write('style.css', '.ad { x: y }\n#main .ad { x: y }\n#footer { x: y }')
+        src1 = self.write('one.js', 'show("ad")')
+        src2 = self.write('two.js', 'x = "footer ad"')
+        analyzer.add_files([css, src1, src2])
+        self.assertEqual(analyzer.unused_selectors(), set())
+        self.write('two.js', 'x = 1')
+        self.assertEqual(analyzer.update_file(src2), (set(), set(['#footer'])))
+        self.assertEqual(analyzer.remove_file(src1), (set(), set(['.ad', '#main .ad'])))
+        # Words are only dropped with the last selector using them.
+        self.write('style.css', '.ad { x: y }\n#footer { x: y }')
+        analyzer.update_file(css)
+        self.assertEqual(analyzer._word_selectors, {'ad': set(['.ad']), 'footer': set(['#footer'])})
+        analyzer.remove_file(css)
+        self.assertEqual(analyzer._word_selectors, {})
+
+    def testTokenizedSourceEvents(self):
+        analyzer = Analyzer(tokenizers={'.js': 'script'})
+        css = self.write('style.css', '.ad { x: y }\n.btn-lg { x: y }\n#footer { x: y }')
+        src1 = self.write('one.js', '// no ad here\nshow("btn-" + size)')
+        src2 = self.write('two.js', 'x = "footer ad"')
+        analyzer.add_files([css, src1, src2])
+        self.assertEqual(analyzer.unused_selectors(), set())
+        self.assertIn(src1, analyzer._tokens)
+        self.write('two.js', 'x = "ad"')
+        self.assertEqual(analyzer.update_file(src2), (set(), set(['#footer'])))
+        self.assertEqual(analyzer.remove_file(src2), (set(), set(['.ad'])))
+        self.assertEqual(analyzer.remove_file(src1), (set(), set(['.btn-lg'])))
+        self.assertEqual(len(analyzer._tokens), 0)
+
+    def testKeepDocuments(self):
+        for keep_documents in [True, False]:
+            analyzer = Analyzer(keep_documents=keep_documents)
+            css = self.write('one.css', 'h1 { x: y }')
+            html = self.write('page.html', '<html><body><p>x</p></body></html>')
+            self.assertEqual(analyzer.add_files([css, html]), (set(), set(['h1'])))
+            self.assertEqual(len(analyzer._documents), 1 if keep_documents else 0)
+            self.assertEqual(analyzer.add_file(self.write('two.css', 'p { x: y }\na { x: y }')), (set(['p']), set(['a'])))
+
+
+class FileWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testPoll(self):
+        a = os.path.join(self.path, 'a.css')
+        b = os.path.join(self.path, 'b.css')
+        with open(a, 'w') as f:
+            f.write('a {}')
+        watcher = FileWatcher([self.path], extensions=['.css'])
+        self.assertEqual(watcher.poll(), (set([a]), set(), set()))
+        self.assertEqual(watcher.poll(), (set(), set(), set()))
+        with open(a, 'w') as f:
+            f.write('a, b {}')
+        with open(b, 'w') as f:
+            f.write('b {}')
+        self.assertEqual(watcher.poll(), (set([b]), set([a]), set()))
+        os.remove(a)
+        self.assertEqual(watcher.poll(), (set(), set(), set([a])))
+
+    def testAppWatch(self):
+        css = os.path.join(self.path, 'style.css')
+        html = os.path.join(self.path, 'page.html')
+        with open(css, 'w') as f:
+            f.write('a { x: y }\np { x: y }')
+        with open(html, 'w') as f:
+            f.write('<html><body><p>x</p></body></html>')
+        app = CssDeadwoodApp()
+        analyzer = Analyzer()
+        watcher = FileWatcher([self.path], extensions=['.css', '.html'])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            app._watch(analyzer, watcher, interval=0, max_rounds=1)
+        self.assertIn('Could not determine usage of the following 1 CSS selectors', out.getvalue())
+        # A page that can not be parsed (e.g. while being written) is retried in the next round.
+        with open(html, 'w') as f:
+            f.write('<html><body><p>x</p><a>y</a></body></html>')
+        document = analyzer._document
+        analyzer._document = lambda path: document(path if path != html else self.path)
+        self.assertEqual(app._watch_round(analyzer, watcher), (set([html]), set(), set(['p'])))
+        del analyzer._document
+        self.assertEqual(app._watch_round(analyzer, watcher), (set([html]), set(['a', 'p']), set()))
+        self.assertEqual(analyzer.unused_selectors(), set())
+        os.remove(html)
+        self.assertEqual(app._watch_round(analyzer, watcher), (set([html]), set(), set(['a', 'p'])))
+        self.assertEqual(analyzer.unused_selectors(), set(['a', 'p']))
@@ -0,0 +1,129 @@
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+from cssdeadwood.app import CssDeadwoodApp
+from cssdeadwood.selector_table import SelectorTable
+
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), 'files')
+
+
+class CssDeadwoodAppTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = CssDeadwoodApp()
+        self.html_files = [os.path.join(FILES_DIR, 'html', 'html001.html')] * 3
+        self.selectors = set(['a', 'a.premium', '#content', '#content p', '#content div.ad', 'h2'])
+
+    def testDomMatching(self):
+        unused, results = self.app._eliminate_selectors_from_dom_matching(self.selectors, self.html_files)
+        self.assertEqual(unused, set(['a.premium', '#content div.ad', 'h2']))
+        self.assertEqual(results['unused_selectors'], ['#content div.ad', 'a.premium', 'h2'])
+
+    def testDomMatchingJobs(self):
+        unused, results = self.app._eliminate_selectors_from_dom_matching(self.selectors, self.html_files, jobs=2)
+        self.assertEqual(unused, set(['a.premium', '#content div.ad', 'h2']))
+        self.assertEqual(results['unused_selectors'], ['#content div.ad', 'a.premium', 'h2'])
+
+    def testDomMatchingWithoutPipeline(self):
+        self.app.queue_size = 0
+        unused, results = self.app._eliminate_selectors_from_dom_matching(self.selectors, self.html_files)
+        self.assertEqual(unused, set(['a.premium', '#content div.ad', 'h2']))
+
+    def testDomMatchingCache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            for jobs in [1, 1, 2]:
+                unused, results = self.app._eliminate_selectors_from_dom_matching(self.selectors | set(['a:hover']), self.html_files, jobs=jobs, cache_dir=cache_dir)
+                self.assertEqual(unused, set(['a.premium', '#content div.ad', 'h2']))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def testDomMatchingStreaming(self):
+        self.app.streaming = True
+        unused, results = self.app._eliminate_selectors_from_dom_matching(self.selectors, self.html_files)
+        self.assertEqual(unused, set(['a.premium', '#content div.ad', 'h2']))
+
+    def testDomHistogram(self):
+        for jobs in [1, 2]:
+            unused, results, histogram = self.app._count_selectors_in_dom(self.selectors, self.html_files, jobs=jobs)
+            self.assertEqual(unused, set(['a.premium', '#content div.ad', 'h2']))
+            self.assertEqual(results['unused_selectors'], ['#content div.ad', 'a.premium', 'h2'])
+            self.assertEqual(histogram.get('#content p'), (3, 6))
+            self.assertEqual(histogram.get('h2'), (0, 0))
+
+    def testIdClassHistogram(self):
+        src_files = [os.path.join(FILES_DIR, 'python', 'python001.py')] * 2
+        for jobs in [1, 2]:
+            histogram = self.app._count_ids_and_classes(self.selectors | set(['.ad span']), src_files, jobs=jobs)
+            self.assertEqual(histogram.keys, ['ad', 'content', 'premium'])
+            self.assertEqual(histogram.get('ad'), (2, 2))
+            self.assertEqual(histogram.get('content'), (0, 0))
+
+    def testIdClassHistogramElimination(self):
+        src_files = [os.path.join(FILES_DIR, 'python', 'python001.py')] * 2
+        expected = self.app._eliminate_selectors_from_idclass_grepping(self.selectors, src_files)
+        for jobs in [1, 2]:
+            histogram = self.app._count_ids_and_classes(self.selectors | set(['#other']), src_files, jobs=jobs)
+            self.assertEqual(self.app._eliminate_selectors_from_idclass_histogram(self.selectors, src_files, histogram), expected)
+
+    def testIdClassGrepping(self):
+        src_files = [os.path.join(FILES_DIR, 'python', 'python001.py')] * 3
+        for jobs in [1, 2]:
+            unused, results = self.app._eliminate_selectors_from_idclass_grepping(self.selectors, src_files, jobs=jobs)
+            self.assertEqual(unused, set(['a', 'a.premium', '#content', '#content p', 'h2']))
+            self.assertEqual(results['unfindable_ids'], set(['content']))
+            self.assertEqual(results['unfindable_classes'], set(['premium']))
+
+    def testIdClassGreppingHyphenated(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
+            f.write('button("btn btn-lg")')
+        try:
+            selectors = set(['.btn', '.btn-lg', '.btn-primary', '#btn-x'])
+            table = SelectorTable()
+            for selector in sorted(selectors):
+                table.add(selector)
+            for t in [None, table]:
+                unused, results = self.app._eliminate_selectors_from_idclass_grepping(selectors, [f.name], table=t)
+                self.assertEqual(unused, set(['.btn-primary', '#btn-x']))
+                self.assertEqual(results['unfindable_classes'], set(['btn-primary']))
+        finally:
+            os.unlink(f.name)
+
+    def testIdClassGreppingTokenizers(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
+            f.write('// Mark the active row\nel.classList.add("btn", "btn-" + size);')
+        try:
+            selectors = set(['.active', '.row', '.btn', '.btn-lg', '.card'])
+            unused, results = self.app._eliminate_selectors_from_idclass_grepping(selectors, [f.name])
+            self.assertEqual(unused, set(['.btn-lg', '.card']))
+            self.app.tokenizers = {'.js': 'script'}
+            for jobs in [1, 2]:
+                unused, results = self.app._eliminate_selectors_from_idclass_grepping(selectors, [f.name], jobs=jobs)
+                self.assertEqual(unused, set(['.active', '.row', '.card']))
+            histogram = self.app._count_ids_and_classes(selectors, [f.name])
+            self.assertEqual(histogram.get('btn'), (1, 1))
+            self.assertEqual(histogram.get('btn-lg'), (1, 1))
+            self.assertEqual(histogram.get('row'), (0, 0))
+        finally:
+            os.unlink(f.name)
+
+    def testProjectResults(self):
+        src_files = [os.path.join(FILES_DIR, 'python', 'python001.py')]
+        other_selectors = set(['#wrapper', '.ad span', '.premium', 'p.x'])
+        all_selectors = self.selectors | other_selectors
+        unused, dom_data = self.app._eliminate_selectors_from_dom_matching(all_selectors, self.html_files)
+        unused, idclass_data = self.app._eliminate_selectors_from_idclass_grepping(unused, src_files)
+        for selectors in [self.selectors, other_selectors]:
+            # Projected results should be the same as doing the analysis on the subset directly.
+            expected = {}
+            subset_unused, expected['dom_matching'] = self.app._eliminate_selectors_from_dom_matching(selectors, self.html_files)
+            subset_unused, expected['idclass_elimination'] = self.app._eliminate_selectors_from_idclass_grepping(subset_unused, src_files)
+            expected['unused_selectors'] = sorted(subset_unused)
+            projected = self.app._project_results(selectors, unused, dom_data, idclass_data)
+            self.assertEqual(projected, expected)
@@ -0,0 +1,28 @@
+import unittest
+
+
+from cssdeadwood import bitset
+
+
+class BitsetTest(unittest.TestCase):
+
+    def testFromIndices(self):
+        self.assertEqual(bitset.from_indices([]), 0)
+        self.assertEqual(bitset.from_indices([0, 3, 3]), 0b1001)
+        # Indices beyond the preallocated size.
+        self.assertEqual(bitset.from_indices([70, 1], size=8), (1 << 70) | 2)
+
+    def testIterIndices(self):
+        indices = [0, 5, 63, 64, 1000]
+        mask = bitset.from_indices(indices, 1001)
+        self.assertEqual(list(bitset.iter_indices(mask)), indices)
+        self.assertEqual(list(bitset.iter_indices(0)), [])
+        self.assertEqual(bitset.count(mask), 5)
+        self.assertEqual(bitset.count(bitset.full(100)), 100)
+
+    def testSelect(self):
+        items = ['a', 'b', 'c', 'd']
+        self.assertEqual(bitset.select(items, 0b1010), ['b', 'd'])
+        # Merging and eliminating.
+        used = bitset.from_indices([0]) | bitset.from_indices([2])
+        self.assertEqual(bitset.select(items, bitset.full(4) & ~used), ['b', 'd'])
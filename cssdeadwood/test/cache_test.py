@@ -0,0 +1,72 @@
+
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+
+from cssdeadwood.cache import AnalysisCache, content_hash, CACHE_VERSION
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = AnalysisCache(self.cache_dir)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def testMatch(self):
+        calls = []
+
+        def match(candidates):
+            calls.append(set(candidates))
+            return set(c for c in candidates if c.startswith('a'))
+
+        key = content_hash('foo')
+        self.assertEqual(self.cache.match('words', key, set(['a1', 'a2', 'b1']), match), set(['a1', 'a2']))
+        self.assertEqual(self.cache.match('words', key, set(['a1', 'b1']), match), set(['a1']))
+        self.assertEqual(self.cache.match('words', key, set(['a1', 'a3', 'b2']), match), set(['a1', 'a3']))
+        self.assertEqual(calls, [set(['a1', 'a2', 'b1']), set(['a3', 'b2'])])
+        # Only the newly tested candidates are stored.
+        self.assertEqual(self.cache._connection.execute('SELECT COUNT(*) FROM matches').fetchone()[0], 5)
+        # Other content or kind: no cache hits.
+        self.assertEqual(self.cache.match('words', content_hash('bar'), set(['a1']), match), set(['a1']))
+        self.assertEqual(self.cache.match('dom', key, set(['a1']), match), set(['a1']))
+        self.assertEqual(len(calls), 4)
+
+    def testPersistent(self):
+        key = content_hash('foo')
+        self.cache.match('dom', key, set(['p', 'div']), lambda c: set(['p']))
+        self.cache.close()
+        self.cache = AnalysisCache(self.cache_dir)
+        self.assertEqual(self.cache.match('dom', key, set(['p', 'div']), lambda c: self.fail()), set(['p']))
+
+    def testVersion(self):
+        key = content_hash('foo')
+        self.cache.match('dom', key, set(['p', 'div']), lambda c: set(['p']))
+        self.cache.close()
+        # Results cached by another version are discarded.
+        connection = sqlite3.connect(self.cache.path)
+        connection.execute('PRAGMA user_version = %d' % (CACHE_VERSION - 1))
+        connection.close()
+        self.cache = AnalysisCache(self.cache_dir)
+        self.assertEqual(self.cache.match('dom', key, set(['p', 'div']), lambda c: set(['div'])), set(['div']))
+        self.cache.close()
+        self.cache = AnalysisCache(self.cache_dir)
+        self.assertEqual(self.cache.match('dom', key, set(['p', 'div']), lambda c: self.fail()), set(['div']))
+
+    def testCssSelectorLines(self):
+        css_file = os.path.join(self.cache_dir, 'style.css')
+        with open(css_file, 'w') as f:
+            f.write('p { color: red; }')
+        extract = lambda path: {'p': [1]}
+        self.assertEqual(self.cache.css_selector_lines(css_file, extract), {'p': [1]})
+        self.assertEqual(self.cache.css_selector_lines(css_file, lambda path: self.fail()), {'p': [1]})
+        with open(css_file, 'w') as f:
+            f.write('div { color: red; }')
+        self.assertEqual(self.cache.css_selector_lines(css_file, lambda path: {'div': [1]}), {'div': [1]})
@@ -0,0 +1,142 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import http.server
+import socketserver
+
+
+from cssdeadwood.crawl import crawl, extract_resources
+from cssdeadwood.app import CssDeadwoodApp
+
+
+# Site to serve: mapping of path to (content type, body).
+SITE = {
+    '/': ('text/html', b'''<html><head>
+        <link rel="stylesheet" href="/css/main.css"><link rel="icon" href="/favicon.ico">
+        <style>.inline { color: red; }</style>
+        </head><body>
+        <a href="page1.html">1</a> <a href="/page2.html#top">2</a> <a href="/old">old</a>
+        <a href="/missing.html">missing</a> <a href="http://elsewhere.invalid/">elsewhere</a>
+        </body></html>'''),
+    '/page1.html': ('text/html; charset=utf-8', b'''<html><head><link rel="stylesheet" href="css/main.css"></head>
+        <body><a href="/">home</a><a href="/page3.html">3</a><a href="/data.json">data</a></body></html>'''),
+    '/page2.html': ('text/html', b'<html><head><link rel="stylesheet" href="/css/extra.css"></head><body><p class="inline"></p></body></html>'),
+    '/page3.html': ('text/html', b'<html><head><style>.inline { color: red; }</style></head><body><p>3</p></body></html>'),
+    '/data.json': ('application/json', b'{}'),
+    '/css/main.css': ('text/css', b'.main { color: blue; }'),
+    '/css/extra.css': ('text/css', b'.extra { color: green; }'),
+}
+
+
+class SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path == '/old':
+            self.send_response(301)
+            self.send_header('Location', '/page1.html')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path in SITE:
+            content_type, body = SITE[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class CrawlTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SiteHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.base_url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        del SiteHandler.requests[:]
+
+    def testExtractResources(self):
+        links, stylesheets, styles = extract_resources(SITE['/'][1], 'http://example.com/a/b.html')
+        self.assertEqual(links, [
+            'http://example.com/a/page1.html', 'http://example.com/page2.html', 'http://example.com/old',
+            'http://example.com/missing.html', 'http://elsewhere.invalid/',
+        ])
+        self.assertEqual(stylesheets, ['http://example.com/css/main.css'])
+        self.assertEqual(styles, ['.inline { color: red; }'])
+
+    def testCrawl(self):
+        result = crawl([self.base_url + '/'], concurrency=3)
+        self.assertEqual(
+            set(result.pages),
+            set(self.base_url + p for p in ['/', '/page1.html', '/page2.html', '/page3.html'])
+        )
+        self.assertEqual(set(result.stylesheets), set([self.base_url + '/css/main.css', self.base_url + '/css/extra.css']))
+        # Identical inline style sheets are only stored once.
+        self.assertEqual(list(result.inline_styles.values()), ['.inline { color: red; }'])
+        self.assertEqual(list(result.inline_style_pages), [self.base_url + '/ <style #1>'])
+        self.assertEqual(
+            set(result.inline_style_pages[self.base_url + '/ <style #1>']),
+            set([self.base_url + '/', self.base_url + '/page3.html'])
+        )
+        self.assertEqual(list(result.errors), [self.base_url + '/missing.html'])
+        # Every resource is only fetched once.
+        self.assertEqual(sorted(set(SiteHandler.requests)), sorted(SiteHandler.requests))
+
+    def testPageBudget(self):
+        result = crawl([self.base_url + '/'], max_pages=2, concurrency=1)
+        self.assertEqual(set(result.pages), set([self.base_url + '/', self.base_url + '/page1.html']))
+        # Only accepted HTML pages cost budget (not other documents or redirects).
+        result = crawl([self.base_url + p for p in ['/data.json', '/old', '/page3.html']], max_pages=2, concurrency=1)
+        self.assertEqual(set(result.pages), set([self.base_url + '/page1.html', self.base_url + '/page3.html']))
+
+    def testSave(self):
+        result = crawl([self.base_url + '/page2.html'])
+        path = tempfile.mkdtemp()
+        try:
+            html_files, css_files = result.save(path)
+            self.assertEqual(list(html_files.values()), [self.base_url + '/page2.html'])
+            self.assertEqual(list(css_files.values()), [self.base_url + '/css/extra.css'])
+            with open(list(css_files)[0], 'rb') as f:
+                self.assertEqual(f.read(), SITE['/css/extra.css'][1])
+        finally:
+            shutil.rmtree(path)
+
+    def testAppCrawl(self):
+        path = tempfile.mkdtemp()
+        try:
+            json_export = os.path.join(path, 'report.json')
+            CssDeadwoodApp().main(['cssdeadwood', '-q', '--crawl', self.base_url + '/', '--jsonexport', json_export])
+            with open(json_export) as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(report[self.base_url + '/css/main.css']['unused_selectors'], ['.main'])
+        self.assertEqual(report[self.base_url + '/css/extra.css']['unused_selectors'], ['.extra'])
+        # Inline style sheets are only matched with the pages including them (not with page2.html).
+        inline = report[self.base_url + '/ <style #1>']
+        self.assertEqual(inline['unused_selectors'], ['.inline'])
+        self.assertEqual(set(inline['pages']), set([self.base_url + '/', self.base_url + '/page3.html']))
+        self.assertEqual(len([label for label in report if '<style' in label]), 1)
@@ -6,7 +6,7 @@ import unittest
 
 
 
-from cssdeadwood.css_extract import extract_css_selectors
+from cssdeadwood.css_extract import extract_css_selectors, extract_css_selector_lines, extract_css_imports, CssSelectorParser, selector_ids_and_classes, extract_ids_and_classes_from_selectors
 
 
 class CssExtractTest(unittest.TestCase):
@@ -162,4 +162,118 @@ class CssExtractTest(unittest.TestCase):
             set(['p', 'div.red', 'div#content h1', 'span.blue'])
         )
 
+    def test_media_nested001(self):
+        self.assertSelectorExtraction('''
+            @media screen and (min-width: 10px) {
+                .m1, .m2 { color: red }
+                @supports (display: grid) {
+                    .grid { display: grid }
+                }
+            }
+            p { color: red; }
+            ''',
+            set(['.m1', '.m2', '.grid', 'p'])
+        )
+
+    def test_at_rules001(self):
+        self.assertSelectorExtraction('''
+            @charset "utf-8";
+            @import url("foo.css");
+            p { color: red; }
+            @font-face { font-family: foo; src: url(foo.woff) }
+            @keyframes spin { from { opacity: 0 } 50% { opacity: 1 } }
+            span { color: red; }
+            ''',
+            set(['p', 'span'])
+        )
+
+    def test_commas001(self):
+        self.assertSelectorExtraction('''
+            a:not(.x, .y), div[title="a,b"] > p, :is(h1, h2) span { color: red; }
+            ''',
+            set(['a:not(.x, .y)', 'div[title="a,b"] > p', ':is(h1, h2) span'])
+        )
+
+    def test_strings001(self):
+        self.assertSelectorExtraction('''
+            a[title="{x}"] { content: "}"; }
+            p:before { content: '/* not a comment */'; }
+            span { color: red; }
+            ''',
+            set(['a[title="{x}"]', 'p:before', 'span'])
+        )
+
+
+class CssSelectorParserTest(unittest.TestCase):
+
+    css = '''@import "x.css";
+/* a { b: c } */
+a:not(.x, .y), div[title="a,b{"] > p ,
+  span.z { content: "}"; }
+@media screen {
+  .m1, .m2 { color: red }
+}
+@keyframes spin { from { x: y } }
+.after::before{content:'\\''}
+.last
+{ }
+'''
+
+    def parse(self, css, chunk_size):
+        parser = CssSelectorParser()
+        selectors = []
+        for i in range(0, len(css), chunk_size):
+            selectors.extend(parser.feed(css[i:i + chunk_size]))
+        selectors.extend(parser.close())
+        return selectors
+
+    def test_lines(self):
+        self.assertEqual(self.parse(self.css, 1000), [
+            ('a:not(.x, .y)', 3), ('div[title="a,b{"] > p', 3), ('span.z', 4),
+            ('.m1', 6), ('.m2', 6), ('.after::before', 9), ('.last', 10),
+        ])
+
+    def test_chunking(self):
+        expected = self.parse(self.css, 1000)
+        for chunk_size in range(1, 20):
+            self.assertEqual(self.parse(self.css, chunk_size), expected)
+
+    def test_imports(self):
+        parser = CssSelectorParser()
+        parser.feed('@charset "utf-8";\n@import url("a.css") screen;\n@IMPORT \'b.css\';\n/* @import "x.css"; */\n@import url( c.css );\np {}')
+        parser.close()
+        self.assertEqual(parser.imports, ['a.css', 'b.css', 'c.css'])
+
+    def test_extract_imports(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.css', delete=False) as f:
+            f.write('@import "a.css";\np { color: red; }\n@import "invalid.css";\n')
+        try:
+            self.assertEqual(extract_css_imports(f.name), ['a.css'])
+        finally:
+            os.unlink(f.name)
+
+    def test_extract_lines(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.css', delete=False) as f:
+            f.write('p { color: red; }\ndiv,\np { color: blue; }\n')
+        try:
+            self.assertEqual(extract_css_selector_lines(f.name), {'p': [1, 3], 'div': [2]})
+        finally:
+            os.unlink(f.name)
+
+
+class IdsAndClassesTest(unittest.TestCase):
+
+    def test_selector_ids_and_classes(self):
+        self.assertEqual(selector_ids_and_classes('#content div.ad'), (['content'], ['ad']))
+        self.assertEqual(selector_ids_and_classes('.btn-primary:hover, #main_nav'), (['main_nav'], ['btn-primary']))
+        self.assertEqual(selector_ids_and_classes('a[href$=".pdf"]'), ([], []))
+        self.assertEqual(selector_ids_and_classes('.md\\:flex'), ([], ['md:flex']))
+        self.assertEqual(sorted(selector_ids_and_classes('div:not(.x):is(.y, #z)')[1]), ['x', 'y'])
+        # Fallback for selectors that can not be parsed.
+        self.assertEqual(selector_ids_and_classes('.a-b[x'), ([], ['a-b']))
 
+    def test_extract_ids_and_classes(self):
+        ids, classes, origins = extract_ids_and_classes_from_selectors(['#nav .item-x', '.item-x.item-x', '#nav'])
+        self.assertEqual(ids, set(['nav']))
+        self.assertEqual(classes, set(['item-x']))
+        self.assertEqual(origins['.item-x'], ['#nav .item-x', '.item-x.item-x'])
@@ -1,11 +1,21 @@
 
+import io
 import os
 import sys
+import shutil
 import tempfile
 import unittest
 
 
-from cssdeadwood.dom_match import match_selectors_against_html_string
+import cssselect
+import lxml.etree
+
+
+from cssdeadwood.dom_match import match_selectors_against_html_string, match_selectors_against_html_resource, compile_selector
+from cssdeadwood.dom_match import canonical_selector, equivalent_selector_groups, SelectorGroups, _generalizes
+from cssdeadwood.dom_match import SelectorRequirements, DocumentIndex, RawDocumentIndex, ENGINE_XPATH, ENGINE_BULK, ENGINES
+from cssdeadwood.dom_match import count_selector_matches_against_html_root_element
+from cssdeadwood import bitset
 
 
 class CssMatchTest(unittest.TestCase):
@@ -83,4 +93,260 @@ class CssMatchTest(unittest.TestCase):
         self.assertEqual(result, set(['p:first-letter']))
 
 
+    def testCompiledSelectorReuse(self):
+        compile_selector.cache_clear()
+        canonical_selector.cache_clear()
+        selectors = set(['p', 'div > a', 'h4:hover'])
+        for html in [
+            '<html><body><p>hello</p></body></html>',
+            '<html><body><div><a href="/">world</a></div></body></html>',
+            '<html><body><h4>title</h4><p>hello</p></body></html>',
+        ]:
+            match_selectors_against_html_string(selectors, html)
+        info = compile_selector.cache_info()
+        self.assertEqual(info.misses, 3)
+        # One lookup by canonical_selector() (cached itself) and one per match.
+        self.assertEqual(info.hits, 9)
+
+
+    def testInvalidSelector(self):
+        html = '<html><head></head><body><p>hello world</p></body></html>'
+        self.assertEqual(compile_selector('p >'), ())
+        selectors = set(['p', 'p >'])
+        result = match_selectors_against_html_string(selectors, html)
+        self.assertEqual(result, set(['p']))
+
+
+    def testSelectorRequirements(self):
+        requirements = SelectorRequirements(cssselect.parse('div#main > UL.nav li.item.active a[href]:not(.x):hover')[0].parsed_tree)
+        self.assertEqual(requirements.tags, set(['div', 'ul', 'li', 'a']))
+        self.assertEqual(requirements.ids, set(['main']))
+        self.assertEqual(requirements.classes, set(['nav', 'item', 'active']))
+        self.assertEqual(requirements.attributes, set(['href']))
+
+        requirements = SelectorRequirements(cssselect.parse('*:not(#x)')[0].parsed_tree)
+        self.assertEqual((requirements.tags, requirements.ids, requirements.classes), (set(), set(), set()))
+
+
+    def testDocumentIndex(self):
+        html = '<html><body id="b"><div class=" a  b\tc"><a href="/" data-x="y">x</a></div><!-- comment --></body></html>'
+        index = DocumentIndex(lxml.etree.fromstring(html, parser=lxml.etree.HTMLParser()))
+        self.assertEqual(index.tags, set(['html', 'body', 'div', 'a']))
+        self.assertEqual(index.ids, set(['b']))
+        self.assertEqual(index.classes, set(['a', 'b', 'c']))
+        self.assertEqual(index.attributes, set(['id', 'class', 'href', 'data-x']))
+
+
+    def testIndexRejection(self):
+        html = '<html><body id="b"><div class="a b"><p>hello <a href="/">world</a></p></div></body></html>'
+        selectors = set([
+            'div.a', 'div.c', '#b p', '#c p', 'p:not(.c)', 'a[href]', 'a[title]', 'span', 'div.a.b > p a', 'DIV.a',
+        ])
+        result = match_selectors_against_html_string(selectors, html)
+        self.assertEqual(result, set(['div.a', '#b p', 'p:not(.c)', 'a[href]', 'div.a.b > p a', 'DIV.a']))
+
+
+
+class EquivalentSelectorsTest(unittest.TestCase):
+
+    def testCanonicalSelector(self):
+        self.assertEqual(canonical_selector('a:hover'), canonical_selector('a'))
+        self.assertEqual(canonical_selector('A:focus::before'), canonical_selector('a'))
+        self.assertEqual(canonical_selector('input::-moz-placeholder'), canonical_selector('input:-moz-focusring'))
+        self.assertNotEqual(canonical_selector('a.x'), canonical_selector('a'))
+        self.assertEqual(canonical_selector('p >'), None)
+
+    def testGroups(self):
+        groups = equivalent_selector_groups(['a', 'p', 'a:hover', 'a::after', 'p >'])
+        self.assertEqual(sorted(groups.values()), [['a', 'a:hover', 'a::after'], ['p'], ['p >']])
+
+    def testSelectorGroups(self):
+        groups = SelectorGroups(['a', 'a:hover', 'p', 'A::before', 'p.x'])
+        stats = {}
+        self.assertEqual(groups.representatives(bitset.full(5), stats), ['a', 'p', 'p.x'])
+        self.assertEqual(stats['equivalent_selectors'], 2)
+        self.assertEqual(groups.found_mask(['a']), bitset.from_indices([0, 1, 3]))
+        self.assertEqual(groups.representatives(bitset.from_indices([2, 4])), ['p', 'p.x'])
+        html = '<html><body><p>x</p><a>y</a></body></html>'
+        found = match_selectors_against_html_string(groups.representatives(bitset.full(5)), html)
+        self.assertEqual(groups.found_mask(found), bitset.from_indices([0, 1, 2, 3]))
+
+    def testFanOut(self):
+        html = '<html><body><a href="/">x</a><input/></body></html>'
+        selectors = set(['a', 'a:visited', 'a:-webkit-any-link', 'input::-webkit-input-placeholder', 'p', 'p:hover'])
+        for engine in ENGINES:
+            stats = {}
+            result = match_selectors_against_html_string(selectors, html, engine=engine, stats=stats)
+            self.assertEqual(result, set(['a', 'a:visited', 'a:-webkit-any-link', 'input::-webkit-input-placeholder']))
+            self.assertEqual(stats['equivalent_selectors'], 3)
+        counts = count_selector_matches_against_html_root_element(selectors, lxml.etree.fromstring(html, parser=lxml.etree.HTMLParser()))
+        self.assertEqual(counts['a:visited'], 1)
+
+
+class SubsumptionTest(unittest.TestCase):
+
+    def generalizes(self, general, specific):
+        return _generalizes(compile_selector(general)[0].lattice_key, compile_selector(specific)[0].lattice_key)
+
+    def testGeneralizes(self):
+        self.assertTrue(self.generalizes('.item', '.nav .item.active'))
+        self.assertTrue(self.generalizes('.active', 'li.item.active:hover'))
+        self.assertTrue(self.generalizes('.nav .active', '.nav > ul .item.active'))
+        self.assertTrue(self.generalizes('div .a', 'p + div.x .a'))
+        self.assertTrue(self.generalizes('a[href]', 'h1 ~ a[href][title]'))
+        self.assertFalse(self.generalizes('.nav .active', '.nav + .active'))
+        self.assertFalse(self.generalizes('.nav > .active', '.nav > ul > .active'))
+        self.assertFalse(self.generalizes('.nav .item .active', '.item .nav .active'))
+        self.assertFalse(self.generalizes('a.x', '.x'))
+        self.assertFalse(self.generalizes('a[href=x]', 'a[href^=x]'))
+        self.assertEqual(compile_selector('li:first-child')[0].lattice_key, None)
+        self.assertEqual(compile_selector('li:not(.x)')[0].lattice_key, None)
+
+    def testInference(self):
+        html = '<html><body><div class="nav"><ul><li class="item active">x</li><li class="item">y</li></ul></div><p class="x y"></p></body></html>'
+        selectors = set([
+            '.item', '.active', 'li.active', '.nav .item.active', 'ul > .item.active',
+            'p.x', 'p.x.y', 'p.y.x:hover', 'div p.x', 'div p.x.y', 'body div p.x.y',
+            'li:first-child', 'li:nth-child(3)',
+        ])
+        stats = {}
+        found = match_selectors_against_html_string(selectors, html, engine=ENGINE_XPATH, stats=stats)
+        expected = set(['.item', '.active', 'li.active', '.nav .item.active', 'ul > .item.active', 'p.x', 'p.x.y', 'p.y.x:hover', 'li:first-child'])
+        self.assertEqual(found, expected)
+        self.assertEqual(match_selectors_against_html_string(selectors, html, engine=ENGINE_BULK), expected)
+        self.assertGreater(stats['inferences'], 0)
+        self.assertEqual(stats['evaluations'] + stats['inferences'], len(selectors) - stats['equivalent_selectors'])
+
+
+class BulkEngineTest(unittest.TestCase):
+
+    html = '''<html><head></head><body id="b">
+        <div class="nav main"><ul><li class="item active">one</li><li class="item">two<!-- c --></li><li></li></ul></div>
+        <p title="foo-bar">hello <a href="/world" class="x">world</a> <em></em></p>
+        </body></html>'''
+
+    def assertSameAsXpath(self, selectors, expected):
+        self.assertEqual(match_selectors_against_html_string(selectors, self.html, engine=ENGINE_XPATH), expected)
+        self.assertEqual(match_selectors_against_html_string(selectors, self.html, engine=ENGINE_BULK), expected)
+        html_resource = io.BytesIO(self.html.encode('utf-8'))
+        self.assertEqual(match_selectors_against_html_resource(selectors, html_resource, engine=ENGINE_BULK, streaming=True), expected)
+
+    def testCombinators(self):
+        self.assertSameAsXpath(
+            set(['div li', 'div > li', 'ul > li', '.nav .active', 'li + li', 'li.active ~ li', 'li ~ li.active', 'body > p > a', 'html p a.x', 'a + em']),
+            set(['div li', 'ul > li', '.nav .active', 'li + li', 'li.active ~ li', 'body > p > a', 'html p a.x', 'a + em'])
+        )
+
+    def testNamespaces(self):
+        # Namespaced selectors can not be compiled exactly, but are still matched.
+        self.assertSameAsXpath(set(['*|li', 'ul > *|li', '*|li.active', '*|h1']), set(['*|li', 'ul > *|li', '*|li.active']))
+
+    def testIdsClassesAttributes(self):
+        self.assertSameAsXpath(
+            set(['#b', '#b p', '#x', '.item.active', '.item.x', 'p[title]', 'p[title|=foo]', 'p[title^=bar]', 'a[href$=world]', '[title~=foo]']),
+            set(['#b', '#b p', '.item.active', 'p[title]', 'p[title|=foo]', 'a[href$=world]'])
+        )
+
+    def testPseudoClasses(self):
+        self.assertSameAsXpath(
+            set(['li:first-child', 'li:last-child.item', 'li:empty', 'em:empty', 'li:not(.item)', 'a:hover', 'html:root', 'p:root', 'div:only-child', 'li:first-of-type']),
+            set(['li:first-child', 'li:empty', 'em:empty', 'li:not(.item)', 'a:hover', 'html:root', 'li:first-of-type'])
+        )
+
+    def testNthPseudoClasses(self):
+        self.assertSameAsXpath(
+            set(['li:nth-child(2)', 'li:nth-child(5)', 'li:nth-child(2n+1)', 'li:nth-last-child(3)', 'li:nth-of-type(-n+1)', 'p:nth-last-of-type(2)']),
+            set(['li:nth-child(2)', 'li:nth-child(2n+1)', 'li:nth-last-child(3)', 'li:nth-of-type(-n+1)'])
+        )
+
+    def testUnsupportedFallback(self):
+        self.assertEqual(compile_selector('p:contains("hello")')[0].chain, None)
+        self.assertSameAsXpath(
+            set(['li:nth-child(2)', 'p:contains("hello")', 'p:contains("world!")']),
+            set(['li:nth-child(2)', 'p:contains("hello")'])
+        )
+
+
+class StreamingTest(unittest.TestCase):
+
+    def match(self, selectors, html):
+        stats = {}
+        found = match_selectors_against_html_resource(set(selectors), io.BytesIO(html.encode('utf-8')), streaming=True, stats=stats)
+        return found, stats
+
+    def testEarlyExit(self):
+        html = '<html><body><div class="a"><p>x</p></div>' + '<p class="b">y</p>' * 100 + '</body></html>'
+        found, stats = self.match(['div.a p', 'body'], html)
+        self.assertEqual(found, set(['div.a p', 'body']))
+        # "body" is only complete at the end.
+        self.assertEqual(stats['streamed_elements'], 103)
+        found, stats = self.match(['div.a p', 'div'], html)
+        self.assertEqual(found, set(['div.a p', 'div']))
+        self.assertEqual(stats['streamed_elements'], 2)
+
+    def testFreedElements(self):
+        html = '<html><body><ul><li><a>1</a></li><li><a>2</a></li><li><a>3</a></li></ul><p></p></body></html>'
+        found, stats = self.match(['li:empty', 'ul:empty', 'li + li a', 'ul + p', 'p:empty', 'ul ~ ul'], html)
+        self.assertEqual(found, set(['li + li a', 'ul + p', 'p:empty']))
+        self.assertEqual(stats.get('full_parses', 0), 0)
+
+    def testFullParseFallback(self):
+        html = '<html><body><ul><li class="a">1</li><li class="b">2</li></ul></body></html>'
+        # Relaxed forms "li.x" and "p" do not match: no need for full parse.
+        found, stats = self.match(['li.x:last-child', 'p:contains("2")'], html)
+        self.assertEqual(found, set())
+        self.assertEqual(stats.get('full_parses', 0), 0)
+        found, stats = self.match(['li.a:last-child', 'li.b:last-child', 'ul:contains("2")'], html)
+        self.assertEqual(found, set(['li.b:last-child', 'ul:contains("2")']))
+        self.assertEqual(stats['full_parses'], 1)
+
+
+class PrefilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def match(self, selectors, html):
+        html_file = os.path.join(self.path, 'page.html')
+        with open(html_file, 'wb') as f:
+            f.write(html.encode('utf-8'))
+        stats = {}
+        found = match_selectors_against_html_resource(set(selectors), html_file, stats=stats)
+        self.assertEqual(found, match_selectors_against_html_resource(set(selectors), html_file, prefilter=False))
+        return found, stats
+
+    def testRawDocumentIndex(self):
+        html = b'''<html><body ID = 'b'><div class=" a  b\tc" data-id="x"><p class=d/>\xc3\xa9</div><p id="p"class=""></p></body></html>'''
+        index = RawDocumentIndex.scan(html)
+        self.assertEqual(index.ids, set(['b', 'p']))
+        self.assertEqual(index.classes - set(['']), set(['a', 'b', 'c', 'd/']))
+        self.assertEqual(RawDocumentIndex.scan(b'<p class="a&amp;b">'), None)
+        self.assertEqual(RawDocumentIndex.scan('<p class="a">'.encode('utf-16')), None)
+
+    def testSkipParse(self):
+        html = '<html><body id="b"><div class="a b"><p>x</p></div></body></html>'
+        found, stats = self.match(['.c', '#x p', 'div.a.c'], html)
+        self.assertEqual(found, set())
+        self.assertEqual(stats['prefilter_skips'], 1)
+        self.assertNotIn('parse_time', stats)
+        # Non-ASCII classes are not checked.
+        found, stats = self.match(['.c', '.\u00e9t\u00e9 p'], html)
+        self.assertEqual(found, set())
+        self.assertNotIn('prefilter_skips', stats)
+        found, stats = self.match(['.c', '#b .a', 'p.b', 'div.b'], html)
+        self.assertEqual(found, set(['#b .a', 'div.b']))
+        self.assertIn('parse_time', stats)
+
+
+class CountSelectorMatchesTest(unittest.TestCase):
 
+    def testCounts(self):
+        html = '<html><body><ul><li class="a">1</li><li>2</li><li class="a">3</li></ul><p>x</p></body></html>'
+        html_element = lxml.etree.fromstring(html, lxml.etree.HTMLParser())
+        selectors = set(['li', 'li.a, p', 'ul li', 'li + li', 'li:contains("2")', 'div', 'li, li.a'])
+        for engine in ENGINES:
+            counts = count_selector_matches_against_html_root_element(selectors, html_element, engine=engine)
+            self.assertEqual(counts, {'li': 3, 'li.a, p': 3, 'ul li': 3, 'li + li': 2, 'li:contains("2")': 1, 'li, li.a': 3})
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+import lxml.etree
+
+
+from cssdeadwood.discover import resolve_reference, StylesheetRegistry
+from cssdeadwood.app import CssDeadwoodApp
+
+
+def write_files(path, files):
+    for name, content in files.items():
+        file_name = os.path.join(path, name)
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        with open(file_name, 'w') as f:
+            f.write(content)
+
+
+# Small static site: pages with linked, imported and inline style sheets.
+SITE = {
+    'css/base.css': '@import "reset.css";\n.nav { x: y }\n.unused { x: y }\n',
+    'css/reset.css': '@import "base.css";\np { x: y }\nli { x: y }\n',
+    'css/blog.css': '.post { x: y }\n.nav { x: y }\n',
+    'index.html': '''<html><head><link rel="stylesheet" href="css/base.css?v=1"><link rel="icon" href="x.ico">
+        <style>.inline { x: y }</style></head><body><div class="nav"><p>x</p></div></body></html>''',
+    'blog/post.html': '''<html><head><link rel="stylesheet" href="/css/blog.css"><link rel="stylesheet" href="http://cdn.invalid/x.css">
+        <style>.inline { x: y }</style></head><body><div class="post"><span class="inline"></span></div></body></html>''',
+}
+
+
+class DiscoverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        write_files(self.path, SITE)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testResolveReference(self):
+        base = os.path.join('site', 'blog', 'post.html')
+        self.assertEqual(resolve_reference('../css/a.css?v=2#x', base), os.path.join('site', 'css', 'a.css'))
+        self.assertEqual(resolve_reference('a%20b.css', base), os.path.join('site', 'blog', 'a b.css'))
+        self.assertEqual(resolve_reference('/css/a.css', base), None)
+        self.assertEqual(resolve_reference('/css/a.css', base, site_root='site'), os.path.join('site', 'css', 'a.css'))
+        self.assertEqual(resolve_reference('http://example.com/a.css', base), None)
+        self.assertEqual(resolve_reference('//example.com/a.css', base), None)
+
+    def testPageStylesheets(self):
+        registry = StylesheetRegistry(site_root=self.path)
+        css = lambda name: os.path.join(self.path, 'css', name)
+        index = os.path.join(self.path, 'index.html')
+        post = os.path.join(self.path, 'blog', 'post.html')
+        keys = registry.page_stylesheets(lxml.etree.parse(index, lxml.etree.HTMLParser()).getroot(), index)
+        self.assertEqual(keys, [css('base.css'), css('reset.css'), index + ' <style #1>'])
+        keys = registry.page_stylesheets(lxml.etree.parse(post, lxml.etree.HTMLParser()).getroot(), post)
+        # Identical inline style sheets are only loaded once.
+        self.assertEqual(keys, [css('blog.css'), index + ' <style #1>'])
+        self.assertEqual(list(registry.selector_lines), [css('base.css'), css('reset.css'), index + ' <style #1>', css('blog.css')])
+        self.assertEqual(registry.selector_lines[css('reset.css')], {'p': [2], 'li': [3]})
+
+    def testAppHtmlOnly(self):
+        app = CssDeadwoodApp()
+        results = app._match_html_files_against_own_stylesheets(
+            [os.path.join(self.path, 'index.html'), os.path.join(self.path, 'blog', 'post.html')],
+            site_root=self.path
+        )
+        unused = dict((os.path.basename(k), v['unused_selectors']) for k, v in results.items())
+        self.assertEqual(unused, {
+            'base.css': set(['.unused']),
+            'reset.css': set(['li']),
+            'post.html <style #1>': set(),
+            # ".nav" is used by index.html, but that page does not use blog.css.
+            'blog.css': set(['.nav']),
+        })
+        self.assertEqual(results[os.path.join(self.path, 'css', 'blog.css')]['pages'], [os.path.join(self.path, 'blog', 'post.html')])
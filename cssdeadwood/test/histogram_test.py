@@ -0,0 +1,24 @@
+import array
+import unittest
+
+
+from cssdeadwood.histogram import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+
+    def testAdd(self):
+        histogram = Histogram(['b', 'a', 'c'])
+        self.assertEqual(histogram.keys, ['a', 'b', 'c'])
+        histogram.add({'a': 2, 'c': 1})
+        histogram.add(array.array('Q', [3, 0, 0]))
+        histogram.add(histogram.to_array({'b': 0, 'c': 5}))
+        self.assertEqual(histogram.get('a'), (2, 5))
+        self.assertEqual(histogram.get('b'), (0, 0))
+        self.assertEqual(histogram.get('c'), (2, 6))
+
+    def testExport(self):
+        histogram = Histogram(['a', 'b'])
+        histogram.add({'a': 4})
+        self.assertEqual(histogram.export(), {'a': {'documents': 1, 'hits': 4}, 'b': {'documents': 0, 'hits': 0}})
+        self.assertEqual(histogram.export('pages', 'elements', keys=['a']), {'a': {'pages': 1, 'elements': 4}})
@@ -0,0 +1,103 @@
+
+
+import time
+import pickle
+import threading
+import concurrent.futures
+import unittest
+
+
+from cssdeadwood.parallel import shrinking_map, share, shared, unshare, Pipeline
+
+
+def _find(item, remaining):
+    return set(w for w in remaining if w in item)
+
+
+class ShrinkingMapTest(unittest.TestCase):
+
+    def testShrinking(self):
+        remaining = set('abcdefgh')
+        seen_args = []
+
+        def get_args():
+            seen_args.append(len(remaining))
+            return (set(remaining),) if remaining else None
+
+        items = ['abc', 'xyz', 'ab', 'cd', 'efgh', 'ijk', 'a']
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            for item, found in shrinking_map(executor, _find, items, get_args, max_pending=1):
+                remaining.difference_update(found)
+        self.assertEqual(remaining, set())
+        # Argument sets should shrink, and no more items should be submitted
+        # after everything was found.
+        self.assertEqual(seen_args, [8, 5, 5, 5, 4, 0])
+
+    def testAllItems(self):
+        items = list(range(20))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            results = dict(shrinking_map(executor, lambda x, y: x * y, items, lambda: (3,), max_pending=5))
+        self.assertEqual(results, dict((x, 3 * x) for x in items))
+
+
+def _shared_length(ref):
+    return len(shared(ref))
+
+
+class ShareTest(unittest.TestCase):
+
+    def testShare(self):
+        items = list(range(1000))
+        ref = share(items)
+        try:
+            # References (with fork start method) are small to pickle and resolve to the shared object.
+            self.assertLessEqual(len(pickle.dumps(ref)), len(pickle.dumps(items)))
+            self.assertIs(shared(pickle.loads(pickle.dumps(ref))), items)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+                self.assertEqual(list(executor.map(_shared_length, [ref, ref])), [1000, 1000])
+        finally:
+            unshare(ref)
+
+
+class PipelineTest(unittest.TestCase):
+
+    def testStages(self):
+        pipeline = Pipeline([('double', lambda x: 2 * x), ('str', str)], queue_size=2)
+        self.assertEqual(list(pipeline.run(range(20))), [str(2 * x) for x in range(20)])
+        self.assertEqual([s.items for s in pipeline.stages], [20, 20])
+        self.assertEqual(pipeline.consumer.items, 20)
+        self.assertLessEqual(pipeline.stages[1].depth_max, 2)
+
+    def testBackpressure(self):
+        read = []
+        pipeline = Pipeline([('read', lambda x: read.append(x) or x)], queue_size=3)
+        results = pipeline.run(range(100))
+        self.assertEqual(next(results), 0)
+        time.sleep(0.1)
+        # Bounded read ahead: queued items, plus one blocked on put.
+        self.assertLessEqual(len(read), 1 + 3 + 1)
+        # Stop early.
+        results.close()
+        self.assertLess(len(read), 10)
+        self.assertEqual([t for t in threading.enumerate() if t.name.startswith('pipeline-')], [])
+
+    def testStageQueueSize(self):
+        parsed = []
+        pipeline = Pipeline([('read', lambda x: x), ('parse', lambda x: parsed.append(x) or x, 1)], queue_size=5)
+        results = pipeline.run(range(100))
+        self.assertEqual(next(results), 0)
+        time.sleep(0.1)
+        # Besides the consumed item, one parsed item is queued (or being parsed).
+        self.assertEqual(len(parsed), 1 + 1)
+        results.close()
+
+    def testFailure(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+        results = []
+        with self.assertRaises(ValueError):
+            for x in Pipeline([('fail', fail), ('identity', lambda x: x)]).run(range(10)):
+                results.append(x)
+        self.assertEqual(results, [0, 1, 2])
@@ -0,0 +1,63 @@
+
+
+import io
+import os
+import unittest
+
+
+from cssdeadwood.app import CssDeadwoodApp
+from cssdeadwood.profiling import Collector, Instrumentation, Profiler
+
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), 'files')
+
+
+class RecordingCollector(Collector):
+
+    def __init__(self):
+        self.events = []
+
+    def stage(self, name, duration):
+        self.events.append(('stage', name))
+
+    def file(self, stage, path, duration, details=None):
+        self.events.append(('file', stage, os.path.basename(path)))
+
+    def count(self, name, value=1):
+        self.events.append(('count', name, value))
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def testReport(self):
+        profiler = Profiler(top=2)
+        instrumentation = Instrumentation([profiler])
+        with instrumentation.timed_stage('foo'):
+            instrumentation.file('foo', 'a.html', 0.5, {'parse_time': 0.1})
+            instrumentation.file('foo', 'b.html', 1.5)
+            instrumentation.file('foo', 'c.html', 1.0)
+        instrumentation.selectors('foo', {'p': 0.1, 'div': 0.3, 'a': 0.2})
+        instrumentation.count('pages', 3)
+        report = profiler.report()
+        self.assertEqual(list(report['stages'].keys()), ['foo'])
+        self.assertEqual([f['path'] for f in report['slowest_files']['foo']], ['b.html', 'c.html'])
+        self.assertEqual(report['file_totals']['foo'], {'count': 3, 'duration': 3.0})
+        self.assertEqual([s['selector'] for s in report['slowest_selectors']], ['div', 'a'])
+        self.assertEqual(report['counters'], {'pages': 3})
+        out = io.StringIO()
+        profiler.print_report(out=out)
+        self.assertIn('b.html', out.getvalue())
+
+    def testAppCollectors(self):
+        collector = RecordingCollector()
+        app = CssDeadwoodApp(collectors=[collector])
+        app.main(['cssdeadwood', '-q',
+            os.path.join(FILES_DIR, 'css', 'css001.css'),
+            os.path.join(FILES_DIR, 'html', 'html001.html'),
+            os.path.join(FILES_DIR, 'python', 'python001.py'),
+        ])
+        self.assertIn(('stage', 'dom_matching'), collector.events)
+        self.assertIn(('file', 'dom_matching', 'html001.html'), collector.events)
+        self.assertIn(('file', 'idclass_grepping', 'python001.py'), collector.events)
+        self.assertIn(('count', 'selectors', 5), collector.events)
+        self.assertEqual(app.profiler.counters['unused_selectors'], 1)
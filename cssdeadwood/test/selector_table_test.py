@@ -0,0 +1,44 @@
+import unittest
+
+
+from cssdeadwood.selector_table import SelectorTable
+
+
+class SelectorTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = SelectorTable()
+        self.table.add_selector_lines('a.css', {'#nav .item': [1, 5], '.item-x': [2], 'p': [3]})
+        self.table.add_selector_lines('b.css', {'.item-x': [7], '#nav': [8]})
+
+    def testRecords(self):
+        table = self.table
+        self.assertEqual(len(table), 4)
+        self.assertEqual([table.selector(i) for i in range(4)], ['#nav .item', '.item-x', 'p', '#nav'])
+        self.assertEqual(table.id('#nav'), 3)
+        self.assertIn('p', table)
+        self.assertEqual(table.add('p'), 2)
+        self.assertEqual(table.sources('.item-x'), [('a.css', 2), ('b.css', 7)])
+        self.assertEqual(list(table.file_selectors('b.css')), [3, 1])
+
+    def testIdsAndClasses(self):
+        table = self.table
+        self.assertEqual(table.ids_and_classes(), (set(['nav']), set(['item', 'item-x'])))
+        self.assertEqual(table.ids_and_classes(table.mask(['p', '.item-x'])), (set(), set(['item-x'])))
+        self.assertEqual(list(table.word_selectors('nav')), [0, 3])
+        self.assertEqual(list(table.word_selectors('item-')), [])
+
+    def testMasks(self):
+        table = self.table
+        self.assertEqual(table.mask(['#nav .item', 2]), 0b101)
+        self.assertEqual(table.full_mask(), 0b1111)
+        self.assertEqual(table.selectors(table.full_mask() & ~table.mask(['p'])), ['#nav .item', '.item-x', '#nav'])
+        self.assertEqual(list(SelectorTable.iter_ids(0)), [])
+        self.assertEqual(list(SelectorTable.iter_ids(1 << 1000 | 2)), [1, 1000])
+
+    def testWordMasks(self):
+        table = self.table
+        word_mask = table.word_mask(['nav'])
+        self.assertEqual([table.words[i] for i in SelectorTable.iter_ids(word_mask)], ['nav'])
+        self.assertEqual(table.word_selector_mask(word_mask), table.mask([0, 3]))
+        self.assertEqual(table.selector_list()[2], table.selector(2))
@@ -0,0 +1,103 @@
+
+import unittest
+
+
+from cssdeadwood.tokenizers import TokenIndex, tokenize, tokenizer_for, parse_tokenizers, register_tokenizer, TOKENIZERS, DEFAULT_TOKENIZERS
+
+
+class TokenizersTest(unittest.TestCase):
+
+    def testScript(self):
+        content = b'''
+            // Toggle the active state, if hidden
+            const size = 'lg'; /* "row" */
+            el.classList.add("btn", 'btn-' + size);
+            return <div className={classNames('card', {active: isActive, 'is-open': open})}>{`col-${n}`}</div>;
+        '''
+        tokens = tokenize(content, 'script')
+        self.assertEqual(
+            set(tokens),
+            set([b'lg', b'btn', b'btn-', b'card', b'active', b'is-open', b'col-', b'n'])
+        )
+
+    def testStrings(self):
+        content = b'''
+# Render the row, unless hidden
+def render(size, active):
+    """Panel with "row" header."""
+    return tag('div', class_="panel panel-%s" % size, id=f"item-{active}")
+'''
+        tokens = tokenize(content, 'strings')
+        self.assertEqual(
+            set(tokens),
+            set([b'Panel', b'with', b'row', b'header', b'div', b'panel', b'panel-', b's', b'item-', b'active'])
+        )
+
+    def testMarkup(self):
+        content = b'''<div class="nav <?php echo $open ? 'open' : '' ?>" id=main>
+            <p class=lead>Some text</p></div>'''
+        tokens = tokenize(content, 'markup')
+        self.assertEqual(set(tokens), set([b'nav', b'php', b'echo', b'open', b'main', b'lead']))
+        self.assertNotIn(b'text', tokens)
+
+    def testParseTokenizers(self):
+        self.assertEqual(parse_tokenizers(''), {})
+        self.assertEqual(parse_tokenizers('.JS=script, .inc=markup'), {'.js': 'script', '.inc': 'markup'})
+        tokenizers = parse_tokenizers('auto,.py=words')
+        self.assertNotIn('.py', tokenizers)
+        self.assertEqual(tokenizers['.jsx'], 'script')
+        self.assertEqual(len(tokenizers), len(DEFAULT_TOKENIZERS) - 1)
+        self.assertRaises(ValueError, parse_tokenizers, '.js=foo')
+        self.assertRaises(ValueError, parse_tokenizers, 'js')
+        self.assertEqual(tokenizer_for('/x/App.TSX', DEFAULT_TOKENIZERS), 'script')
+        self.assertEqual(tokenizer_for('/x/notes.txt', DEFAULT_TOKENIZERS), None)
+        self.assertEqual(tokenizer_for('/x/app.js', {}), None)
+
+    def testRegisterTokenizer(self):
+        register_tokenizer('lines', lambda content: tokenize(b'"' + content.replace(b'\n', b'" "') + b'"', 'markup'))
+        try:
+            self.assertEqual(parse_tokenizers('.txt=lines'), {'.txt': 'lines'})
+            self.assertEqual(set(tokenize(b'a\nb-c', 'lines')), set([b'a', b'b-c']))
+        finally:
+            del TOKENIZERS['lines']
+
+
+class TokenIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TokenIndex()
+        self.index.add('a.js', tokenize(b'x("btn btn-lg"); y("btn-" + size, "row")', 'script'))
+        self.index.add('b.js', tokenize(b'x("row", "-active", "sm:flex")', 'script'))
+
+    def testCounts(self):
+        self.assertEqual(self.index.counts('btn'), {'a.js': 1})
+        self.assertEqual(self.index.counts('btn-lg'), {'a.js': 2})
+        # Prefix and suffix fragments of dynamically built names.
+        self.assertEqual(self.index.counts('btn-primary'), {'a.js': 1})
+        self.assertEqual(self.index.counts('is-active'), {'b.js': 1})
+        self.assertEqual(self.index.counts('row'), {'a.js': 1, 'b.js': 1})
+        self.assertEqual(self.index.counts('bt'), {})
+        self.assertEqual(self.index.counts('active'), {})
+        # Names with other characters (e.g. escaped in CSS).
+        self.assertEqual(self.index.counts('sm:flex'), {'b.js': 1})
+        self.assertEqual(self.index.counts('md:flex'), {})
+
+    def testFind(self):
+        words = ['btn', 'row', 'is-active', 'hidden']
+        self.assertEqual(self.index.find(words), {'a.js': set(['btn', 'row']), 'b.js': set(['is-active'])})
+        self.assertEqual(self.index.find(words, files=['b.js']), {'b.js': set(['row', 'is-active'])})
+        words = ['btn', 'row', 'sm:flex', 'md:flex']
+        self.assertEqual(self.index.find(words, files=['b.js', 'c.js']), {'b.js': set(['row', 'sm:flex'])})
+        self.assertEqual(self.index.find(words, files=set(['a.js', 'b.js'])), {'a.js': set(['btn', 'row']), 'b.js': set(['sm:flex'])})
+        self.assertEqual(self.index.find(words, files=[]), {})
+
+    def testUpdateAndRemove(self):
+        self.index.add('a.js', tokenize(b'x("hidden")', 'script'))
+        self.assertEqual(self.index.files('btn'), set())
+        self.assertEqual(self.index.files('hidden'), set(['a.js']))
+        self.index.remove('a.js')
+        self.index.remove('c.js')
+        self.assertEqual(len(self.index), 1)
+        self.assertNotIn('a.js', self.index)
+        self.assertEqual(self.index.files('hidden'), set())
+        self.assertEqual(self.index.files('row'), set(['b.js']))
@@ -0,0 +1,177 @@
+
+
+import os
+import re
+import mmap
+import shutil
+import tempfile
+import unittest
+
+
+from cssdeadwood.utils import get_occuring_words, count_occuring_words, discover_files, collect_files, IgnoreRules, open_source_file, read_source_file, _iter_token_chunks, REGEX_HYPHENATED_BYTES, _REGEX_NON_HYPHENATED_BYTE
+
+
+class GetOccuringWordsTest(unittest.TestCase):
+
+    def assertSameAsRegexSearch(self, words, content):
+        expected = set(w for w in words if re.search(r'\b%s\b' % re.escape(w), content))
+        self.assertEqual(get_occuring_words(words, content), expected)
+
+    def testSimple(self):
+        content = '<div class="ad premium">buy <b>more</b></div>'
+        result = get_occuring_words(set(['ad', 'premium', 'buy', 'less', 'div']), content)
+        self.assertEqual(result, set(['ad', 'premium', 'buy', 'div']))
+
+    def testWordBoundaries(self):
+        content = 'foo_bar foo-baz sidebar nav2 $x'
+        result = get_occuring_words(set(['foo', 'bar', 'baz', 'side', 'nav', 'nav2', 'x']), content)
+        self.assertEqual(result, set(['foo', 'baz', 'nav2', 'x']))
+
+    def testNoWords(self):
+        self.assertEqual(get_occuring_words(set(), 'foo bar'), set())
+        self.assertEqual(get_occuring_words(set(['foo']), ''), set())
+
+    def testSameAsRegexSearch(self):
+        content = 'Lorem ipsum_dolor sit-amet, consectetur (adipiscing) elit 123 x1y2.'
+        words = ['Lorem', 'lorem', 'ipsum', 'ipsum_dolor', 'sit', 'amet', 'adipiscing', '123', '12', 'x1y2', 'elit 123', 'sit-amet']
+        self.assertSameAsRegexSearch(words, content)
+
+    def testHyphenatedWords(self):
+        content = 'x-btn-primary-lg btn--x btn_a-b a-b-c -a-b- a-b'
+        words = set(['btn-primary', 'btn-primary-lg', 'x-btn', 'btn-x', 'btn--x', 'a-b', 'b-c', 'a-b-c', 'btn', 'a_b', 'btn_a-b', 'a-b-c-d'])
+        self.assertSameAsRegexSearch(words, content)
+        self.assertEqual(count_occuring_words(set(['a-b', 'b-c', 'btn-primary']), content), {'a-b': 3, 'b-c': 1, 'btn-primary': 1})
+
+    def testManyOtherWords(self):
+        # More words than the regex module caches patterns for.
+        words = set('w-%d' % i for i in range(1000)) | set(['w', 'w-1-2', '-x', 'x-', 'a.b', 'a.b.c', 'b.c'])
+        content = 'w-1 w-999x w-1-2 a.b.c -x x- w-5.'
+        self.assertSameAsRegexSearch(words, content)
+
+
+class BytesOccuringWordsTest(unittest.TestCase):
+
+    def testSameAsDecoded(self):
+        content = 'Lorem ipsum_dolor sit-amet, (adipiscing) \u00e9lit caf\u00e9 123 x1y2 -x.'
+        words = set(['Lorem', 'ipsum', 'ipsum_dolor', 'sit', 'amet', 'adipiscing', 'lit', 'caf\u00e9', '123', 'x1y2', 'sit-amet', '-x', 'x.'])
+        for encoding in ['utf-8', 'latin-1']:
+            data = content.encode(encoding)
+            self.assertEqual(get_occuring_words(words, data), get_occuring_words(words, content) - set(['caf\u00e9'] if encoding != 'utf-8' else []))
+            self.assertEqual(get_occuring_words(words, memoryview(data)), get_occuring_words(words, data))
+        content = 'nav nav-x btn-x btn-xy a.nav'
+        words = set(['nav', 'btn-x', 'btn', 'a'])
+        self.assertEqual(count_occuring_words(words, content.encode('utf-8')), count_occuring_words(words, content))
+
+    def testManyOtherWords(self):
+        words = set('w-%d' % i for i in range(1000)) | set(['w', 'w-1-2', '-x', 'a.b', 'caf\u00e9-x'])
+        content = 'w-1 w-999x w-1-2 a.b.c -x caf\u00e9-x w-5. w-5'
+        self.assertEqual(get_occuring_words(words, content.encode('utf-8')), get_occuring_words(words, content))
+        self.assertEqual(count_occuring_words(words, content.encode('utf-8')), count_occuring_words(words, content))
+
+    def testInvalidBytes(self):
+        self.assertEqual(get_occuring_words(set(['ad', 'x']), b'\xff\xfe"ad"\x00\x81x'), set(['ad']))
+
+    def testTokenChunks(self):
+        chunks = list(_iter_token_chunks(b'foo bar bazzz qux', chunk_size=5))
+        self.assertEqual(chunks, [[b'foo', b'bar'], [b'bazzz'], [b'qux']])
+        # Hyphenated runs are not split either.
+        chunks = list(_iter_token_chunks(b'a-b-c-d e-f g', chunk_size=3, token_regex=REGEX_HYPHENATED_BYTES, separator_regex=_REGEX_NON_HYPHENATED_BYTE))
+        self.assertEqual(chunks, [[b'a-b-c-d'], [b'e-f'], []])
+
+    def testSourceFile(self):
+        path = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(path, 'app.js')
+            with open(file_name, 'wb') as f:
+                f.write(b'render("ad premium");\r\n' * 1000)
+            for threshold, expected_type in [(None, bytes), (10, mmap.mmap), (10 ** 9, bytes)]:
+                with open_source_file(file_name, mmap_threshold=threshold) as content:
+                    self.assertIsInstance(content, expected_type)
+                    self.assertEqual(get_occuring_words(set(['ad', 'premium', 'x']), content), set(['ad', 'premium']))
+                    self.assertEqual(count_occuring_words(set(['ad']), content), {'ad': 1000})
+            self.assertEqual(read_source_file(file_name, mmap_threshold=10), None)
+            self.assertEqual(len(read_source_file(file_name)), 23000)
+        finally:
+            shutil.rmtree(path)
+
+
+class CountOccuringWordsTest(unittest.TestCase):
+
+    def testCounts(self):
+        content = 'nav navbar nav-x btn-x btn-xy btn-x a.nav'
+        result = count_occuring_words(set(['nav', 'btn-x', 'btn', 'foo', 'a']), content)
+        self.assertEqual(result, {'nav': 3, 'btn-x': 2, 'btn': 3, 'a': 1})
+
+    def testOverlappingCounts(self):
+        content = 'a-a-a a.b.a.b.'
+        words = set(['a-a', 'a-a-a', 'a.b.', 'b.a'])
+        expected = dict((w, len(re.findall(r'\b%s\b' % re.escape(w), content))) for w in words)
+        self.assertEqual(count_occuring_words(words, content), expected)
+
+
+class IgnoreRulesTest(unittest.TestCase):
+
+    def assertIgnored(self, patterns, path, is_folder=False, expected=True):
+        rules = IgnoreRules().add(patterns, 'root')
+        path = os.path.join('root', *path.split('/'))
+        self.assertEqual(rules.is_ignored(path, os.path.basename(path), is_folder), expected, (patterns, path))
+
+    def testPatterns(self):
+        self.assertIgnored(['*.min.css'], 'css/style.min.css')
+        self.assertIgnored(['*.min.css'], 'css/style.css', expected=False)
+        self.assertIgnored(['# comment', '', 'build'], 'a/build', is_folder=True)
+        self.assertIgnored(['build/'], 'a/build', is_folder=False, expected=False)
+        self.assertIgnored(['/build'], 'a/build', is_folder=True, expected=False)
+        self.assertIgnored(['/build'], 'build', is_folder=True)
+        self.assertIgnored(['doc/*.html'], 'doc/index.html')
+        self.assertIgnored(['doc/*.html'], 'doc/api/index.html', expected=False)
+        self.assertIgnored(['doc/**/*.html'], 'doc/api/index.html')
+        self.assertIgnored(['**/cache'], 'a/b/cache', is_folder=True)
+        self.assertIgnored(['page?.[ht]tml'], 'page1.html')
+        self.assertIgnored(['page[!0-9].html'], 'page1.html', expected=False)
+
+    def testNegation(self):
+        self.assertIgnored(['*.css', '!main.css'], 'main.css', expected=False)
+        self.assertIgnored(['*.css', '!main.css'], 'other.css')
+        self.assertIgnored(['!main.css', '*.css'], 'main.css')
+
+
+class DiscoverFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        files = {
+            'style.css': '', 'index.html': '', 'app.js': '', 'notes.txt': '',
+            '.gitignore': 'node_modules/\n*.min.css\n/build\n',
+            '.git/x.css': '', 'node_modules/lib/lib.css': '',
+            'build/out.html': '', 'src/build/widget.js': '',
+            'src/style.min.css': '', 'src/.gitignore': '*.js\n!keep.js\n',
+            'src/drop.js': '', 'src/keep.js': '',
+        }
+        for name, content in files.items():
+            file_name = os.path.join(self.path, *name.split('/'))
+            if not os.path.isdir(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            with open(file_name, 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def relative(self, files):
+        return set(os.path.relpath(f, self.path).replace(os.sep, '/') for f in files)
+
+    def testBuckets(self):
+        buckets = discover_files([self.path], {'css': ['.css'], 'html': ['.html'], 'src': ['.js', '.html'], 'all': None})
+        self.assertEqual(self.relative(buckets['css']), set(['style.css']))
+        self.assertEqual(self.relative(buckets['html']), set(['index.html']))
+        self.assertEqual(self.relative(buckets['src']), set(['app.js', 'index.html', 'src/keep.js']))
+        self.assertEqual(self.relative(buckets['all']), set(['style.css', 'index.html', 'app.js', 'notes.txt', '.gitignore', 'src/.gitignore', 'src/keep.js']))
+
+    def testExcludes(self):
+        files = collect_files([self.path], extensions=['.css', '.js'], excludes=['src/'], ignore_file_name=None)
+        self.assertEqual(self.relative(files), set(['style.css', 'app.js', '.git/x.css', 'node_modules/lib/lib.css']))
+
+    def testSeedFiles(self):
+        seed = os.path.join(self.path, 'node_modules', 'lib', 'lib.css')
+        self.assertEqual(collect_files([seed, os.path.join(self.path, 'missing')], extensions=['.css']), set([seed]))
@@ -0,0 +1,260 @@
+'''
+Tokenizers to extract candidate id/class names from source files.
+
+By default, source files are searched for ids and classes as plain words
+(see cssdeadwood.utils.get_occuring_words()), which finds common words
+like "active" or "hidden" in virtually any source file (in identifiers, comments, ...).
+A tokenizer instead lexes a source file once and only extracts tokens from the
+places where id/class names are expected (string literals, template attributes, ...),
+into a TokenIndex that can be queried for any number of ids and classes.
+
+Tokens starting or ending with a hyphen or underscore (e.g. from ``'btn-' + size``
+or ``f"col-{n}"``) are considered fragments of dynamically built names:
+they match all ids and classes with that prefix (or suffix).
+'''
+
+import os
+import re
+import itertools
+import collections
+
+
+# Tokens: runs of word characters, hyphens and non-ASCII bytes
+# (so that, with UTF-8, non-ASCII letters are part of tokens).
+_REGEX_TOKEN = re.compile(br'[-\w\x80-\xff]+')
+
+# Separators at which dynamically built names are typically split.
+_SEPARATORS = b'-_'
+
+# Python/Ruby style source: string literals, skipping comments.
+_REGEX_STRINGS = re.compile(br'''
+    \#[^\n]*
+    | """(.*?)"""
+    | \'\'\'(.*?)\'\'\'
+    | "((?:[^"\\\n]|\\.)*)"
+    | '((?:[^'\\\n]|\\.)*)'
+''', re.DOTALL | re.VERBOSE)
+
+# JavaScript/JSX/TypeScript source: string and template literals
+# (e.g. ``className="..."`` or ``classList.add('...')`` arguments)
+# and object literal keys (e.g. ``classNames({active: isActive})``), skipping comments.
+_REGEX_SCRIPT = re.compile(br'''
+    //[^\n]*
+    | /\*.*?\*/
+    | "((?:[^"\\\n]|\\.)*)"
+    | '((?:[^'\\\n]|\\.)*)'
+    | `((?:[^`\\]|\\.)*)`
+    | [{,]\s*([\w$]+)\s*:(?!:)
+''', re.DOTALL | re.VERBOSE)
+
+# HTML-ish templates (PHP, ERB, Jinja, Vue, ...): quoted strings
+# (attribute values and string literals in embedded code) and unquoted class/id attribute values.
+_REGEX_MARKUP = re.compile(br'''
+    "([^"]*)"
+    | '([^']*)'
+    | \b(?:class|id)\s*=\s*([^\s"'>]+)
+''', re.IGNORECASE | re.VERBOSE)
+
+
+def _lexer(regex):
+    '''
+    @return tokenizer function that extracts the tokens from the (last) captured group
+        of each match of given regex
+    '''
+
+    def tokenize(content):
+        tokens = collections.Counter()
+        for match in regex.finditer(content):
+            if match.lastindex:
+                tokens.update(_REGEX_TOKEN.findall(match.group(match.lastindex)))
+        return tokens
+
+    return tokenize
+
+
+# Registry of tokenizers: mapping of name to function that takes (undecoded) file contents
+# and returns a collections.Counter of (bytes) tokens.
+TOKENIZERS = {
+    'strings': _lexer(_REGEX_STRINGS),
+    'script': _lexer(_REGEX_SCRIPT),
+    'markup': _lexer(_REGEX_MARKUP),
+}
+
+# Pseudo tokenizer name to search for ids and classes as plain words.
+WORDS = 'words'
+
+# Default tokenizer per (lowercase) file extension.
+DEFAULT_TOKENIZERS = dict(
+    [(ext, 'script') for ext in ['.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx']]
+    + [(ext, 'strings') for ext in ['.py', '.rb']]
+    + [(ext, 'markup') for ext in [
+        '.php', '.phtml', '.erb', '.twig', '.jinja', '.jinja2', '.j2', '.hbs', '.handlebars', '.mustache',
+        '.vue', '.svelte', '.jsp', '.cshtml', '.tpl',
+    ]]
+)
+
+
+def register_tokenizer(name, tokenizer):
+    '''
+    Register a tokenizer under given name (e.g. to refer to it with the ``--tokenizers`` option).
+
+    @param tokenizer function that takes (undecoded) file contents
+        and returns a collections.Counter of (bytes) tokens
+    '''
+    TOKENIZERS[name] = tokenizer
+
+
+def parse_tokenizers(spec):
+    '''
+    Parse a tokenizer specification: 'auto' (for DEFAULT_TOKENIZERS)
+    and/or comma separated '<extension>=<tokenizer name>' items
+    (tokenizer name 'words' to search for plain words), e.g. 'auto,.inc=markup'.
+
+    @return mapping of (lowercase) file extension to tokenizer name
+    '''
+    tokenizers = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item == 'auto':
+            tokenizers.update(DEFAULT_TOKENIZERS)
+            continue
+        extension, sep, name = item.partition('=')
+        extension = extension.strip().lower()
+        name = name.strip()
+        if not sep or not extension.startswith('.') or (name not in TOKENIZERS and name != WORDS):
+            raise ValueError('Invalid tokenizer specification %r (tokenizers: %s)' % (item, ', '.join(sorted(TOKENIZERS))))
+        tokenizers[extension] = name
+    return dict((ext, name) for (ext, name) in tokenizers.items() if name != WORDS)
+
+
+def tokenizer_for(path, tokenizers):
+    '''
+    @param tokenizers mapping of file extension to tokenizer name (see parse_tokenizers())
+
+    @return name of the tokenizer to use for given file, or None to search for plain words
+    '''
+    if not tokenizers:
+        return None
+    return tokenizers.get(os.path.splitext(path)[1].lower())
+
+
+def tokenize(content, name):
+    '''
+    @param content (undecoded) file contents, as bytes-like object
+    @param name tokenizer name
+
+    @return collections.Counter of (bytes) tokens
+    '''
+    return TOKENIZERS[name](content)
+
+
+def _word_keys(encoded):
+    '''
+    @return list of the tokens that indicate an occurrence of given (encoded) word:
+        the word itself and its prefixes and suffixes at hyphens/underscores
+    '''
+    keys = [encoded]
+    for i in range(1, len(encoded) - 1):
+        if encoded[i] in _SEPARATORS:
+            keys.append(encoded[:i + 1])
+            keys.append(encoded[i:])
+    return keys
+
+
+class TokenIndex(object):
+    '''
+    Inverted index of the tokens of a set of files, mapping each token to the files containing it,
+    to look up in which files ids and classes occur (without searching the files again).
+    '''
+
+    def __init__(self):
+        # Mapping of file to Counter of its tokens.
+        self._files = {}
+        # Mapping of token to set of files.
+        self._postings = {}
+
+    def __contains__(self, path):
+        return path in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, path, tokens):
+        '''
+        Add (or replace) the tokens of a file.
+
+        @param tokens collections.Counter of (bytes) tokens (see tokenize())
+        '''
+        self.remove(path)
+        self._files[path] = tokens
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(path)
+
+    def remove(self, path):
+        for token in self._files.pop(path, ()):
+            files = self._postings[token]
+            files.discard(path)
+            if not files:
+                del self._postings[token]
+
+    def _keys(self, word):
+        '''
+        @return (list of indexed tokens, whether all of them have to occur)
+            that indicate an occurrence of given id/class name
+        '''
+        encoded = word.encode('utf-8')
+        if _REGEX_TOKEN.fullmatch(encoded):
+            return [k for k in _word_keys(encoded) if k in self._postings], False
+        # Other names (e.g. with escaped characters): all their tokens have to occur.
+        parts = _REGEX_TOKEN.findall(encoded)
+        if not parts or any(p not in self._postings for p in parts):
+            return [], False
+        return parts, True
+
+    def counts(self, word):
+        '''
+        @return mapping of file to number of occurrences of given id/class name
+        '''
+        keys, require_all = self._keys(word)
+        if not keys:
+            return {}
+        if require_all:
+            files = set.intersection(*(self._postings[k] for k in keys))
+            return dict((path, min(self._files[path][k] for k in keys)) for path in files)
+        files = set().union(*(self._postings[k] for k in keys))
+        return dict((path, sum(self._files[path].get(k, 0) for k in keys)) for path in files)
+
+    def files(self, word):
+        '''@return set of files in which given id/class name occurs'''
+        return set(self.counts(word))
+
+    def find(self, words, files=None):
+        '''
+        Look up in which files given ids and classes occur, assigning each found word
+        to the first (sorted) file it occurs in.
+
+        @param files optional set of files to limit to
+
+        @return mapping of file to set of found words
+        '''
+        if files is not None:
+            files = sorted(f for f in set(files) if f in self._files)
+        found = {}
+        for word in words:
+            keys, require_all = self._keys(word)
+            if not keys:
+                continue
+            postings = [self._postings[k] for k in keys]
+            if files is not None and len(files) < sum(len(p) for p in postings):
+                # Few files to limit to: check their tokens directly (in sorted order).
+                check = all if require_all else any
+                candidates = list(itertools.islice((f for f in files if check(k in self._files[f] for k in keys)), 1))
+            else:
+                candidates = set.intersection(*postings) if require_all else set().union(*postings)
+                if files is not None:
+                    candidates.intersection_update(files)
+            if candidates:
+                found.setdefault(min(candidates), set()).add(word)
+        return found
@@ -1,33 +1,209 @@
 
 import os
 import re
+import mmap
+import functools
+import contextlib
+import collections
 
 
-def collect_files(seeds, extensions=None):
+# Folders that are never scanned (version control metadata).
+DEFAULT_EXCLUDES = ['.git/', '.hg/', '.svn/']
+
+# Name of the files with exclude patterns to take into account while scanning folders.
+IGNORE_FILE_NAME = '.gitignore'
+
+
+def _glob_to_regex(pattern):
     '''
-    Collect files from given seeds: files or folders to scan through recursively.
+    Translate a gitignore-style glob pattern to a regex (string):
+    "*" and "?" do not match "/", "**" matches across folders.
+    '''
+    regex = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            if pattern[i:i + 1] == '*':
+                i += 1
+                if pattern[i:i + 1] == '/':
+                    i += 1
+                    regex.append('(?:.*/)?')
+                else:
+                    regex.append('.*')
+            else:
+                regex.append('[^/]*')
+        elif c == '?':
+            regex.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 1 if pattern[i:i + 1] in ('!', ']') else i)
+            if end < 0:
+                regex.append(re.escape(c))
+            else:
+                chars = pattern[i:end].replace('\\', '\\\\')
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                regex.append('[%s]' % chars)
+                i = end + 1
+        elif c == '\\' and i < n:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+        else:
+            regex.append(re.escape(c))
+    return ''.join(regex)
+
+
+class IgnoreRules(object):
+    '''
+    Gitignore-style exclude patterns: "*", "?", "[...]" and "**" wildcards,
+    "!" to negate (re-include), a trailing "/" to only match folders
+    and a leading or inner "/" to anchor the pattern to the folder it is defined for.
+    The last matching pattern wins.
+
+    Immutable: adding patterns (e.g. of a nested .gitignore file) returns a new instance.
+    '''
+
+    def __init__(self, rules=()):
+        # List of (compiled regex, negated, only folders, anchored, base folder) tuples.
+        self.rules = tuple(rules)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def add(self, patterns, base):
+        '''
+        @param patterns list of patterns (e.g. lines of a .gitignore file)
+        @param base folder the patterns are defined for
+
+        @return new IgnoreRules instance with the extra patterns
+        '''
+        rules = list(self.rules)
+        for pattern in patterns:
+            pattern = pattern.rstrip('\n\r')
+            if not pattern.endswith('\\ '):
+                pattern = pattern.rstrip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negated = pattern.startswith('!')
+            if negated:
+                pattern = pattern[1:]
+            only_folders = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            anchored = '/' in pattern
+            pattern = pattern.lstrip('/')
+            if not pattern:
+                continue
+            rules.append((re.compile(_glob_to_regex(pattern) + r'\Z', flags=re.DOTALL), negated, only_folders, anchored, base))
+        return IgnoreRules(rules)
+
+    def add_file(self, ignore_file, base):
+        '''
+        @return new IgnoreRules instance with the patterns of given ignore file
+        '''
+        try:
+            with open(ignore_file, errors='replace') as f:
+                return self.add(f.readlines(), base)
+        except OSError:
+            return self
+
+    def is_ignored(self, path, name, is_folder):
+        '''
+        @param path path (starting with the base folders of the rules)
+        @param name base name of the path
+        @param is_folder whether the path is a folder
+        '''
+        ignored = False
+        for regex, negated, only_folders, anchored, base in self.rules:
+            if negated != ignored or (only_folders and not is_folder):
+                continue
+            if anchored:
+                target = path[len(base):].lstrip(os.sep)
+                if os.sep != '/':
+                    target = target.replace(os.sep, '/')
+            else:
+                target = name
+            if regex.match(target):
+                ignored = not negated
+        return ignored
+
+
+def discover_files(seeds, buckets, excludes=DEFAULT_EXCLUDES, ignore_file_name=IGNORE_FILE_NAME):
+    '''
+    Collect files from given seeds (files or folders to scan through recursively)
+    in a single pass, classifying them in buckets based on their extension.
+
+    Folders are scanned with os.scandir. Excluded folders are pruned, so their
+    contents are not scanned at all. Seed files are always included.
 
     @param seeds list of root folders or files
-    @param extensions optional list of file extensions (lowercase) to filter files
+    @param buckets mapping of bucket name to list of file extensions (lowercase),
+        or None to accept every file
+    @param excludes list of gitignore-style patterns (see IgnoreRules) of files
+        and folders to exclude, relative to each seed folder
+    @param ignore_file_name name of the files with extra exclude patterns
+        (for the folder they are in and its subfolders), e.g. '.gitignore',
+        or None to not use ignore files
+
+    @return mapping of bucket name to set of file paths
     '''
-    files = set()
+    result = dict((bucket, set()) for bucket in buckets)
+    # Mapping of extension to buckets, and buckets accepting any extension.
+    extension_buckets = collections.defaultdict(list)
+    any_extension = []
+    for bucket, extensions in buckets.items():
+        if extensions is None:
+            any_extension.append(result[bucket])
+        else:
+            for extension in extensions:
+                extension_buckets[extension].append(result[bucket])
 
-    # Local function to check extensions (or accept everything)
-    if extensions is not None:
-        check_extension = lambda path: os.path.splitext(path)[1].lower() in extensions
-    else:
-        check_extension = lambda path: True
+    def add(path):
+        for files in extension_buckets.get(os.path.splitext(path)[1].lower(), ()):
+            files.add(path)
+        for files in any_extension:
+            files.add(path)
 
     for seed in seeds:
-        if os.path.isfile(seed) and check_extension(seed):
-            files.add(seed)
-        elif os.path.isdir(seed):
-            for (dirpath, dirnames, filenames) in os.walk(seed):
-                for filename in filenames:
-                    path = os.path.join(dirpath, filename)
-                    if check_extension(path):
-                        files.add(path)
-    return files
+        if os.path.isfile(seed):
+            add(seed)
+            continue
+        elif not os.path.isdir(seed):
+            continue
+        folders = [(seed, IgnoreRules().add(excludes or [], seed))]
+        while folders:
+            folder, rules = folders.pop()
+            if ignore_file_name and os.path.isfile(os.path.join(folder, ignore_file_name)):
+                rules = rules.add_file(os.path.join(folder, ignore_file_name), folder)
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    is_folder = entry.is_dir(follow_symlinks=False)
+                    is_file = not is_folder and entry.is_file()
+                except OSError:
+                    continue
+                if (is_folder or is_file) and rules and rules.is_ignored(entry.path, entry.name, is_folder):
+                    continue
+                if is_folder:
+                    folders.append((entry.path, rules))
+                elif is_file:
+                    add(entry.path)
+    return result
+
+
+def collect_files(seeds, extensions=None, excludes=DEFAULT_EXCLUDES, ignore_file_name=IGNORE_FILE_NAME):
+    '''
+    Collect files from given seeds: files or folders to scan through recursively.
+
+    @param seeds list of root folders or files
+    @param extensions optional list of file extensions (lowercase) to filter files
+    @param excludes, ignore_file_name: see discover_files()
+    '''
+    return discover_files(seeds, {'files': extensions}, excludes=excludes, ignore_file_name=ignore_file_name)['files']
 
 
 
@@ -37,16 +213,330 @@ def file_get_contents(file_name):
     return contents
 
 
+# Source files of at least this size (in bytes) are memory-mapped instead of read into memory.
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+
+def read_source_file(file_name, mmap_threshold=None):
+    '''
+    Read a source file as bytes (without decoding).
+
+    @param mmap_threshold optional file size (in bytes) from which
+        files should be memory-mapped instead (see open_source_file())
+
+    @return file contents as bytes, or None if the file should be memory-mapped
+    '''
+    with open(file_name, 'rb') as f:
+        if mmap_threshold is not None and os.fstat(f.fileno()).st_size >= mmap_threshold:
+            return None
+        return f.read()
+
+
+@contextlib.contextmanager
+def open_source_file(file_name, mmap_threshold=MMAP_THRESHOLD):
+    '''
+    Context manager providing the contents of a source file as a bytes-like object
+    (without decoding): as bytes, or as read-only memory map for files
+    of at least mmap_threshold bytes (None: never memory-map).
+    '''
+    with open(file_name, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if mmap_threshold is None or size == 0 or size < mmap_threshold:
+            yield f.read()
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                yield contents
+
+
+
+
+
+# Precompiled regex to split content into "words", consistent with the
+# semantics of the regex word boundary assertion ``\b``.
+REGEX_WORD = re.compile(r'\w+')
+
+# Byte level variants, for scanning undecoded (binary) content: words consist of
+# ASCII word characters and non-ASCII bytes, so that with UTF-8 (or another
+# ASCII compatible encoding) non-ASCII letters are part of words, like with REGEX_WORD.
+REGEX_WORD_BYTES = re.compile(br'[\w\x80-\xff]+')
+_REGEX_NON_WORD_BYTE = re.compile(br'[^\w\x80-\xff]')
 
+# Runs of words joined by hyphens (e.g. "btn-primary"), the typical hyphenated CSS id/class case.
+REGEX_HYPHENATED = re.compile(r'\w+(?:-+\w+)+')
+REGEX_HYPHENATED_BYTES = re.compile(br'[\w\x80-\xff]+(?:-+[\w\x80-\xff]+)+')
+_REGEX_NON_HYPHENATED_BYTE = re.compile(br'[^-\w\x80-\xff]')
+_REGEX_HYPHENS = re.compile(r'(-+)')
+_REGEX_HYPHENS_BYTES = re.compile(br'(-+)')
+
+# Size (in bytes) of the chunks to tokenize binary content in.
+TOKENIZE_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def _iter_token_chunks(content, chunk_size=TOKENIZE_CHUNK_SIZE, token_regex=REGEX_WORD_BYTES, separator_regex=_REGEX_NON_WORD_BYTE):
+    '''
+    Tokenize binary content (e.g. a memory map) into words, per chunk
+    (without splitting words), to avoid holding the tokens of the whole content in memory.
+
+    @param token_regex regex of the tokens
+    @param separator_regex regex of a byte that can not be part of a token
+
+    @return generator of token lists
+    '''
+    pos = 0
+    size = len(content)
+    while pos < size:
+        end = pos + chunk_size
+        if end < size:
+            match = separator_regex.search(content, end)
+            end = match.start() if match else size
+        else:
+            end = size
+        yield token_regex.findall(content, pos, end)
+        pos = end
+
+
+def _iter_tokens(content, binary, hyphenated=False):
+    '''
+    @return iterable of token lists: of plain words, or of hyphenated word runs
+        (for binary content per chunk, see _iter_token_chunks())
+    '''
+    if not binary:
+        return [(REGEX_HYPHENATED if hyphenated else REGEX_WORD).findall(content)]
+    if hyphenated:
+        return _iter_token_chunks(content, token_regex=REGEX_HYPHENATED_BYTES, separator_regex=_REGEX_NON_HYPHENATED_BYTE)
+    return _iter_token_chunks(content)
+
+
+class _HyphenatedWords(object):
+    '''
+    Lookup of hyphenated words (e.g. "btn-primary"), with the semantics of
+    a regex search for r'\b<word>\b'. Such a word occurs if it is a sequence of whole parts
+    of a maximal hyphenated run in the content (e.g. "btn-primary" in "x-btn-primary-lg"),
+    so the runs are extracted in one pass and only their sub-runs are looked up,
+    regardless of the number of words.
+    '''
+
+    def __init__(self, words, binary=False):
+        '''
+        @param words mapping of (encoded, if binary) word to word
+        '''
+        self.words = words
+        self._split = (_REGEX_HYPHENS_BYTES if binary else _REGEX_HYPHENS).split
+        # Maximum number of parts of a word.
+        self.max_parts = max(len(self._split(w)) // 2 + 1 for w in words)
+
+    def occurrences(self, run):
+        '''
+        @return generator of (word, index of first part, index of last part) tuples
+            of the words occurring in given hyphenated run
+        '''
+        parts = self._split(run)
+        size = len(parts) // 2 + 1
+        for i in range(size - 1):
+            text = parts[2 * i]
+            for j in range(i + 1, min(size, i + self.max_parts)):
+                text += parts[2 * j - 1] + parts[2 * j]
+                word = self.words.get(text)
+                if word is not None:
+                    yield word, i, j
+
+    def find(self, runs):
+        '''@return set of the words occurring in given runs'''
+        return set(word for run in runs for (word, i, j) in self.occurrences(run))
+
+    def count(self, run_counts):
+        '''
+        @param run_counts mapping of run to its number of occurrences
+
+        @return Counter of the (non-overlapping) occurrences of the words
+        '''
+        counts = collections.Counter()
+        for run, run_count in run_counts.items():
+            # Last part of the last counted occurrence per word.
+            ends = {}
+            for word, i, j in self.occurrences(run):
+                if i > ends.get(word, -1):
+                    counts[word] += run_count
+                    ends[word] = j
+        return counts
+
+
+class _WordAlternation(object):
+    '''
+    Combined matcher for other words than those handled by plain or hyphenated
+    word tokens (e.g. "-x" or "a.b"), with the semantics of a regex search for r'\b<word>\b',
+    but finding (or counting) all words in a single scan of the content.
+
+    The words are compiled to one alternation, with shared prefixes factored out
+    (so that matching at a position does not depend on the number of words),
+    wrapped in a lookahead so that occurrences of different words can overlap.
+    As only one alternative can match at a given position, words that are a prefix of
+    another word are put in a separate pattern (grouped by their number of prefixes in the set).
+    '''
+
+    def __init__(self, words, binary=False):
+        '''
+        @param words iterable of words (strings)
+        @param binary whether to match undecoded (bytes-like) content (with the words encoded as UTF-8)
+        '''
+        if binary:
+            # Build the pattern as latin-1 string (one character per byte), to encode at the end.
+            self._word_char = r'[\w\x80-\xff]'
+            texts = dict((w.encode('utf-8').decode('latin-1'), w) for w in words)
+        else:
+            self._word_char = r'\w'
+            texts = dict((w, w) for w in words)
+        self._is_word_char = re.compile(self._word_char).match
+        # Mapping of matched text (string or bytes) to word.
+        self.words = dict(((t.encode('latin-1') if binary else t), w) for (t, w) in texts.items())
+        depths = collections.defaultdict(list)
+        for text in texts:
+            depths[sum(1 for i in range(1, len(text)) if text[:i] in texts)].append(text)
+        self.patterns = []
+        for depth in sorted(depths):
+            pattern = '(?=(%s))' % self._trie_pattern(self._trie(depths[depth]))
+            self.patterns.append(re.compile(pattern.encode('latin-1') if binary else pattern))
+
+    @staticmethod
+    def _trie(texts):
+        trie = {}
+        for text in texts:
+            node = trie
+            for char in text:
+                node = node.setdefault(char, {})
+            # End marker.
+            node[''] = {}
+        return trie
+
+    def _trie_pattern(self, node, last=None):
+        branches = []
+        for char in sorted(node):
+            if char:
+                branch = re.escape(char) + self._trie_pattern(node[char], char)
+                if last is None:
+                    # Word boundary before the first character.
+                    branch = ('(?<!%s)' if self._is_word_char(char) else '(?<=%s)') % self._word_char + branch
+                branches.append(branch)
+            else:
+                # Word boundary after the last character.
+                branches.append(('(?!%s)' if self._is_word_char(last) else '(?=%s)') % self._word_char)
+        return branches[0] if len(branches) == 1 else '(?:%s)' % '|'.join(branches)
+
+    def find(self, content):
+        '''@return set of the words that occur in content'''
+        found = set()
+        for pattern in self.patterns:
+            remaining = len(self.words) - len(found)
+            for match in pattern.finditer(content):
+                word = self.words[match.group(1)]
+                if word not in found:
+                    found.add(word)
+                    remaining -= 1
+                    if not remaining:
+                        return found
+        return found
+
+    def count(self, content):
+        '''
+        @return dictionary mapping the occurring words to their number of (non-overlapping) occurrences
+        '''
+        counts = collections.Counter()
+        for pattern in self.patterns:
+            # End of the last counted occurrence per word.
+            ends = {}
+            for match in pattern.finditer(content):
+                start, end = match.span(1)
+                word = self.words[match.group(1)]
+                if start >= ends.get(word, 0):
+                    counts[word] += 1
+                    ends[word] = end
+        return dict(counts)
+
+
+@functools.lru_cache(maxsize=32)
+def _word_matchers(words, binary=False):
+    '''
+    Split words in plain words (word characters only), hyphenated words and other words,
+    with the matchers of the latter two. Cached, so that scanning many files
+    for the same words builds (and compiles) the matchers only once.
+
+    @param words frozenset of words
+
+    @return (mapping of (encoded) plain word to word, _HyphenatedWords or None, _WordAlternation or None)
+    '''
+    word_regex, hyphenated_regex = (REGEX_WORD_BYTES, REGEX_HYPHENATED_BYTES) if binary else (REGEX_WORD, REGEX_HYPHENATED)
+    simple = {}
+    hyphenated = {}
+    other = []
+    for word in words:
+        key = word.encode('utf-8') if binary else word
+        if word_regex.fullmatch(key):
+            simple[key] = word
+        elif hyphenated_regex.fullmatch(key):
+            hyphenated[key] = word
+        else:
+            other.append(word)
+    return (
+        simple,
+        _HyphenatedWords(hyphenated, binary) if hyphenated else None,
+        _WordAlternation(other, binary) if other else None,
+    )
 
 
 def get_occuring_words(words, content):
     '''
     Return the subset of given words that occur in content.
+
+    A word occurs in content if it appears delimited by regex word
+    boundaries. For words consisting of word characters only
+    (the typical CSS id/class case) this is the same as being a maximal run
+    of word characters, so the content is tokenized just once and all words
+    are looked up in one pass, regardless of the number of words.
+    Likewise for hyphenated words (see _HyphenatedWords).
+    Other words are searched for with one combined pattern (see _WordAlternation).
+
+    Content can also be given undecoded, as bytes-like object (e.g. bytes or a memory map).
+    It is then scanned at byte level (in chunks), with the words encoded as UTF-8.
+
+    @param words set of words (strings)
+    @param content string or bytes-like object
     '''
+    binary = not isinstance(content, str)
+    simple, hyphenated, other = _word_matchers(frozenset(words), binary)
     found = set()
-    for word in words:
-        if re.search(r'\b%s\b' % word, content):
-            found.add(word)
+    if simple:
+        remaining = dict(simple)
+        for tokens in _iter_tokens(content, binary):
+            for token in remaining.keys() & set(tokens):
+                found.add(remaining.pop(token))
+            if not remaining:
+                break
+    if hyphenated:
+        for runs in _iter_tokens(content, binary, hyphenated=True):
+            found.update(hyphenated.find(set(runs)))
+    if other:
+        found.update(other.find(content))
     return found
 
+
+def count_occuring_words(words, content):
+    '''
+    Count the occurrences in content of each of the given words
+    (with the same semantics as get_occuring_words()).
+
+    @return dictionary mapping the occurring words to their number of occurrences
+    '''
+    binary = not isinstance(content, str)
+    simple, hyphenated, other = _word_matchers(frozenset(words), binary)
+    counts = collections.Counter()
+    if simple:
+        token_counts = collections.Counter()
+        for tokens in _iter_tokens(content, binary):
+            token_counts.update(filter(simple.__contains__, tokens))
+        counts.update(dict((simple[token], count) for (token, count) in token_counts.items()))
+    if hyphenated:
+        for runs in _iter_tokens(content, binary, hyphenated=True):
+            counts.update(hyphenated.count(collections.Counter(runs)))
+    if other:
+        counts.update(other.count(content))
+    return dict(counts)